@@ -1,35 +1,56 @@
 import streamlit as st
+import numpy as np
+import pandas as pd
 from fpdf import FPDF
+from fpdf.line_break import BREAKING_SPACE_SYMBOLS_STR, FORM_FEED, NBSP, SOFT_HYPHEN
+from fpdf.output import OutputProducer, PDFPage
+from fpdf.syntax import PDFContentStream
+from fpdf.util import FloatTolerance
+from PIL import Image
 from io import BytesIO
 from datetime import datetime
 from pathlib import Path
 import base64
+import copy
 import sqlite3
 import hashlib
 import os
 import json
+import functools
+import logging
+import time
+import tempfile
+import zlib
 from datetime import timedelta
+from datetime import date
 import locale
+import re
+import queue
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+import contextlib
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import Any, BinaryIO, Callable, Mapping, NamedTuple
+
+# --- Locale française pour les noms de jours et de mois ---
+def _setup_french_locale() -> None:
+    for name in ('fr_FR.UTF-8', 'fr_FR', 'French_France.1252'):
+        try:
+            locale.setlocale(locale.LC_TIME, name)
+            return
+        except locale.Error:
+            continue  # Essayer la suivante, sinon garder la locale par défaut
 
 # --- Fonction pour formater la date en français ---
 def format_timestamp_french(timestamp_str: str) -> str:
     """
     Convertit un timestamp au format 'YYYY-MM-DD HH:MM:SS' 
     en format français 'Vendredi 2 novembre 16h57'
+    (la locale française est définie une fois au démarrage, cf. bootstrap)
     """
     try:
-        # Définir la locale en français si disponible
-        try:
-            locale.setlocale(locale.LC_TIME, 'fr_FR.UTF-8')
-        except:
-            try:
-                locale.setlocale(locale.LC_TIME, 'fr_FR')
-            except:
-                try:
-                    locale.setlocale(locale.LC_TIME, 'French_France.1252')
-                except:
-                    pass  # Continuer avec la locale par défaut
-        
         # Parser le timestamp
         dt = datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
         
@@ -51,6 +72,243 @@ def format_timestamp_french(timestamp_str: str) -> str:
         # En cas d'erreur, retourner le timestamp original
         return timestamp_str
 
+# --- Images des PDF: résolues, réduites et compressées une fois par processus ---
+PDF_IMAGE_DPI = 300
+PDF_IMAGE_RESIZE_ABOVE = 1.5  # une réduction légère floute les aplats sans rien gagner
+PDF_IMAGE_COLORS = 256
+# Rôle -> (fichiers candidats, par ordre de préférence; largeur affichée en mm dans CustomPDF)
+PDF_IMAGES = {
+    "logo": (("logo_geneve2.png",), 15),
+    "garcon": (("eleve_garcon.png",), 20),
+    "fille": (("eleve_fille.png",), 20),
+    "niveau_0": (("emoji_graine.png", "graine.png", "seed.png"), 10),
+    "niveau_1": (("emoji_pousse.png", "pousse.png", "sprout.png"), 10),
+    "niveau_2": (("emoji_fleur.png", "fleur.png", "flower.png"), 10),
+}
+
+class PdfImageAssets:
+    """Images de CustomPDF prêtes à l'emploi, partagées par tous les documents du processus.
+
+    Chaque image est cherchée une seule fois sur disque, réduite à PDF_IMAGE_DPI
+    pour sa largeur affichée si elle est nettement plus grande, privée d'un canal
+    alpha entièrement opaque et de son profil ICC (celui du logo est un profil
+    CMJN que fpdf écartait déjà), passée en couleurs indexées si elle compte au
+    plus PDF_IMAGE_COLORS couleurs (sans perte), puis réencodée en PNG. Chaque
+    document la reçoit par pdf.image(BytesIO), que fpdf n'analyse qu'une fois
+    par document.
+    """
+
+    def __init__(self, images_dir: Path, dpi: int = PDF_IMAGE_DPI):
+        self._sources: dict[str, bytes | Path | None] = {}
+        prepared: dict[Path, bytes] = {}
+        for role, (candidates, width_mm) in PDF_IMAGES.items():
+            path = next((images_dir / name for name in candidates if (images_dir / name).exists()), None)
+            if path is not None and path not in prepared:
+                try:
+                    prepared[path] = self._prepare(path, round(width_mm / 25.4 * dpi))
+                except Exception:
+                    # Image illisible: fpdf la relira (et échouera) au moment de l'afficher
+                    logger.exception("Préparation de l'image %s", path)
+            self._sources[role] = prepared.get(path, path)
+
+    @staticmethod
+    def _prepare(path: Path, max_width: int) -> bytes:
+        with Image.open(path) as img:
+            img.load()
+        if img.width > PDF_IMAGE_RESIZE_ABOVE * max_width:
+            img = img.resize((max_width, round(img.height * max_width / img.width)), Image.LANCZOS)
+        if img.mode in ("RGBA", "LA") and img.getextrema()[-1][0] == 255:
+            img = img.convert(img.mode[:-1])
+        if img.mode == "RGB" and img.getcolors(PDF_IMAGE_COLORS) is not None:
+            # Aplats: palette des couleurs exactes de l'image (quantize approcherait les teintes)
+            rgb = np.asarray(img, dtype=np.uint32).reshape(-1, 3)
+            packed = (rgb[:, 0] << 16) | (rgb[:, 1] << 8) | rgb[:, 2]
+            colors, index = np.unique(packed, return_inverse=True)
+            indexed = Image.frombytes("P", img.size, index.astype(np.uint8).tobytes())
+            indexed.putpalette(np.stack([colors >> 16, (colors >> 8) & 255, colors & 255], axis=1).astype(np.uint8).tobytes())
+            img = indexed
+        img.info.pop("icc_profile", None)
+        out = BytesIO()
+        img.save(out, format="PNG", optimize=True)
+        return out.getvalue()
+
+    def source(self, role: str) -> BytesIO | str | None:
+        """Argument de pdf.image() pour role, ou None si aucune image n'a été trouvée."""
+        data = self._sources.get(role)
+        if isinstance(data, bytes):
+            return BytesIO(data)
+        return str(data) if data is not None else None
+
+@st.cache_resource
+def get_pdf_image_assets() -> PdfImageAssets:
+    return PdfImageAssets(Path(__file__).parent / "images")
+
+# --- Mesure du texte des PDF: coupure des lignes identique à multi_cell, sans passer par fpdf ---
+# Caractères dont multi_cell a un traitement propre (espaces spéciaux, césure, saut de page):
+# un texte qui en contient est confié à fpdf lui-même
+_FPDF_SPECIAL_BREAKS = re.compile(
+    "[" + re.escape(BREAKING_SPACE_SYMBOLS_STR.replace(" ", "") + NBSP + SOFT_HYPHEN + FORM_FEED) + "]"
+)
+_WRAP_TOKENS = re.compile(r" |[^ ]+")
+
+class _TooNarrow(Exception):
+    """Un seul caractère ne tient pas dans la largeur: fpdf lève sa propre erreur."""
+
+class FontMetrics:
+    """Largeurs d'une police en unités de glyphe (1/1000 em); chaque mot n'est mesuré qu'une fois."""
+
+    def __init__(self, font, by_code: bool, max_words: int = 50_000):
+        self._cw = font.cw
+        self._by_code = by_code  # TTF: largeurs indexées par code, police de base: par caractère
+        self._words: dict[str, tuple[int, int]] = {}
+        self.max_words = max_words
+
+    def char(self, ch: str) -> int:
+        return self._cw[ord(ch)] if self._by_code else self._cw[ch]
+
+    def word(self, word: str) -> tuple[int, int]:
+        """(largeur du mot, largeur de son dernier caractère)."""
+        units = self._words.get(word)
+        if units is None:
+            if len(self._words) >= self.max_words:
+                self._words.clear()
+            units = self._words[word] = (sum(self.char(ch) for ch in word), self.char(word[-1]))
+        return units
+
+    def line_count(self, text: str, max_width: float, font_size_pt: float, k: float) -> int:
+        """Lignes produites par MultiLineBreak (coupure aux espaces, sinon dans le mot), en un passage."""
+        def overflows(line: int, extra: int) -> bool:
+            # Même arithmétique que fpdf: largeur de la ligne + largeur du caractère suivant
+            return FloatTolerance.greater_than(
+                line * font_size_pt * 0.001 / k + extra * font_size_pt * 0.001 / k, max_width
+            )
+
+        space = self.char(" ")
+        paragraphs = text.split("\n")
+        lines = 0
+        for p, paragraph in enumerate(paragraphs):
+            line, empty, has_space = 0, True, False
+            for token in _WRAP_TOKENS.findall(paragraph):
+                if token == " ":
+                    if overflows(line, space):
+                        # L'espace qui déborde est supprimé et termine la ligne
+                        lines += 1
+                        line, empty, has_space = 0, True, False
+                    else:
+                        line, empty, has_space = line + space, False, True
+                    continue
+                width, last = self.word(token)
+                if not overflows(line + width - last, last):
+                    line, empty = line + width, False
+                    continue
+                if has_space:
+                    # Coupure au dernier espace: le mot passe entier à la ligne suivante
+                    lines += 1
+                    line, empty, has_space = 0, True, False
+                    if not overflows(width - last, last):
+                        line, empty = width, False
+                        continue
+                # Mot plus large que la ligne: coupé au caractère qui déborde
+                for ch in token:
+                    units = self.char(ch)
+                    if overflows(line, units):
+                        if empty or overflows(0, units):
+                            raise _TooNarrow(ch)
+                        lines += 1
+                        line, empty = 0, True
+                    line, empty = line + units, False
+            # Un saut de ligne termine toujours une ligne; la dernière n'est comptée que si elle a une largeur
+            if p < len(paragraphs) - 1 or line:
+                lines += 1
+        return lines
+
+class TextMeasure:
+    """Nombre de lignes de multi_cell pour la police courante d'un document, mémorisé par texte.
+
+    Les largeurs et les mots sont mis en cache par police (fichier TTF ou police
+    de base), pour tout le processus. Le résultat est celui de multi_cell:
+    marges de cellule, coupure au dernier espace, mots trop longs coupés au
+    caractère, espace qui déborde supprimé. Les cas que ce calcul ne couvre pas
+    (mise en forme du texte, polices de repli, espacement des caractères,
+    espaces spéciaux ou césures) sont mesurés par fpdf lui-même. Le calcul suit
+    MultiLineBreak de la version de fpdf2 épinglée dans requirements.txt;
+    tests/test_text_measure.py vérifie l'accord avec multi_cell.
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._fonts: dict[tuple, FontMetrics] = {}
+        self._lines: OrderedDict[tuple, int] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.delegated = 0
+
+    def _metrics(self, font) -> tuple[tuple, FontMetrics]:
+        by_code = hasattr(font, "ttffile")
+        font_id = (str(font.ttffile), font.fontkey) if by_code else ("core", font.fontkey)
+        with self._lock:
+            metrics = self._fonts.get(font_id)
+            if metrics is None:
+                metrics = self._fonts[font_id] = FontMetrics(font, by_code)
+        return font_id, metrics
+
+    def line_count(self, pdf: FPDF, text: str, width: float) -> int:
+        """Lignes que pdf.multi_cell(width, h, text) produirait (au moins une)."""
+        font = pdf.current_font
+        text = pdf.normalize_text(text).replace("\r", "")
+        if (
+            pdf.text_shaping or pdf.char_spacing or pdf.font_stretching != 100 or pdf._fallback_font_ids
+            or getattr(font, "is_symbol", False) or _FPDF_SPECIAL_BREAKS.search(text)
+        ):
+            return self._fpdf_line_count(pdf, text, width)
+        if width == 0:
+            width = pdf.w - pdf.r_margin - pdf.x
+        max_width = width - pdf.c_margin - pdf.c_margin
+        font_id, metrics = self._metrics(font)
+        key = (font_id, pdf.font_size_pt, pdf.k, max_width, text)
+        with self._lock:
+            lines = self._lines.get(key)
+            if lines is not None:
+                self._lines.move_to_end(key)
+                self.hits += 1
+                return lines
+        try:
+            lines = max(1, metrics.line_count(text, max_width, pdf.font_size_pt, pdf.k))
+        except _TooNarrow:
+            return self._fpdf_line_count(pdf, text, width)
+        with self._lock:
+            self.misses += 1
+            self._lines[key] = lines
+            while len(self._lines) > self.max_entries:
+                self._lines.popitem(last=False)
+        return lines
+
+    def _fpdf_line_count(self, pdf: FPDF, text: str, width: float) -> int:
+        with self._lock:
+            self.delegated += 1
+        return max(1, len(pdf.multi_cell(width, text=text, dry_run=True, output="LINES")))
+
+@st.cache_resource
+def get_text_measure() -> TextMeasure:
+    return TextMeasure()
+
+# Polices Unicode des PDF, par ordre de préférence: Arial sous Windows, DejaVu sous Linux.
+# Helvetica, la police de repli, ne connaît que le latin-1 ("–", "•", "→" y échouent).
+PDF_UNICODE_FONTS = (
+    ("C:\\Windows\\Fonts\\arial.ttf", "C:\\Windows\\Fonts\\arialbd.ttf"),
+    ("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"),
+)
+
+def add_unicode_font(pdf: FPDF) -> str:
+    """Déclare la première police Unicode installée (normal et gras) et retourne le nom à passer à set_font."""
+    for regular, bold in PDF_UNICODE_FONTS:
+        if os.path.exists(regular) and os.path.exists(bold):
+            pdf.add_font("ArialUnicode", "", regular)
+            pdf.add_font("ArialUnicode", "B", bold)
+            return "ArialUnicode"
+    return "Helvetica"
+
 # --- PDF amélioré avec en-tête/pied-de-page et éléments graphiques ---
 class CustomPDF(FPDF):
     def __init__(self, teacher_name: str = "", *args, **kwargs):
@@ -58,12 +316,8 @@ class CustomPDF(FPDF):
         self.maitre = teacher_name
         self.first_page = True
         self.images_dir = Path(__file__).parent / "images"
-        # Try to resolve emoji images for Likert scale
-        self.emoji_paths = {
-            0: self._first_existing(["emoji_graine.png", "graine.png", "seed.png"]),
-            1: self._first_existing(["emoji_pousse.png", "pousse.png", "sprout.png"]),
-            2: self._first_existing(["emoji_fleur.png", "fleur.png", "flower.png"]),
-        }
+        # Images résolues et préparées une fois par processus
+        self.assets = get_pdf_image_assets()
 
     def rounded_rect(self, x, y, w, h, r=5, style='DF'):
         k = self.k
@@ -135,13 +389,6 @@ class CustomPDF(FPDF):
         self._Arc(x, y + r - my_arc * r, x + r - my_arc * r, y, x + r, y)
         self._out(op)
 
-    def _first_existing(self, candidates):
-        for name in candidates:
-            p = self.images_dir / name
-            if p.exists():
-                return p
-        return None
-
     def draw_likert_scale(self, selected_index: int, x: float, y: float, box_w: float = 14, box_h: float = 12, gap: float = 6):
         # Draw three boxes horizontally and highlight selected
         for i in range(3):
@@ -155,16 +402,16 @@ class CustomPDF(FPDF):
                 self.set_line_width(0.2)
             self.rounded_rect(bx, y, box_w, box_h, r=2, style='D')
             # place emoji image if available
-            img_path = self.emoji_paths.get(i)
+            img_src = self.assets.source(f"niveau_{i}")
             # if specific image missing, fall back to any available image to avoid numbers
-            if img_path is None:
-                for alt in self.emoji_paths.values():
-                    if alt is not None:
-                        img_path = alt
+            if img_src is None:
+                for j in range(3):
+                    img_src = self.assets.source(f"niveau_{j}")
+                    if img_src is not None:
                         break
-            if img_path is not None:
+            if img_src is not None:
                 try:
-                    self.image(str(img_path), x=bx + 2, y=y + 2, w=box_w - 4, h=box_h - 4)
+                    self.image(img_src, x=bx + 2, y=y + 2, w=box_w - 4, h=box_h - 4)
                 except Exception:
                     pass
             else:
@@ -174,37 +421,22 @@ class CustomPDF(FPDF):
                 self.cell(box_w, 6, labels[i], align="C")
 
     def calculate_multicell_height(self, text: str, width: float, line_height: float) -> float:
-        # Approximate height of a multicell for current font settings
-        total_lines = 0
-        for paragraph in str(text).split("\n"):
-            if not paragraph:
-                total_lines += 1
-                continue
-            current_line = ""
-            for word in paragraph.split(" "):
-                test = (current_line + (" " if current_line else "") + word).strip()
-                if self.get_string_width(test) <= width:
-                    current_line = test
-                else:
-                    total_lines += 1
-                    current_line = word
-            if current_line:
-                total_lines += 1
-        return max(line_height, total_lines * line_height)
+        # Hauteur exacte de multi_cell(width, line_height, text) avec la police courante
+        return get_text_measure().line_count(self, str(text), width) * line_height
 
     def header(self):
         if not self.first_page:
             return
         # Logos et visuels si disponibles
-        logo = self.images_dir / "logo_geneve2.png"
-        garcon = self.images_dir / "eleve_garcon.png"
-        fille = self.images_dir / "eleve_fille.png"
-        if logo.exists():
-            self.image(str(logo), x=10, y=3, w=15)
-        if garcon.exists():
-            self.image(str(garcon), x=45, y=7.3, w=20)
-        if fille.exists():
-            self.image(str(fille), x=135, y=6.3, w=20)
+        logo = self.assets.source("logo")
+        garcon = self.assets.source("garcon")
+        fille = self.assets.source("fille")
+        if logo is not None:
+            self.image(logo, x=10, y=3, w=15)
+        if garcon is not None:
+            self.image(garcon, x=45, y=7.3, w=20)
+        if fille is not None:
+            self.image(fille, x=135, y=6.3, w=20)
 
         # Titre centré
         self.set_font("Arial", "B", 20)
@@ -238,142 +470,560 @@ class CustomPDF(FPDF):
         self.set_font("Arial", "I", 9)
         self.cell(0, 10, f"{self.page_no()}/{{nb}}", 0, 0, "R")
 
+# --- Fiche d'observation PDF: une observation validée par page ---
+def build_observation_sheet(observations: list[dict], progress: Callable[[int, int], None] | None = None) -> bytes:
+    """Met en page les observations validées (bandeau, caractéristiques, échelles, commentaires)."""
+    pdf = CustomPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.set_margins(15, 15, 15)
+    pdf.alias_nb_pages()
+    # Fonts: try Unicode TrueType to support accents
+    base_font = add_unicode_font(pdf)
+    pdf.add_page()
+
+    content_width = getattr(pdf, "epw", pdf.w - pdf.l_margin - pdf.r_margin)
+    pdf.set_font(base_font, "", 12)
+
+    # Observations
+    obs_on_page = 0
+    for done, obs in enumerate(observations):
+        # Contrainte de pagination: max 1 observation par page, éviter le footer
+        safe_bottom = getattr(pdf, 'b_margin', 15) + 20
+        if obs_on_page >= 1 or pdf.get_y() > (pdf.h - safe_bottom - 120):
+            pdf.add_page()
+            obs_on_page = 0
+        # Début du bloc avec encadrement
+        x_box = pdf.l_margin
+        y_box = pdf.get_y()
+        # Titre d'observation (bandeau cyan arrondi) avec retour à la ligne si trop long
+        pdf.set_font(base_font, "B", 13)
+        pdf.set_text_color(255, 255, 255)
+        pdf.set_fill_color(0, 173, 239)
+        title_h = 8
+        # Calcul de la hauteur nécessaire
+        title_text = (obs.get('Apprentissage') or obs.get('Critère') or "")
+        req_h = pdf.calculate_multicell_height(title_text, content_width - 4, 6)
+        # Plus d'espace bas dans le bandeau pour aérer
+        block_h = max(title_h, req_h + 3)
+        # Utiliser un bandeau à coins arrondis en haut uniquement, aligné avec le cadre
+        frame_x = pdf.l_margin + 3
+        frame_w = content_width - 6
+        pdf.rounded_top_rect(frame_x, y_box, frame_w, block_h, r=3, style='F')
+        # Positionner plus haut (padding haut faible, bas plus large)
+        pdf.set_xy(frame_x + 2, y_box + 1)
+        pdf.multi_cell(frame_w - 4, 6, title_text)
+        pdf.set_text_color(0, 0, 0)
+        pdf.set_font(base_font, "", 11)
+        pdf.ln(2)
+
+        # Caractéristiques avec libellés en gras (décalées vers l'intérieur du cadre)
+        pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Domaine: "); pdf.set_font(base_font, "", 11); pdf.write(6, (obs['Domaine'] or "") + "\n")
+        pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Composante: "); pdf.set_font(base_font, "", 11); pdf.write(6, (obs['Composante'] or "") + "\n")
+        # Suppression de la ligne Mode (inutile)
+        if obs.get("Activités"):
+            pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Activités réalisées: "); pdf.set_font(base_font, "", 11); pdf.write(6, ", ".join(obs['Activités']) + "\n")
+        if obs.get("Compétences_mobilisées"):
+            pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Compétences transversales mobilisées: "); pdf.set_font(base_font, "", 11); pdf.write(6, ", ".join(obs['Compétences_mobilisées']) + "\n")
+        if obs.get("Processus_mobilisés"):
+            pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Processus cognitifs mobilisés: "); pdf.set_font(base_font, "", 11); pdf.write(6, ", ".join(obs['Processus_mobilisés']) + "\n")
+        # Observables: Likert horizontal avec emoji + habillage
+        if obs.get("Observables"):
+            pdf.ln(1)
+            pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Observables\n")
+            pdf.set_font(base_font, "", 11)
+            # Dimensions pour l'échelle
+            scale_box_w = 14
+            scale_box_h = 12
+            scale_gap = 6
+            scale_total_w = 3 * (scale_box_w + scale_gap) - scale_gap
+            right_padding = 6  # espace entre l'échelle et le cadre à droite
+            text_w = frame_w - scale_total_w - 6 - right_padding
+            # Grouper les observables par (label, niveau)
+            groups = {}
+            order = []
+            for item in obs["Observables"]:
+                res = parse_observable_result(item)
+                idx = 1 if res.level is None else res.level
+                key = (res.observable, idx)
+                if key not in groups:
+                    groups[key] = {"names": [], "has_class": False}
+                    order.append(key)
+                subject = res.subject
+                if subject == "Classe":
+                    groups[key]["has_class"] = True
+                elif subject not in groups[key]["names"]:
+                    groups[key]["names"].append(subject)
+
+            # Rendu groupé: un label par ligne, sujets listés avec virgules et retour à la ligne si long
+            for (label, idx) in order:
+                y_line = pdf.get_y()
+                names = groups[(label, idx)]["names"]
+                has_class = groups[(label, idx)]["has_class"]
+                subject_text_parts = []
+                if has_class:
+                    subject_text_parts.append("Classe")
+                if names:
+                    subject_text_parts.append(", ".join(names))
+                subject_text = ", ".join(subject_text_parts) if subject_text_parts else "Classe"
+
+                pdf.set_font(base_font, "", 11)
+                label_h = pdf.calculate_multicell_height(label, text_w, 6)
+                pdf.set_font(base_font, "", 10)
+                subj_h = pdf.calculate_multicell_height(subject_text, text_w, 5)
+                row_h = max(label_h + subj_h + 3, scale_box_h + 6)
+
+                # Fond de ligne aligné avec le cadre
+                pdf.set_fill_color(255, 255, 255)
+                pdf.rounded_rect(frame_x, y_line, frame_w, row_h, r=1.5, style='F')
+
+                # Libellé
+                pdf.set_font(base_font, "", 11)
+                pdf.set_xy(frame_x + 2, y_line + 1)
+                pdf.multi_cell(text_w, 6, label, align='L')
+
+                # Sujet(s) sous le libellé, avec retour à la ligne si nécessaire
+                pdf.set_text_color(90, 90, 90)
+                pdf.set_font(base_font, "", 10)
+                pdf.set_xy(frame_x + 2, y_line + 1 + label_h)
+                pdf.multi_cell(text_w, 5, subject_text, align='L')
+                pdf.set_text_color(0, 0, 0)
+                pdf.set_font(base_font, "", 11)
+
+                # Échelle à droite
+                pdf.draw_likert_scale(idx, x=frame_x + text_w + 6, y=y_line + 2, box_w=scale_box_w, box_h=scale_box_h, gap=scale_gap)
+
+                # Avancer sous le bloc
+                pdf.set_y(y_line + row_h)
+        if obs.get("Commentaire"):
+            # Séparer commentaire classe vs individus (si le texte contient des préfixes)
+            comment_lines = [l.strip() for l in str(obs['Commentaire']).replace("\r", "\n").split("\n") if l.strip()]
+            student_names = []
+            for it in obs.get("Observables", []):
+                res = parse_observable_result(it)
+                if res.kind == "eleve" and res.students[0] not in student_names:
+                    student_names.append(res.students[0])
+            class_comments = []
+            student_comments = {}
+            for l in comment_lines:
+                # ignorer des lignes de type "Nom: ... - ..." (valeurs Likert)
+                if (":" in l and " - " in l):
+                    continue
+                lower = l.lower()
+                if lower.startswith("classe:"):
+                    class_comments.append(l.split(":", 1)[1].strip())
+                    continue
+                matched = False
+                for nm in student_names:
+                    if l.startswith(nm + ":"):
+                        student_comments.setdefault(nm, []).append(l.split(":", 1)[1].strip())
+                        matched = True
+                        break
+                if not matched:
+                    class_comments.append(l)
+            if class_comments:
+                # Faire la ligne vide avec ln() puis conserver le même x
+                pdf.ln(1)
+                pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Commentaire: ")
+                pdf.set_font(base_font, "", 11); pdf.write(6, " ".join(class_comments) + "\n")
+                if student_comments:
+                    pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Commentaire (élèves):\n")
+                    pdf.set_font(base_font, "", 11)
+                    for nm, notes in student_comments.items():
+                        pdf.set_x(frame_x + 4); pdf.write(6, f"- {nm}: {' '.join(notes)}\n")
+            if obs.get("Compétence_mise_en_avant") or obs.get("Processus_mis_en_avant"):
+                pdf.ln(1)
+                pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Compétences transversales et processus cognitifs mis en avant\n")
+                pdf.set_font(base_font, "", 11)
+                if obs.get("Compétence_mise_en_avant"):
+                    pdf.set_x(frame_x + 4); pdf.write(6, f"- Compétence transversale: {obs['Compétence_mise_en_avant']}\n")
+                if obs.get("Processus_mis_en_avant"):
+                    pdf.set_x(frame_x + 4); pdf.write(6, f"- Processus cognitif: {obs['Processus_mis_en_avant']}\n")
+
+        # Encadrement arrondi autour du bloc
+        y_after = pdf.get_y()
+        box_h = y_after - y_box
+        pdf.set_draw_color(0, 0, 0)
+        # Bordure plus épaisse et parfaitement alignée avec le titre
+        pdf.set_line_width(0.6)
+        pdf.rounded_rect(frame_x, y_box, frame_w, box_h, r=3, style='D')
+        pdf.set_line_width(0.2)
+        pdf.ln(6)
+        obs_on_page += 1
+        if progress is not None:
+            progress(done + 1, len(observations))
+
+    return bytes(pdf.output(dest='S'))
+
+# --- PDF volumineux: pages terminées sur disque, document écrit objet par objet dans son fichier ---
+class _FileBuffer:
+    """Tient lieu du bytearray de sortie de fpdf: écrit au fil de l'eau, len() donne les offsets du xref."""
+
+    def __init__(self, file: BinaryIO):
+        self.file = file
+        self.size = 0
+        self.digest = hashlib.md5(usedforsecurity=False)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iadd__(self, data: bytes) -> "_FileBuffer":
+        self.file.write(data)
+        self.digest.update(data)
+        self.size += len(data)
+        return self
+
+class _SpooledPageStream(PDFContentStream):
+    """Contenu d'une page, relu et compressé seulement au moment de son écriture."""
+
+    def __init__(self, load: Callable[[], bytes], compress: bool):
+        super().__init__(b"", compress=compress)
+        self._load = load
+
+    def serialize(self, obj_dict=None, _security_handler=None) -> str:
+        contents = self._load()
+        self._contents = zlib.compress(contents, level=self._COMPRESSION_LEVEL) if self.filter else contents
+        self.length = len(self._contents)
+        try:
+            return super().serialize(obj_dict, _security_handler)
+        finally:
+            self._contents = b""
+
+class SpooledOutputProducer(OutputProducer):
+    """Sortie de SpooledPDF: les pages mises de côté restent sur disque jusqu'à leur tour."""
+
+    def __init__(self, fpdf: "SpooledPDF"):
+        super().__init__(fpdf)
+        self.buffer = fpdf._buffer
+
+    def _add_pages(self, _slice: slice = slice(0, None)) -> list[PDFPage]:
+        page_objs = super()._add_pages(_slice)
+        positions = {id(obj): i for i, obj in enumerate(self.pdf_objs)}
+        for page_obj in page_objs:
+            if page_obj not in self.fpdf._spooled:
+                continue
+            stream = _SpooledPageStream(functools.partial(self.fpdf._read_page, page_obj), self.fpdf.compress)
+            stream.id = page_obj.contents.id
+            self.pdf_objs[positions[id(page_obj.contents)]] = stream
+            page_obj.contents = stream
+        return page_objs
+
+class SpooledPDF(CustomPDF):
+    """CustomPDF dont la mémoire ne grandit pas avec le nombre de pages.
+
+    fpdf garde le contenu de toutes les pages jusqu'à output(), puis assemble
+    le document entier dans un bytearray. Ici, chaque page terminée part dans
+    un fichier temporaire anonyme; write() relit les pages une à une (numéros
+    {nb} substitués, puis compression) et envoie chaque objet directement dans
+    le fichier final. Restent en mémoire la page en cours et les petits objets
+    que fpdf tient par page (ressources, liens). La sortie reprend celle de la
+    version de fpdf2 épinglée dans requirements.txt; tests/test_spooled_pdf.py
+    vérifie qu'elle est identique octet pour octet à FPDF.output().
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._spool = tempfile.TemporaryFile(prefix="pdf-pages-")
+        self._spooled: dict[PDFPage, tuple[int, int]] = {}
+        self._buffer: _FileBuffer | None = None
+
+    def add_page(self, *args, **kwargs):
+        # Le pied de page de la précédente est rendu par add_page: elle est alors terminée
+        finished = self.pages.get(self.page)
+        super().add_page(*args, **kwargs)
+        if finished is not None:
+            offset = self._spool.seek(0, os.SEEK_END)
+            self._spool.write(finished.contents)
+            self._spooled[finished] = (offset, len(finished.contents))
+            finished.contents = bytearray()
+
+    def _read_page(self, page: PDFPage) -> bytes:
+        offset, length = self._spooled[page]
+        self._spool.seek(offset)
+        contents = self._spool.read(length)
+        # Même substitution que FPDF.output() sur les pages restées en mémoire
+        for item in page.get_text_substitutions():
+            contents = contents.replace(
+                item.get_placeholder_string().encode("latin-1"),
+                item.render_text_substitution(str(self.pages_count)).encode("latin-1"),
+            )
+        return contents
+
+    def file_id(self):
+        if self._buffer is None:
+            return super().file_id()
+        # Comme FPDF._default_file_id, sur les octets déjà écrits (seul le xref suit)
+        digest = self._buffer.digest.copy()
+        if self.creation_date:
+            digest.update(self.creation_date.strftime("%Y%m%d%H%M%S").encode("utf8"))
+        return f"<{digest.hexdigest().upper()}>" * 2
+
+    def write(self, path: Path) -> None:
+        """Termine le document et l'écrit dans path; un fichier incomplet est supprimé."""
+        try:
+            with open(path, "wb") as file, self._spool:
+                self._buffer = _FileBuffer(file)
+                self.output(output_producer_class=SpooledOutputProducer)
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+
+# --- Rapport de progression PDF: synthèse par élève, trajectoires en option ---
+TRAJECTORY_PDF_STEPS = 8
+
+def build_progression_report(
+    path: Path,
+    progression: Mapping[str, pd.DataFrame],
+    period: tuple[date, date],
+    tout_historique: bool,
+    teacher_name: str = "",
+    load_trajectories: Callable[[str], pd.DataFrame] | None = None,
+    progress: Callable[[int, int], None] | None = None,
+) -> Path:
+    """Met en page la synthèse de chaque élève (dans l'ordre de progression), puis ses trajectoires.
+
+    Le document est écrit dans path au fil des pages (SpooledPDF), d'où il est
+    servi sans être recopié en octets. load_trajectories(eleve) charge les
+    trajectoires d'un élève à la fois: ni le PDF ni les données d'une classe
+    entière ne tiennent ensemble en mémoire. Elle n'est appelée qu'ici, dans le
+    thread de rendu: les requêtes ne retardent pas le rerun qui a demandé l'export.
+    """
+    pdf = SpooledPDF(teacher_name=teacher_name)
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.set_margins(15, 15, 15)
+    pdf.alias_nb_pages()
+
+    base_font = add_unicode_font(pdf)
+
+    pdf.add_page()
+    content_width = getattr(pdf, "epw", pdf.w - pdf.l_margin - pdf.r_margin)
+
+    # Titre
+    pdf.set_font(base_font, "B", 18)
+    pdf.cell(0, 10, "Progression de la classe", 0, 1, "C")
+    pdf.ln(5)
+
+    # Période
+    pdf.set_font(base_font, "", 11)
+    if tout_historique:
+        pdf.cell(0, 6, "Période : tout l'historique", 0, 1, "C")
+    else:
+        pdf.cell(0, 6, f"Période : du {period[0].strftime('%d/%m/%Y')} au {period[1].strftime('%d/%m/%Y')}", 0, 1, "C")
+    pdf.ln(10)
+
+    # Par élève
+    for done, (eleve, rows) in enumerate(progression.items()):
+        if pdf.get_y() > pdf.h - 40:
+            pdf.add_page()
+
+        pdf.set_font(base_font, "B", 14)
+        pdf.cell(0, 8, f"Élève : {eleve}", 0, 1)
+        pdf.ln(3)
+
+        # Regroupement par domaine puis apprentissage, dans l'ordre d'apparition (celui de
+        # groupby(sort=False)), sur des listes de valeurs: ni copie pandas ni classe de
+        # itertuples() par élève, laissées en cycles au ramasse-miettes jusqu'à la fin
+        domaines_eleve: dict[str, dict[str, list[list]]] = {}
+        colonnes = ("Domaine", "appr_key", "observable", "count", "first_level", "last_level")
+        for domaine, appr_key, *ligne in zip(*(rows[c].tolist() for c in colonnes)):
+            domaines_eleve.setdefault(domaine, {}).setdefault(appr_key, []).append(ligne)
+
+        for domaine, apprentissages in domaines_eleve.items():
+            if pdf.get_y() > pdf.h - 50:
+                pdf.add_page()
+
+            pdf.set_font(base_font, "B", 12)
+            pdf.set_fill_color(230, 230, 230)
+            pdf.cell(0, 7, domaine, 0, 1, "L", fill=True)
+            pdf.ln(2)
+
+            for appr_key, appr_rows in apprentissages.items():
+                if pdf.get_y() > pdf.h - 60:
+                    pdf.add_page()
+
+                pdf.set_font(base_font, "B", 10)
+                pdf.cell(0, 6, appr_key, 0, 1)
+                pdf.ln(1)
+
+                pdf.set_font(base_font, "", 9)
+                for observable, count, first_level, last_level in appr_rows:
+                    y_before = pdf.get_y()
+                    line = f"• {observable} : {niveau_label(last_level)}"
+                    if count > 1:
+                        line += f" ({count} observations, au départ : {niveau_label(first_level)})"
+                    pdf.multi_cell(content_width - 10, 5, line, 0, "L")
+                    if pdf.get_y() - y_before > 20:  # Si trop d'espace, nouvelle page
+                        if pdf.get_y() > pdf.h - 30:
+                            pdf.add_page()
+                    pdf.ln(1)
+
+                pdf.ln(2)
+
+            pdf.ln(3)
+
+        trajectoires = load_trajectories(eleve) if load_trajectories is not None else None
+        if trajectoires is not None and not trajectoires.empty:
+            if pdf.get_y() > pdf.h - 50:
+                pdf.add_page()
+            pdf.set_font(base_font, "B", 12)
+            pdf.set_fill_color(230, 230, 230)
+            pdf.cell(0, 7, "Trajectoires", 0, 1, "L", fill=True)
+            pdf.ln(2)
+            pdf.set_font(base_font, "", 9)
+            etapes_par_observable: dict[str, list[str]] = {}
+            for observable, n, d in zip(trajectoires["observable"].tolist(), trajectoires["niveau"].tolist(), trajectoires["date"]):
+                etapes_par_observable.setdefault(observable, []).append(f"{niveau_label(n)} ({d:%d/%m})")
+            for observable, etapes in etapes_par_observable.items():
+                if len(etapes) > TRAJECTORY_PDF_STEPS:
+                    etapes = ["…", *etapes[-TRAJECTORY_PDF_STEPS:]]
+                pdf.multi_cell(content_width - 10, 5, f"• {observable} : {' → '.join(etapes)}", 0, "L")
+                pdf.ln(1)
+            pdf.ln(3)
+
+        pdf.ln(5)
+        if progress is not None:
+            progress(done + 1, len(progression))
+
+    pdf.write(path)
+    return path
+
 # --- Données enrichies avec les 7 domaines, compétences transversales et processus cognitifs ---
-domaines = {
-    "Corps et motricité": {
-        "icon": "🏃",
-        "composantes": {
-            "Motricité globale": {
-                "Découverte, exploration de l'espace et orientation en variant les points de référence (son propre corps, d'autres personnes, d'autres objets,…)": {
-                    "code_per": "MSN 11",
-                    "Activités par contexte": {
-                        "En classe": ["Parcours entre les tables en sautant à cloche-pied", "Jeu du flamant rose (tenir la position)"],
-                        "Sur le banc": ["Sauter d'un banc à l'autre (faible hauteur)", "Équilibre sur un pied pendant 5 secondes"],
-                        "Jeu à faire semblant": ["Imiter un kangourou dans la savane", "Pirate avec une jambe de bois"],
-                        "Dehors": ["Sauter dans les cerceaux au sol", "Course à cloche-pied dans la cour"],
-                        "Autres": ["Atelier motricité en EPS", "Jeux libres avec consigne motrice"]
+def _build_domaines() -> dict:
+    # Référentiel construit une seule fois par processus (cf. bootstrap)
+    return {
+        "Corps et motricité": {
+            "icon": "🏃",
+            "composantes": {
+                "Motricité globale": {
+                    "Découverte, exploration de l'espace et orientation en variant les points de référence (son propre corps, d'autres personnes, d'autres objets,…)": {
+                        "code_per": "MSN 11",
+                        "Activités par contexte": {
+                            "En classe": ["Parcours entre les tables en sautant à cloche-pied", "Jeu du flamant rose (tenir la position)"],
+                            "Sur le banc": ["Sauter d'un banc à l'autre (faible hauteur)", "Équilibre sur un pied pendant 5 secondes"],
+                            "Jeu à faire semblant": ["Imiter un kangourou dans la savane", "Pirate avec une jambe de bois"],
+                            "Dehors": ["Sauter dans les cerceaux au sol", "Course à cloche-pied dans la cour"],
+                            "Autres": ["Atelier motricité en EPS", "Jeux libres avec consigne motrice"]
+                        },
+                        "Observables": ["Tient l'équilibre ≥ 3 sec", "Change de pied spontanément", "Ne tombe pas"],
+                        "compétences_transversales": ["Persévérance", "Estime de soi", "Régulation émotionnelle"],
+                        "processus_cognitifs": ["Attention soutenue", "Contrôle inhibiteur", "Planification motrice"]
                     },
-                    "Observables": ["Tient l'équilibre ≥ 3 sec", "Change de pied spontanément", "Ne tombe pas"],
-                    "compétences_transversales": ["Persévérance", "Estime de soi", "Régulation émotionnelle"],
-                    "processus_cognitifs": ["Attention soutenue", "Contrôle inhibiteur", "Planification motrice"]
-                },
-                "Détermination de sa position ou de celle d'un objet (devant, derrière, à côté, sur, sous, entre, à l'intérieur, à l'extérieur,…) selon différents points de repères": {
-                    "code_per": "MSN 11",
-                    "Activités par contexte": {
-                        "En classe": ["Course entre les chaises avec arrêt au signal", "Jeu du feu vert/feu rouge"],
-                        "Sur le banc": ["Marche rapide puis arrêt net", "Déplacement contrôlé"],
-                        "Jeu à faire semblant": ["Livrer un message urgent au roi", "Échapper au dragon puis se figer"],
-                        "Dehors": ["Relais avec départ/arrêt", "Course avec plots et arrêt sur cible"],
-                        "Autres": ["Jeux sportifs collectifs", "Ateliers EPS"]
-                    },
-                    "Observables": ["Freine sans glisser", "S'arrête pile sur la cible", "Contrôle sa vitesse"],
-                    "compétences_transversales": ["Contrôle de soi", "Respect des règles", "Adaptabilité"],
-                    "processus_cognitifs": ["Inhibition", "Attention sélective", "Temps de réaction"]
+                    "Détermination de sa position ou de celle d'un objet (devant, derrière, à côté, sur, sous, entre, à l'intérieur, à l'extérieur,…) selon différents points de repères": {
+                        "code_per": "MSN 11",
+                        "Activités par contexte": {
+                            "En classe": ["Course entre les chaises avec arrêt au signal", "Jeu du feu vert/feu rouge"],
+                            "Sur le banc": ["Marche rapide puis arrêt net", "Déplacement contrôlé"],
+                            "Jeu à faire semblant": ["Livrer un message urgent au roi", "Échapper au dragon puis se figer"],
+                            "Dehors": ["Relais avec départ/arrêt", "Course avec plots et arrêt sur cible"],
+                            "Autres": ["Jeux sportifs collectifs", "Ateliers EPS"]
+                        },
+                        "Observables": ["Freine sans glisser", "S'arrête pile sur la cible", "Contrôle sa vitesse"],
+                        "compétences_transversales": ["Contrôle de soi", "Respect des règles", "Adaptabilité"],
+                        "processus_cognitifs": ["Inhibition", "Attention sélective", "Temps de réaction"]
+                    }
                 }
             }
-        }
-    },
-    "Affectivité": {
-        "icon": "❤️",
-        "composantes": {
-            "Gestion des émotions": {
-                "Identifier ses émotions": {
-                    "code_per": "AF 21",
-                    "Activités par contexte": {
-                        "En classe": ["Raconter une histoire avec des émotions", "Albums sur les émotions"],
-                        "Sur le banc": ["Discussion en binôme : 'Quand j’étais triste…'", "Cartes émotions à identifier"],
-                        "Jeu à faire semblant": ["Jouer une scène de dispute/réconciliation", "Théâtre d’ombres avec émotions"],
-                        "Dehors": ["Expression corporelle libre : 'montre la colère'", "Jeux de rôle dans la cabane"],
-                        "Autres": ["Coin calme avec miroir et pictos", "Rituels du matin (météo des émotions)"]
-                    },
-                    "Observables": ["Nomme l’émotion ressentie", "Utilise un vocabulaire varié", "Reconnaît l’émotion chez autrui"],
-                    "compétences_transversales": ["Empathie", "Expression verbale", "Autoconscience"],
-                    "processus_cognitifs": ["Mémoire sémantique", "Reconnaissance faciale", "Métacognition"]
+        },
+        "Affectivité": {
+            "icon": "❤️",
+            "composantes": {
+                "Gestion des émotions": {
+                    "Identifier ses émotions": {
+                        "code_per": "AF 21",
+                        "Activités par contexte": {
+                            "En classe": ["Raconter une histoire avec des émotions", "Albums sur les émotions"],
+                            "Sur le banc": ["Discussion en binôme : 'Quand j’étais triste…'", "Cartes émotions à identifier"],
+                            "Jeu à faire semblant": ["Jouer une scène de dispute/réconciliation", "Théâtre d’ombres avec émotions"],
+                            "Dehors": ["Expression corporelle libre : 'montre la colère'", "Jeux de rôle dans la cabane"],
+                            "Autres": ["Coin calme avec miroir et pictos", "Rituels du matin (météo des émotions)"]
+                        },
+                        "Observables": ["Nomme l’émotion ressentie", "Utilise un vocabulaire varié", "Reconnaît l’émotion chez autrui"],
+                        "compétences_transversales": ["Empathie", "Expression verbale", "Autoconscience"],
+                        "processus_cognitifs": ["Mémoire sémantique", "Reconnaissance faciale", "Métacognition"]
+                    }
                 }
             }
-        }
-    },
-    "Sociabilité": {
-        "icon": "🤝",
-        "composantes": {
-            "Coopération": {
-                "Travailler en groupe": {
-                    "code_per": "SO 31",
-                    "Activités par contexte": {
-                        "En classe": ["Construire une tour en équipe", "Jeu de rôle collectif"],
-                        "Sur le banc": ["Partager un matériel à tour de rôle", "Discuter d’une solution commune"],
-                        "Jeu à faire semblant": ["Créer une histoire à plusieurs", "Jouer une famille ou une équipe"],
-                        "Dehors": ["Jeu de ballon coopératif", "Parcours en binôme"],
-                        "Autres": ["Projets interclasses", "Ateliers collaboratifs"]
-                    },
-                    "Observables": ["Attend son tour", "Propose des idées", "Aide un camarade"],
-                    "compétences_transversales": ["Collaboration", "Communication", "Responsabilité"],
-                    "processus_cognitifs": ["Théorie de l’esprit", "Flexibilité cognitive", "Mémoire de travail"]
+        },
+        "Sociabilité": {
+            "icon": "🤝",
+            "composantes": {
+                "Coopération": {
+                    "Travailler en groupe": {
+                        "code_per": "SO 31",
+                        "Activités par contexte": {
+                            "En classe": ["Construire une tour en équipe", "Jeu de rôle collectif"],
+                            "Sur le banc": ["Partager un matériel à tour de rôle", "Discuter d’une solution commune"],
+                            "Jeu à faire semblant": ["Créer une histoire à plusieurs", "Jouer une famille ou une équipe"],
+                            "Dehors": ["Jeu de ballon coopératif", "Parcours en binôme"],
+                            "Autres": ["Projets interclasses", "Ateliers collaboratifs"]
+                        },
+                        "Observables": ["Attend son tour", "Propose des idées", "Aide un camarade"],
+                        "compétences_transversales": ["Collaboration", "Communication", "Responsabilité"],
+                        "processus_cognitifs": ["Théorie de l’esprit", "Flexibilité cognitive", "Mémoire de travail"]
+                    }
                 }
             }
-        }
-    },
-    "Littératie": {
-        "icon": "📖",
-        "composantes": {
-            "Compréhension orale": {
-                "Suivre une consigne complexe": {
-                    "code_per": "LI 41",
-                    "Activités par contexte": {
-                        "En classe": ["Jeu des consignes à 2 étapes", "Écoute d’histoires avec questions"],
-                        "Sur le banc": ["Répéter une consigne en ses mots", "Jeu de 'Simon dit'"],
-                        "Jeu à faire semblant": ["Suivre les règles d’un jeu inventé", "Jouer un rôle avec instructions"],
-                        "Dehors": ["Chasse au trésor avec indices verbaux", "Jeu de piste oral"],
-                        "Autres": ["Temps d’écoute active", "Rituels narratifs"]
-                    },
-                    "Observables": ["Exécute les étapes dans l’ordre", "Demande des clarifications", "Résume la consigne"],
-                    "compétences_transversales": ["Écoute active", "Clarté d’expression", "Autonomie"],
-                    "processus_cognitifs": ["Mémoire de travail", "Compréhension syntaxique", "Attention auditive"]
+        },
+        "Littératie": {
+            "icon": "📖",
+            "composantes": {
+                "Compréhension orale": {
+                    "Suivre une consigne complexe": {
+                        "code_per": "LI 41",
+                        "Activités par contexte": {
+                            "En classe": ["Jeu des consignes à 2 étapes", "Écoute d’histoires avec questions"],
+                            "Sur le banc": ["Répéter une consigne en ses mots", "Jeu de 'Simon dit'"],
+                            "Jeu à faire semblant": ["Suivre les règles d’un jeu inventé", "Jouer un rôle avec instructions"],
+                            "Dehors": ["Chasse au trésor avec indices verbaux", "Jeu de piste oral"],
+                            "Autres": ["Temps d’écoute active", "Rituels narratifs"]
+                        },
+                        "Observables": ["Exécute les étapes dans l’ordre", "Demande des clarifications", "Résume la consigne"],
+                        "compétences_transversales": ["Écoute active", "Clarté d’expression", "Autonomie"],
+                        "processus_cognitifs": ["Mémoire de travail", "Compréhension syntaxique", "Attention auditive"]
+                    }
                 }
             }
-        }
-    },
-    "Numératie": {
-        "icon": "🔢",
-        "composantes": {
-            "Dénombrement": {
-                "Compter jusqu'à 10 avec correspondance terme à terme": {
-                    "code_per": "NU 51",
-                    "Activités par contexte": {
-                        "En classe": ["Compter les crayons", "Jeu de la marchande"],
-                        "Sur le banc": ["Compter des jetons", "Associer chiffre et quantité"],
-                        "Jeu à faire semblant": ["Préparer 5 assiettes pour les invités", "Donner 3 pièces d’or au pirate"],
-                        "Dehors": ["Compter les sauts", "Ramasser 7 feuilles"],
-                        "Autres": ["Manipulations avec réglettes", "Jeux de société numériques"]
-                    },
-                    "Observables": ["Pointe chaque objet une fois", "Dit la suite numérique sans sauter", "Arrête au bon nombre"],
-                    "compétences_transversales": ["Précision", "Logique", "Persévérance"],
-                    "processus_cognitifs": ["Attention sélective", "Mémoire de travail", "Inhibition"]
+        },
+        "Numératie": {
+            "icon": "🔢",
+            "composantes": {
+                "Dénombrement": {
+                    "Compter jusqu'à 10 avec correspondance terme à terme": {
+                        "code_per": "NU 51",
+                        "Activités par contexte": {
+                            "En classe": ["Compter les crayons", "Jeu de la marchande"],
+                            "Sur le banc": ["Compter des jetons", "Associer chiffre et quantité"],
+                            "Jeu à faire semblant": ["Préparer 5 assiettes pour les invités", "Donner 3 pièces d’or au pirate"],
+                            "Dehors": ["Compter les sauts", "Ramasser 7 feuilles"],
+                            "Autres": ["Manipulations avec réglettes", "Jeux de société numériques"]
+                        },
+                        "Observables": ["Pointe chaque objet une fois", "Dit la suite numérique sans sauter", "Arrête au bon nombre"],
+                        "compétences_transversales": ["Précision", "Logique", "Persévérance"],
+                        "processus_cognitifs": ["Attention sélective", "Mémoire de travail", "Inhibition"]
+                    }
                 }
             }
-        }
-    },
-    "Éveil à l'environnement": {
-        "icon": "🌍",
-        "composantes": {
-            "Découverte du vivant": {
-                "Observer les plantes et les animaux": {
-                    "code_per": "EV 61",
-                    "Activités par contexte": {
-                        "En classe": ["Coin nature avec loupe", "Album photo de la cour"],
-                        "Sur le banc": ["Dessiner une feuille observée", "Classer des images animaux/plantes"],
-                        "Jeu à faire semblant": ["Jardinier ou vétérinaire", "Explorateur de la jungle"],
-                        "Dehors": ["Balade sensorielle", "Création d’un herbier"],
-                        "Autres": ["Visite d’un jardin", "Expériences de germination"]
-                    },
-                    "Observables": ["Nomme ce qu’il voit", "Pose des questions", "Compare deux éléments"],
-                    "compétences_transversales": ["Curiosité", "Observation", "Respect de la nature"],
-                    "processus_cognitifs": ["Perception visuelle", "Catégorisation", "Mémoire épisodique"]
+        },
+        "Éveil à l'environnement": {
+            "icon": "🌍",
+            "composantes": {
+                "Découverte du vivant": {
+                    "Observer les plantes et les animaux": {
+                        "code_per": "EV 61",
+                        "Activités par contexte": {
+                            "En classe": ["Coin nature avec loupe", "Album photo de la cour"],
+                            "Sur le banc": ["Dessiner une feuille observée", "Classer des images animaux/plantes"],
+                            "Jeu à faire semblant": ["Jardinier ou vétérinaire", "Explorateur de la jungle"],
+                            "Dehors": ["Balade sensorielle", "Création d’un herbier"],
+                            "Autres": ["Visite d’un jardin", "Expériences de germination"]
+                        },
+                        "Observables": ["Nomme ce qu’il voit", "Pose des questions", "Compare deux éléments"],
+                        "compétences_transversales": ["Curiosité", "Observation", "Respect de la nature"],
+                        "processus_cognitifs": ["Perception visuelle", "Catégorisation", "Mémoire épisodique"]
+                    }
                 }
             }
         }
     }
-}
 
 # --- Initialisation de session_state ---
 if "observations" not in st.session_state:
@@ -383,65 +1033,518 @@ if "show_sidebar" not in st.session_state:
 if "reset_requested" not in st.session_state:
     st.session_state.reset_requested = False
 
+# --- Profilage des reruns (?profile=1): durée et requêtes par phase ---
+PROFILE_PHASES = ("Base de données", "Analyse", "Agrégation", "Widgets", "PDF")
+PROFILE_DEFAULT_PHASE = "Widgets"
+
+class RerunProfiler:
+    """Profil des reruns complets d'une session, conservé dans st.session_state.
+
+    Les phases sont exclusives: entrer dans une phase suspend la précédente, si
+    bien que les durées s'additionnent au total du rerun. Le temps passé hors de
+    toute phase déclarée est compté dans "Widgets".
+    """
+
+    def __init__(self, history: int = 30):
+        self.history: deque[dict] = deque(maxlen=history)
+        self._stats: dict[str, list] | None = None
+        self._phase = PROFILE_DEFAULT_PHASE
+        self._mark = 0.0
+        self._started: datetime | None = None
+        self.runs = 0
+
+    def start(self) -> None:
+        # Un rerun interrompu (st.rerun) est abandonné et remplacé
+        self._stats = {phase: [0.0, 0] for phase in PROFILE_PHASES}
+        self._phase, self._mark, self._started = PROFILE_DEFAULT_PHASE, time.perf_counter(), datetime.now()
+
+    def switch(self, phase: str) -> str:
+        """Passe à phase et retourne la phase interrompue."""
+        now = time.perf_counter()
+        if self._stats is not None:
+            self._stats[self._phase][0] += (now - self._mark) * 1000
+        previous, self._phase, self._mark = self._phase, phase, now
+        return previous
+
+    @contextmanager
+    def phase(self, name: str):
+        previous = self.switch(name)
+        try:
+            yield
+        finally:
+            self.switch(previous)
+
+    def count_query(self, _statement: str | None = None) -> None:
+        if self._stats is not None:
+            self._stats[self._phase][1] += 1
+
+    def finish(self, label: str) -> dict | None:
+        if self._stats is None:
+            return None
+        self.switch(self._phase)
+        self.runs += 1
+        run = {
+            "number": self.runs,
+            "started": self._started,
+            "label": label,
+            "total_ms": sum(ms for ms, _ in self._stats.values()),
+            "phases": {phase: tuple(values) for phase, values in self._stats.items()},
+        }
+        self.history.append(run)
+        self._stats = None
+        return run
+
+# Profil du rerun en cours dans ce thread de script (None: profilage désactivé, coût nul)
+_profiling = threading.local()
+
+def active_profiler() -> RerunProfiler | None:
+    return getattr(_profiling, "profiler", None)
+
+_NO_PROFILE = contextlib.nullcontext()
+
+def profile_phase(name: str):
+    """Contexte attribuant le temps et les requêtes du bloc à une phase."""
+    profiler = active_profiler()
+    return profiler.phase(name) if profiler is not None else _NO_PROFILE
+
+def start_rerun_profile(profiler: RerunProfiler | None) -> None:
+    _profiling.profiler = profiler
+    if profiler is not None:
+        profiler.start()
+
 # --- Base de données: enseignants et élèves ---
-DB_PATH = Path(__file__).parent / "app_data.db"
+# APP_DB_PATH: autre base (tests, benchmarks) que celle livrée avec l'application
+DB_PATH = Path(os.environ.get("APP_DB_PATH") or Path(__file__).parent / "app_data.db")
+logger = logging.getLogger("app")
+
+# APP_ADMIN_EMAILS: comptes (emails séparés par des virgules) qui voient les métriques du
+# processus et les actions de maintenance du panneau de profilage
+ADMIN_EMAILS = frozenset(
+    e.strip().lower() for e in os.environ.get("APP_ADMIN_EMAILS", "").split(",") if e.strip()
+)
+
+def is_admin(teacher: dict | None) -> bool:
+    return bool(teacher) and (teacher.get("email") or "").lower() in ADMIN_EMAILS
+
+# Pragmas appliqués à chaque nouvelle connexion: WAL pour que les lectures ne
+# bloquent plus l'écriture, attente active plutôt que "database is locked".
+SQLITE_BUSY_TIMEOUT_MS = 5000
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",
+    "PRAGMA mmap_size = 67108864",
+)
+
+class ConnectionPool:
+    """Pool de connexions SQLite partagé par tous les threads du processus.
+
+    Streamlit exécute chaque session dans son propre thread: une connexion
+    empruntée n'est utilisée que par un thread à la fois, puis rendue au pool.
+    """
+
+    def __init__(self, db_path: Path, max_idle: int = 8):
+        self.db_path = db_path
+        self._idle: queue.LifoQueue = queue.LifoQueue(maxsize=max_idle)
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+        )
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        # Ne jamais rendre au pool une connexion avec une transaction ouverte
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+@st.cache_resource
+def get_pool() -> ConnectionPool:
+    # Une seule instance par processus (survit aux reruns Streamlit)
+    return ConnectionPool(DB_PATH)
 
+@contextmanager
 def get_conn():
-    return sqlite3.connect(DB_PATH)
+    """Emprunte une connexion au pool (commit en sortie, rollback sur erreur)."""
+    pool = get_pool()
+    profiler = active_profiler()
+    with profile_phase("Base de données"):
+        conn = pool.acquire()
+        if profiler is not None:
+            conn.set_trace_callback(profiler.count_query)
+        try:
+            with conn:
+                yield conn
+        finally:
+            if profiler is not None:
+                conn.set_trace_callback(None)
+            pool.release(conn)
+
+# --- Écritures: un seul thread écrivain, transactions groupées ---
+class _WriteJob(NamedTuple):
+    fn: Callable[[sqlite3.Cursor], Any]
+    future: Future
+    enqueued_at: float
+
+class DatabaseWriter:
+    """Thread unique qui sérialise les écritures SQLite de toutes les sessions.
+
+    Les écritures en attente sont regroupées (jusqu'à max_batch) dans une seule
+    transaction; chacune tourne dans son SAVEPOINT, si bien qu'un échec n'annule
+    que sa propre écriture. Les futures sont résolues après le COMMIT.
+    """
+
+    def __init__(self, pool: ConnectionPool, max_batch: int = 64, history: int = 256):
+        self.pool = pool
+        self.max_batch = max_batch
+        self._queue: queue.Queue[_WriteJob] = queue.Queue()
+        self._lock = threading.Lock()
+        self._commit_ms: deque[float] = deque(maxlen=history)
+        self._wait_ms: deque[float] = deque(maxlen=history)
+        self._batch_sizes: deque[int] = deque(maxlen=history)
+        self.commits = 0
+        self.jobs = 0
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn: Callable[[sqlite3.Cursor], Any]) -> Future:
+        future: Future = Future()
+        self._queue.put(_WriteJob(fn, future, time.perf_counter()))
+        return future
+
+    def _next_batch(self) -> list[_WriteJob]:
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        # Une écriture prise en charge ne peut plus être annulée; celles annulées en attente sont écartées
+        return [job for job in batch if job.future.set_running_or_notify_cancel()]
+
+    def _run(self) -> None:
+        conn = self.pool.acquire()
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            started = time.perf_counter()
+            outcomes = []
+            try:
+                cur = conn.cursor()
+                cur.execute("BEGIN IMMEDIATE")
+                for job in batch:
+                    cur.execute("SAVEPOINT write_job")
+                    try:
+                        result = job.fn(cur)
+                    except Exception as e:
+                        cur.execute("ROLLBACK TO write_job")
+                        outcomes.append((job, None, e))
+                    else:
+                        outcomes.append((job, result, None))
+                    cur.execute("RELEASE write_job")
+                conn.commit()
+            except Exception as e:
+                # Échec de la transaction entière (verrou, disque...): toutes les écritures échouent
+                if conn.in_transaction:
+                    conn.rollback()
+                outcomes = [(job, None, e) for job in batch]
+            done = time.perf_counter()
+            with self._lock:
+                self.commits += 1
+                self.jobs += len(batch)
+                self._batch_sizes.append(len(batch))
+                self._commit_ms.append((done - started) * 1000)
+                self._wait_ms.extend((started - job.enqueued_at) * 1000 for job in batch)
+            for job, result, error in outcomes:
+                if error is not None:
+                    job.future.set_exception(error)
+                else:
+                    job.future.set_result(result)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            commit_ms = sorted(self._commit_ms)
+            return {
+                "queue_depth": self._queue.qsize(),
+                "commits": self.commits,
+                "jobs": self.jobs,
+                "avg_batch": (sum(self._batch_sizes) / len(self._batch_sizes)) if self._batch_sizes else 0.0,
+                "commit_ms_avg": (sum(commit_ms) / len(commit_ms)) if commit_ms else 0.0,
+                "commit_ms_p95": commit_ms[int(0.95 * (len(commit_ms) - 1))] if commit_ms else 0.0,
+                "wait_ms_avg": (sum(self._wait_ms) / len(self._wait_ms)) if self._wait_ms else 0.0,
+            }
+
+@st.cache_resource
+def get_writer() -> DatabaseWriter:
+    # Connexion dédiée, hors du pool de lecture, pour toute la vie du processus
+    return DatabaseWriter(ConnectionPool(DB_PATH, max_idle=1))
+
+WRITE_TIMEOUT_S = 30
+
+def run_write(fn: Callable[[sqlite3.Cursor], Any]) -> Any:
+    """Exécute fn(cur) dans le thread écrivain et retourne son résultat (ou lève son exception).
+
+    Le délai WRITE_TIMEOUT_S ne porte que sur l'attente dans la file: une écriture
+    encore en attente est alors annulée (rien n'est enregistré), une écriture déjà
+    prise en charge est attendue jusqu'à son COMMIT pour ne jamais signaler un
+    échec qui serait ensuite enregistré.
+    """
+    profiler = active_profiler()
+    with profile_phase("Base de données"):
+        if profiler is not None:
+            # Une écriture soumise compte pour une requête (ses instructions tournent dans le thread écrivain)
+            profiler.count_query()
+        future = get_writer().submit(fn)
+        try:
+            return future.result(timeout=WRITE_TIMEOUT_S)
+        except TimeoutError:
+            if future.cancel():
+                raise TimeoutError(
+                    f"base de données occupée depuis {WRITE_TIMEOUT_S} s, rien n'a été enregistré"
+                ) from None
+        return future.result()
 
-def init_db():
+# --- Migrations du schéma, suivies par PRAGMA user_version ---
+def _migration_schema_initial(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS teachers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            salt TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS students (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            teacher_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(teacher_id, name),
+            FOREIGN KEY (teacher_id) REFERENCES teachers(id) ON DELETE CASCADE
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS observations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            teacher_id INTEGER NOT NULL,
+            domaine TEXT,
+            composante TEXT,
+            apprentissage TEXT,
+            mode TEXT,
+            observables_json TEXT,
+            commentaire TEXT,
+            activites_json TEXT,
+            competences_mobilisees_json TEXT,
+            processus_mobilises_json TEXT,
+            competence_mise_en_avant TEXT,
+            processus_mis_en_avant TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (teacher_id) REFERENCES teachers(id) ON DELETE CASCADE
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            teacher_id INTEGER NOT NULL,
+            token TEXT NOT NULL UNIQUE,
+            expires_at TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (teacher_id) REFERENCES teachers(id) ON DELETE CASCADE
+        );
+    """)
+
+def _migration_observation_items(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS observation_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            observation_id INTEGER NOT NULL,
+            student_id INTEGER NOT NULL,
+            observable TEXT NOT NULL,
+            level INTEGER,
+            occurrence INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (observation_id) REFERENCES observations(id) ON DELETE CASCADE,
+            FOREIGN KEY (student_id) REFERENCES students(id) ON DELETE CASCADE
+        );
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_observation_items_observation
+        ON observation_items (observation_id);
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_observation_items_student
+        ON observation_items (student_id, observable);
+    """)
+    # Normaliser les observations déjà enregistrées (reconstruction complète, idempotente)
+    cur.execute("DELETE FROM observation_items")
+    _backfill_observation_items(cur)
+
+def _migration_index_performance(cur) -> None:
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_observations_teacher_created
+        ON observations (teacher_id, created_at);
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sessions_expires
+        ON sessions (expires_at);
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_students_teacher_name
+        ON students (teacher_id, name COLLATE NOCASE);
+    """)
+
+def _migration_observations_fts(cur) -> None:
+    # Index plein texte (rowid = observations.id), insensible aux accents. L'enseignant est
+    # indexé comme un mot ("t<id>") de la requête MATCH: le filtre précède le classement
+    # bm25, où la colonne teacher a un poids nul
+    cur.execute("DROP TABLE IF EXISTS observations_fts")
+    cur.execute("""
+        CREATE VIRTUAL TABLE observations_fts USING fts5(
+            commentaire,
+            observables,
+            teacher,
+            tokenize = 'unicode61 remove_diacritics 2'
+        );
+    """)
+    cur.execute("INSERT INTO observations_fts (observations_fts, rank) VALUES ('rank', 'bm25(1.0, 1.0, 0.0)')")
+    cur.execute("SELECT id, teacher_id, commentaire, observables_json FROM observations WHERE teacher_id IS NOT NULL")
+    _index_observations_text(cur, [(oid, tid, com, _json_list(obs_json)) for oid, tid, com, obs_json in cur.fetchall()])
+
+def _migration_student_coverage(cur) -> None:
+    # Dernière observation par (élève, apprentissage), tenue à jour à l'écriture
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS student_coverage (
+            student_id INTEGER NOT NULL,
+            domaine TEXT NOT NULL,
+            composante TEXT NOT NULL,
+            apprentissage TEXT NOT NULL,
+            last_observed_at TEXT NOT NULL,
+            PRIMARY KEY (student_id, domaine, composante, apprentissage)
+        ) WITHOUT ROWID;
+    """)
+    cur.execute("DELETE FROM student_coverage")
+    cur.execute(_COVERAGE_UPSERT.format(where="1"))
+
+def _migration_progression_summary(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS progression_summary (
+            student_id INTEGER NOT NULL,
+            observable TEXT NOT NULL,
+            domaine TEXT NOT NULL,
+            composante TEXT NOT NULL,
+            apprentissage TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            non_evalue INTEGER NOT NULL,
+            n_0 INTEGER NOT NULL,
+            n_1 INTEGER NOT NULL,
+            n_2 INTEGER NOT NULL,
+            first_level INTEGER NOT NULL,
+            last_level INTEGER NOT NULL,
+            first_date TEXT,
+            last_date TEXT,
+            PRIMARY KEY (student_id, observable, domaine, composante, apprentissage)
+        ) WITHOUT ROWID;
+    """)
+    # Index couvrant pour les recalculs par (élève, observable): remplace idx_observation_items_student
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_observation_items_student_cover
+        ON observation_items (student_id, observable, observation_id, level, occurrence);
+    """)
+    cur.execute("DROP INDEX IF EXISTS idx_observation_items_student")
+    _rebuild_progression_summary(cur)
+
+def _migration_level_counts(cur) -> None:
+    # Comptes par (enseignant, jour, observable): les statistiques par période additionnent des jours
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS level_counts (
+            teacher_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            domaine TEXT NOT NULL,
+            composante TEXT NOT NULL,
+            apprentissage TEXT NOT NULL,
+            observable TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            non_evalue INTEGER NOT NULL,
+            n_0 INTEGER NOT NULL,
+            n_1 INTEGER NOT NULL,
+            n_2 INTEGER NOT NULL,
+            PRIMARY KEY (teacher_id, day, domaine, composante, apprentissage, observable)
+        ) WITHOUT ROWID;
+    """)
+    cur.execute("DELETE FROM level_counts")
+    _count_levels(cur, "1")
+
+# (version, description, fonction): ordre strict, ne jamais renuméroter une migration publiée
+MIGRATIONS = [
+    (1, "Schéma initial", _migration_schema_initial),
+    (2, "Table observation_items", _migration_observation_items),
+    (3, "Index de performance", _migration_index_performance),
+    (4, "Recherche plein texte", _migration_observations_fts),
+    (5, "Couverture des observations par élève", _migration_student_coverage),
+    (6, "Synthèse de progression par élève", _migration_progression_summary),
+    (7, "Comptes de niveaux par jour", _migration_level_counts),
+]
+
+def run_migrations() -> list[tuple[int, str, float]]:
+    """Applique les migrations manquantes, chacune dans sa propre transaction.
+
+    Retourne (version, description, durée en ms) pour chaque migration appliquée.
+    """
+    applied = []
     with get_conn() as conn:
         cur = conn.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS teachers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                email TEXT NOT NULL UNIQUE,
-                password_hash TEXT NOT NULL,
-                salt TEXT NOT NULL,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS students (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                teacher_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(teacher_id, name),
-                FOREIGN KEY (teacher_id) REFERENCES teachers(id) ON DELETE CASCADE
-            );
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS observations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                teacher_id INTEGER NOT NULL,
-                domaine TEXT,
-                composante TEXT,
-                apprentissage TEXT,
-                mode TEXT,
-                observables_json TEXT,
-                commentaire TEXT,
-                activites_json TEXT,
-                competences_mobilisees_json TEXT,
-                processus_mobilises_json TEXT,
-                competence_mise_en_avant TEXT,
-                processus_mis_en_avant TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (teacher_id) REFERENCES teachers(id) ON DELETE CASCADE
-            );
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                teacher_id INTEGER NOT NULL,
-                token TEXT NOT NULL UNIQUE,
-                expires_at TEXT NOT NULL,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (teacher_id) REFERENCES teachers(id) ON DELETE CASCADE
-            );
-        """)
-        conn.commit()
+        for version, description, migrate in MIGRATIONS:
+            t0 = time.perf_counter()
+            # Verrou d'écriture avant de relire la version: un autre processus a pu migrer
+            cur.execute("BEGIN IMMEDIATE")
+            cur.execute("PRAGMA user_version")
+            if cur.fetchone()[0] >= version:
+                conn.rollback()
+                continue
+            try:
+                migrate(cur)
+                cur.execute(f"PRAGMA user_version = {int(version)}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            duration_ms = (time.perf_counter() - t0) * 1000
+            logger.info("Migration %d (%s) appliquée en %.1f ms", version, description, duration_ms)
+            applied.append((version, description, duration_ms))
+    return applied
+
+def init_db() -> list[tuple[int, str, float]]:
+    return run_migrations()
 
 def _hash_password(password: str, salt_hex: str | None = None) -> tuple[str, str]:
     if not salt_hex:
@@ -460,16 +1563,15 @@ def create_teacher(name: str, email: str, password: str) -> tuple[bool, str | No
     if not name or not email or not password:
         return False, "Veuillez renseigner nom, email et mot de passe.", None
     pwd_hash, salt_hex = _hash_password(password)
+    def _tx(cur):
+        cur.execute(
+            "INSERT INTO teachers (name, email, password_hash, salt) VALUES (?, ?, ?, ?)",
+            (name, email, pwd_hash, salt_hex),
+        )
+        return cur.lastrowid
     try:
-        with get_conn() as conn:
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO teachers (name, email, password_hash, salt) VALUES (?, ?, ?, ?)",
-                (name, email, pwd_hash, salt_hex),
-            )
-            teacher_id = cur.lastrowid
-            conn.commit()
-            return True, None, {"id": teacher_id, "name": name, "email": email}
+        teacher_id = run_write(_tx)
+        return True, None, {"id": teacher_id, "name": name, "email": email}
     except sqlite3.IntegrityError:
         return False, "Cet email est déjà utilisé.", None
     except Exception as e:
@@ -498,235 +1600,1339 @@ def list_students_db(teacher_id: int) -> list[dict]:
         cur.execute("SELECT id, name FROM students WHERE teacher_id = ? ORDER BY name COLLATE NOCASE", (teacher_id,))
         return [{"id": r[0], "name": r[1]} for r in cur.fetchall()]
 
+def student_name_error(name: str) -> str | None:
+    """Motif de refus d'un nom d'élève, ou None s'il peut figurer dans un résultat d'observable.
+
+    Les virgules et parenthèses délimitent la liste "Classe (sauf A, B)", et le nom
+    "Classe" désigne toute la classe: ces noms ne se relisent pas à l'identique.
+    """
+    if any(c in name for c in ",()"):
+        return f"Nom d'élève invalide ({name}): virgules et parenthèses ne sont pas acceptées."
+    if _CLASSE_RE.match(name):
+        return f"Nom d'élève invalide ({name}): « Classe » désigne toute la classe."
+    return None
+
 def add_student_db(teacher_id: int, name: str) -> tuple[bool, str | None]:
     name = (name or "").strip()
     if not name:
         return False, "Nom d'élève requis."
+    invalid = student_name_error(name)
+    if invalid:
+        return False, invalid
     try:
-        with get_conn() as conn:
-            cur = conn.cursor()
-            cur.execute("INSERT OR IGNORE INTO students (teacher_id, name) VALUES (?, ?)", (teacher_id, name))
-            conn.commit()
+        run_write(lambda cur: cur.execute("INSERT OR IGNORE INTO students (teacher_id, name) VALUES (?, ?)", (teacher_id, name)))
+        get_roster_cache().invalidate(teacher_id)
         return True, None
     except Exception as e:
         return False, f"Erreur lors de l'ajout: {e}"
 
+def add_students_db(teacher_id: int, names: list[str]) -> tuple[int, str | None]:
+    # Ajout en lot: une transaction, une seule invalidation du cache de classe
+    names = [n.strip() for n in names if n and n.strip()]
+    if not names:
+        return 0, None
+    invalid = [err for err in map(student_name_error, names) if err]
+    if invalid:
+        return 0, " ".join(invalid)
+    def _tx(cur):
+        cur.executemany(
+            "INSERT OR IGNORE INTO students (teacher_id, name) VALUES (?, ?)",
+            [(teacher_id, n) for n in names],
+        )
+        return cur.rowcount
+    try:
+        added = run_write(_tx)
+        get_roster_cache().invalidate(teacher_id)
+        return added, None
+    except Exception as e:
+        return 0, f"Erreur lors de l'ajout: {e}"
+
 def delete_student_db(teacher_id: int, student_id: int) -> tuple[bool, str | None]:
+    def _tx(cur):
+        cur.execute("DELETE FROM students WHERE id = ? AND teacher_id = ?", (student_id, teacher_id))
+        if cur.rowcount:
+            _count_levels(cur, "i.student_id = ?", (student_id,), sign=-1)
+            cur.execute("DELETE FROM observation_items WHERE student_id = ?", (student_id,))
+            cur.execute("DELETE FROM student_coverage WHERE student_id = ?", (student_id,))
+            cur.execute("DELETE FROM progression_summary WHERE student_id = ?", (student_id,))
     try:
-        with get_conn() as conn:
-            cur = conn.cursor()
-            cur.execute("DELETE FROM students WHERE id = ? AND teacher_id = ?", (student_id, teacher_id))
-            conn.commit()
+        run_write(_tx)
+        get_roster_cache().invalidate(teacher_id)
+        get_progression_cache().invalidate(teacher_id)
         return True, None
     except Exception as e:
         return False, f"Suppression impossible: {e}"
 
-def delete_observation_db(obs_id: int, teacher_id: int) -> tuple[bool, str | None]:
+# --- Cache des classes: liste d'élèves par enseignant, invalidée à l'écriture ---
+class Roster(NamedTuple):
+    version: int
+    students: tuple[Mapping[str, Any], ...]  # triés par nom, non modifiables
+    names: tuple[str, ...]
+
+class RosterCache:
+    """Classes chargées une fois par enseignant et partagées par ses sessions.
+
+    Chaque écriture (ajout, suppression) incrémente la version de l'enseignant;
+    une entrée n'est servie que si elle a été lue à la version courante.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: dict[int, int] = {}
+        self._entries: dict[int, Roster] = {}
+
+    def get(self, teacher_id: int) -> Roster:
+        with self._lock:
+            version = self._versions.get(teacher_id, 0)
+            entry = self._entries.get(teacher_id)
+        if entry is not None and entry.version == version:
+            return entry
+        students = tuple(MappingProxyType(s) for s in list_students_db(teacher_id))
+        entry = Roster(version, students, tuple(s["name"] for s in students))
+        with self._lock:
+            # Ne pas mémoriser une lecture devenue obsolète pendant le chargement
+            if self._versions.get(teacher_id, 0) == version:
+                self._entries[teacher_id] = entry
+        return entry
+
+    def invalidate(self, teacher_id: int) -> None:
+        with self._lock:
+            self._versions[teacher_id] = self._versions.get(teacher_id, 0) + 1
+            self._entries.pop(teacher_id, None)
+
+@st.cache_resource
+def get_roster_cache() -> RosterCache:
+    return RosterCache()
+
+def get_roster(teacher_id: int) -> Roster:
+    return get_roster_cache().get(teacher_id)
+
+# --- Chaînes de résultat "Sujet: niveau - observable" (analyse et mise en forme) ---
+NIVEAUX = [
+    "🌰 Encore en train de germer",
+    "🌱 En train de grandir",
+    "🌸 Épanoui(e)",
+]
+
+class ObservableResult(NamedTuple):
+    """Item d'observation analysé.
+
+    kind vaut "classe", "eleve", ou "" quand l'item n'est rattaché à personne
+    (observable planifié, ou ancien format "niveau - observable").
+    """
+    kind: str
+    students: tuple[str, ...]
+    excluded: tuple[str, ...]
+    level: int | None
+    observable: str
+    value: str = ""
+
+    @property
+    def evaluated(self) -> bool:
+        return bool(self.value)
+
+    @property
+    def subject(self) -> str:
+        # Libellé du sujet tel qu'affiché dans les fiches
+        if self.kind == "eleve":
+            return self.students[0]
+        if self.excluded:
+            return f"Classe (sauf {', '.join(self.excluded)})"
+        return "Classe"
+
+# Le niveau et l'observable ne contiennent ni " - " ni ":" (référentiel): on coupe au dernier
+# séparateur, si bien qu'un nom d'élève peut en contenir
+_RESULT_RE = re.compile(r"^\s*(?P<head>.*)\s+-\s+(?P<observable>.*?)\s*$", re.DOTALL)
+_CLASSE_RE = re.compile(r"^classe\b(?:\s*\(\s*sauf\s+(?P<excluded>[^)]*?)\s*\)?)?\s*:?$", re.IGNORECASE)
+_LEVEL_KEYS = (
+    (re.compile(r"germer|🌰", re.IGNORECASE), 0),
+    (re.compile(r"grandir|🌱", re.IGNORECASE), 1),
+    (re.compile(r"épanoui|🌸", re.IGNORECASE), 2),
+)
+
+def _level_index(value: str) -> int | None:
+    for pattern, level in _LEVEL_KEYS:
+        if pattern.search(value):
+            return level
+    return None
+
+@functools.lru_cache(maxsize=8192)
+def parse_observable_result(raw: str) -> ObservableResult:
+    """Analyse "Classe: niveau - obs", "Classe (sauf A, B): niveau - obs", "Nom: niveau - obs" ou "obs"."""
+    m = _RESULT_RE.match(raw)
+    if m is None:
+        return ObservableResult("", (), (), None, raw.strip())
+    head, observable = m.group("head"), m.group("observable")
+    subject, sep, value = head.rpartition(":")
+    subject, value = subject.strip(), value.strip()
+    if not sep and _CLASSE_RE.match(value.split(" ", 1)[0]):
+        # Ancien format "Classe niveau - obs", sans deux-points
+        subject, value = "Classe", value[len("classe"):].strip()
+    classe = _CLASSE_RE.match(subject) if subject else None
+    if classe:
+        excl = classe.group("excluded") or ""
+        excluded = tuple(e.strip() for e in excl.split(",") if e.strip())
+        return ObservableResult("classe", (), excluded, _level_index(value), observable, value)
+    if subject:
+        return ObservableResult("eleve", (subject,), (), _level_index(value), observable, value)
+    return ObservableResult("", (), (), _level_index(value), observable, value)
+
+def format_observable_result(value: str, observable: str, student: str | None = None, excluded=()) -> str:
+    """Inverse de parse_observable_result: student None désigne toute la classe (sauf excluded)."""
+    if student is not None:
+        return f"{student}: {value} - {observable}"
+    if excluded:
+        return f"Classe (sauf {', '.join(excluded)}): {value} - {observable}"
+    return f"Classe: {value} - {observable}"
+
+# --- Résultats d'observables normalisés (une ligne par élève et observable) ---
+def _observation_item_rows(obs_id: int, observables: list[str], roster: dict[str, int]) -> list[tuple]:
+    # roster: nom d'élève -> id, pour la classe de l'enseignant au moment de l'écriture
+    rows = []
+    occurrences: dict[tuple[int, str], int] = {}
+    for item in observables or []:
+        res = parse_observable_result(str(item))
+        if res.kind == "classe":
+            targets = [sid for name, sid in roster.items() if name not in res.excluded]
+        elif res.kind == "eleve" and res.students[0] in roster:
+            targets = [roster[res.students[0]]]
+        else:
+            continue
+        for sid in targets:
+            occ = occurrences.get((sid, res.observable), 0)
+            occurrences[(sid, res.observable)] = occ + 1
+            rows.append((obs_id, sid, res.observable, res.level, occ))
+    return rows
+
+def _insert_observation_items(cur, rows: list[tuple]) -> None:
+    if rows:
+        cur.executemany(
+            "INSERT INTO observation_items (observation_id, student_id, observable, level, occurrence) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+
+def _write_observation_items(cur, obs_id: int, observables: list[str], roster: dict[str, int]) -> None:
+    _insert_observation_items(cur, _observation_item_rows(obs_id, observables, roster))
+
+# --- Couverture: dernière observation par élève et apprentissage (table student_coverage) ---
+_COVERAGE_UPSERT = """
+    INSERT INTO student_coverage (student_id, domaine, composante, apprentissage, last_observed_at)
+    SELECT i.student_id, COALESCE(o.domaine, ''), COALESCE(o.composante, ''), COALESCE(o.apprentissage, ''),
+           MAX(o.created_at)
+    FROM observation_items i
+    JOIN observations o ON o.id = i.observation_id
+    WHERE {where}
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (student_id, domaine, composante, apprentissage)
+    DO UPDATE SET last_observed_at = MAX(last_observed_at, excluded.last_observed_at)
+"""
+
+def _cover_observations(cur, first_id: int, last_id: int) -> None:
+    # Ajouts: les nouvelles dates ne peuvent que repousser la dernière observation
+    cur.execute(_COVERAGE_UPSERT.format(where="i.observation_id BETWEEN ? AND ?"), (first_id, last_id))
+
+def _coverage_keys(cur, obs_id: int) -> list[tuple[int, str, str, str]]:
+    # À relever avant de modifier ou supprimer l'observation
+    cur.execute(
+        """
+        SELECT DISTINCT i.student_id, COALESCE(o.domaine, ''), COALESCE(o.composante, ''), COALESCE(o.apprentissage, '')
+        FROM observation_items i
+        JOIN observations o ON o.id = i.observation_id
+        WHERE i.observation_id = ?
+        """,
+        (obs_id,),
+    )
+    return cur.fetchall()
+
+def _recompute_coverage(cur, keys: list[tuple[int, str, str, str]]) -> None:
+    # Modification ou suppression: recalculer chaque (élève, apprentissage) touché depuis
+    # progression_summary, déjà à jour (quelques lignes par élève au lieu de tout son historique)
+    if not keys:
+        return
+    cur.executemany(
+        "DELETE FROM student_coverage WHERE student_id = ? AND domaine = ? AND composante = ? AND apprentissage = ?",
+        keys,
+    )
+    cur.executemany(
+        """
+        INSERT INTO student_coverage (student_id, domaine, composante, apprentissage, last_observed_at)
+        SELECT ?1, ?2, ?3, ?4, MAX(last_date)
+        FROM progression_summary
+        WHERE student_id = ?1 AND domaine = ?2 AND composante = ?3 AND apprentissage = ?4
+        HAVING MAX(last_date) IS NOT NULL
+        """,
+        keys,
+    )
+
+# --- Synthèse matérialisée: une ligne par (élève, apprentissage, observable), tenue à jour à l'écriture ---
+_SUMMARY_REFRESH = """
+    WITH items AS (
+        SELECT i.student_id, i.observable, COALESCE(o.domaine, '') AS domaine,
+               COALESCE(o.composante, '') AS composante, COALESCE(o.apprentissage, '') AS apprentissage,
+               i.level, o.created_at,
+               -- Clé chronologique suivie du niveau (un chiffre): MIN/MAX donnent le premier/dernier niveau évalué
+               CASE WHEN i.level IS NOT NULL
+                    THEN o.created_at || printf('%010d%04d', o.id, i.occurrence) || i.level END AS keyed_level
+        FROM observation_items i
+        JOIN observations o ON o.id = i.observation_id
+        WHERE {where}
+    )
+    INSERT INTO progression_summary (
+        student_id, observable, domaine, composante, apprentissage,
+        count, non_evalue, n_0, n_1, n_2, first_level, last_level, first_date, last_date
+    )
+    SELECT student_id, observable, domaine, composante, apprentissage,
+           COUNT(*), SUM(level IS NULL), SUM(level IS 0), SUM(level IS 1), SUM(level IS 2),
+           COALESCE(CAST(substr(MIN(keyed_level), -1) AS INTEGER), -1),
+           COALESCE(CAST(substr(MAX(keyed_level), -1) AS INTEGER), -1),
+           MIN(created_at), MAX(created_at)
+    FROM items
+    GROUP BY student_id, observable, domaine, composante, apprentissage
+    {on_conflict}
+"""
+
+# Ajout d'observations postérieures: cumuler les compteurs, le dernier niveau évalué l'emporte
+_SUMMARY_FOLD = """
+    ON CONFLICT (student_id, observable, domaine, composante, apprentissage) DO UPDATE SET
+        count = count + excluded.count,
+        non_evalue = non_evalue + excluded.non_evalue,
+        n_0 = n_0 + excluded.n_0,
+        n_1 = n_1 + excluded.n_1,
+        n_2 = n_2 + excluded.n_2,
+        first_level = CASE WHEN first_level < 0 THEN excluded.first_level ELSE first_level END,
+        last_level = CASE WHEN excluded.last_level >= 0 THEN excluded.last_level ELSE last_level END,
+        first_date = MIN(first_date, excluded.first_date),
+        last_date = MAX(last_date, excluded.last_date)
+"""
+
+def _summary_keys(cur, first_id: int, last_id: int) -> list[tuple[int, str]]:
+    # (élève, observable) touchés par les observations first_id..last_id
+    cur.execute(
+        "SELECT DISTINCT student_id, observable FROM observation_items WHERE observation_id BETWEEN ? AND ?",
+        (first_id, last_id),
+    )
+    return cur.fetchall()
+
+def _refresh_progression_summary(cur, keys) -> None:
+    # Recalcul de chaque (élève, observable) depuis ses items: index (student_id, observable)
+    keys = list(set(keys))
+    if not keys:
+        return
+    cur.executemany("DELETE FROM progression_summary WHERE student_id = ? AND observable = ?", keys)
+    cur.executemany(_SUMMARY_REFRESH.format(where="i.student_id = ?1 AND i.observable = ?2", on_conflict=""), keys)
+
+def _fold_progression_summary(cur, first_id: int, last_id: int) -> None:
+    """Intègre les observations first_id..last_id qui viennent d'être ajoutées.
+
+    Le cumul suppose qu'elles sont postérieures à l'existant; les (élève, observable)
+    déjà observés plus tard (horodatage antérieur) sont recalculés entièrement.
+    """
+    cur.execute(
+        """
+        SELECT DISTINCT b.student_id, b.observable
+        FROM (
+            SELECT i.student_id, i.observable, MIN(o.created_at) AS first_date
+            FROM observation_items i
+            JOIN observations o ON o.id = i.observation_id
+            WHERE i.observation_id BETWEEN ? AND ?
+            GROUP BY i.student_id, i.observable
+        ) b
+        JOIN progression_summary p ON p.student_id = b.student_id AND p.observable = b.observable
+        WHERE b.first_date < p.last_date
+        """,
+        (first_id, last_id),
+    )
+    stale = cur.fetchall()
+    cur.execute(
+        _SUMMARY_REFRESH.format(where="i.observation_id BETWEEN ?1 AND ?2", on_conflict=_SUMMARY_FOLD),
+        (first_id, last_id),
+    )
+    _refresh_progression_summary(cur, stale)
+
+def _rebuild_progression_summary(cur) -> int:
+    cur.execute("DELETE FROM progression_summary")
+    cur.execute(_SUMMARY_REFRESH.format(where="1", on_conflict=""))
+    cur.execute("SELECT COUNT(*) FROM progression_summary")
+    return cur.fetchone()[0]
+
+def _rebuild_teacher_summary(cur, teacher_id: int) -> int:
+    cur.execute(
+        "DELETE FROM progression_summary WHERE student_id IN (SELECT id FROM students WHERE teacher_id = ?)",
+        (teacher_id,),
+    )
+    cur.execute(_SUMMARY_REFRESH.format(where="o.teacher_id = ?1", on_conflict=""), (teacher_id,))
+    cur.execute("SELECT changes()")  # rowcount vaut -1 pour une requête WITH ... INSERT
+    return cur.fetchone()[0]
+
+def rebuild_progression_summary() -> tuple[bool, str | None, int]:
+    """Reconstruit progression_summary depuis observation_items (réparation).
+
+    Une transaction par enseignant: les écritures des autres sessions passent
+    entre deux classes au lieu d'attendre la reconstruction de toute l'école.
+    """
+    try:
+        with get_conn() as conn:
+            teacher_ids = [r[0] for r in conn.execute("SELECT id FROM teachers ORDER BY id")]
+        rows = 0
+        for teacher_id in teacher_ids:
+            rows += run_write(functools.partial(_rebuild_teacher_summary, teacher_id=teacher_id))
+        # Lignes d'élèves supprimés entre-temps
+        run_write(lambda cur: cur.execute(
+            "DELETE FROM progression_summary WHERE student_id NOT IN (SELECT id FROM students)"
+        ))
+        return True, None, rows
+    except Exception as e:
+        return False, f"Reconstruction impossible: {e}", 0
+
+# --- Comptes de niveaux par jour (table level_counts, additive: +1 à l'ajout, -1 au retrait) ---
+_LEVEL_COUNTS_SOURCE = """
+    SELECT o.teacher_id, substr(o.created_at, 1, 10), COALESCE(o.domaine, ''), COALESCE(o.composante, ''),
+           COALESCE(o.apprentissage, ''), i.observable{aggregates}
+    FROM observation_items i
+    JOIN observations o ON o.id = i.observation_id
+    WHERE {where}
+    GROUP BY 1, 2, 3, 4, 5, 6
+"""
+
+def _count_levels(cur, where: str, params: tuple = (), sign: int = 1) -> None:
+    """Ajoute (sign=1) ou retire (sign=-1) les items sélectionnés par where des comptes journaliers.
+
+    À appeler avant de supprimer ou de modifier les items et observations concernés.
+    """
+    aggregates = f", {sign} * COUNT(*), {sign} * SUM(i.level IS NULL), " + ", ".join(
+        f"{sign} * SUM(i.level IS {n})" for n in range(len(NIVEAUX))
+    )
+    cur.execute(
+        f"""
+        INSERT INTO level_counts (
+            teacher_id, day, domaine, composante, apprentissage, observable, count, non_evalue, n_0, n_1, n_2
+        )
+        {_LEVEL_COUNTS_SOURCE.format(aggregates=aggregates, where=where)}
+        ON CONFLICT (teacher_id, day, domaine, composante, apprentissage, observable) DO UPDATE SET
+            count = count + excluded.count,
+            non_evalue = non_evalue + excluded.non_evalue,
+            n_0 = n_0 + excluded.n_0,
+            n_1 = n_1 + excluded.n_1,
+            n_2 = n_2 + excluded.n_2
+        """,
+        params,
+    )
+    if sign < 0:
+        # Supprimer les lignes retombées à zéro (recherche par clé primaire)
+        cur.execute(
+            f"""
+            DELETE FROM level_counts
+            WHERE count = 0
+              AND (teacher_id, day, domaine, composante, apprentissage, observable) IN (
+                  {_LEVEL_COUNTS_SOURCE.format(aggregates="", where=where)}
+              )
+            """,
+            params,
+        )
+
+# --- Recherche plein texte (table FTS5 observations_fts, synchronisée à l'écriture) ---
+def _fts_teacher(teacher_id: int) -> str:
+    return f"t{int(teacher_id)}"
+
+def _index_observations_text(cur, rows: list[tuple[int, int, str | None, list[str]]]) -> None:
+    # rows: (id d'observation, id d'enseignant, commentaire, observables)
+    if rows:
+        cur.executemany(
+            "INSERT INTO observations_fts (rowid, commentaire, observables, teacher) VALUES (?, ?, ?, ?)",
+            [
+                (oid, com or "", "\n".join(str(o) for o in observables or []), _fts_teacher(tid))
+                for oid, tid, com, observables in rows
+            ],
+        )
+
+def _unindex_observation_text(cur, obs_id: int) -> None:
+    cur.execute("DELETE FROM observations_fts WHERE rowid = ?", (obs_id,))
+
+def _fts_query(text: str) -> str:
+    # Chaque mot devient un préfixe entre guillemets: pas d'erreur de syntaxe FTS5 possible
+    return " ".join(f'"{term}"*' for term in re.findall(r"\w+", text or ""))
+
+def search_observations(teacher_id: int, text: str, limit: int = 20) -> list[dict]:
+    """Observations de l'enseignant contenant tous les mots de text (préfixes), les plus pertinentes d'abord."""
+    query = _fts_query(text)
+    if not query:
+        return []
     try:
         with get_conn() as conn:
             cur = conn.cursor()
             cur.execute(
-                "DELETE FROM observations WHERE id = ? AND teacher_id = ?",
-                (obs_id, teacher_id)
+                """
+                SELECT o.id, o.created_at, o.apprentissage,
+                       snippet(observations_fts, 0, '**', '**', '…', 12),
+                       snippet(observations_fts, 1, '**', '**', '…', 12)
+                FROM observations_fts
+                JOIN observations o ON o.id = observations_fts.rowid
+                WHERE observations_fts MATCH ?
+                ORDER BY rank
+                LIMIT ?
+                """,
+                (f'teacher : "{_fts_teacher(teacher_id)}" AND ({query})', limit),
             )
-            if cur.rowcount == 0:
-                return False, "Aucune observation correspondante à supprimer."
-            conn.commit()
-            return True, None
+            # Extrait du commentaire s'il contient un des mots, sinon des observables
+            return [
+                {"db_id": oid, "created_at": created_at or "", "Apprentissage": appr or "",
+                 "snippet": snip_com if "**" in snip_com else snip_obs}
+                for oid, created_at, appr, snip_com, snip_obs in cur.fetchall()
+            ]
+    except Exception:
+        return []
+
+# Encodeur réutilisé: json.dumps(..., ensure_ascii=False) en recrée un à chaque appel
+_json_encode = json.JSONEncoder(ensure_ascii=False).encode
+
+def _observation_values(obs: dict) -> tuple:
+    # Colonnes de contenu d'une observation, dans l'ordre des requêtes INSERT/UPDATE
+    return (
+        obs.get("Domaine"),
+        obs.get("Composante"),
+        obs.get("Apprentissage"),
+        obs.get("Mode"),
+        _json_encode(obs.get("Observables") or []),
+        obs.get("Commentaire") or "",
+        _json_encode(obs.get("Activités") or []),
+        _json_encode(obs.get("Compétences_mobilisées") or []),
+        _json_encode(obs.get("Processus_mobilisés") or []),
+        obs.get("Compétence_mise_en_avant") or "",
+        obs.get("Processus_mis_en_avant") or "",
+    )
+
+def _roster(cur, teacher_id: int) -> dict[str, int]:
+    cur.execute("SELECT name, id FROM students WHERE teacher_id = ?", (teacher_id,))
+    return dict(cur.fetchall())
+
+def _backfill_observation_items(cur) -> None:
+    rosters: dict[int, dict[str, int]] = {}
+    cur.execute("SELECT id, teacher_id, observables_json FROM observations WHERE teacher_id IS NOT NULL")
+    for obs_id, teacher_id, obs_json in cur.fetchall():
+        if teacher_id not in rosters:
+            rosters[teacher_id] = _roster(cur, teacher_id)
+        _write_observation_items(cur, obs_id, _json_list(obs_json), rosters[teacher_id])
+
+def delete_observation_db(obs_id: int, teacher_id: int) -> tuple[bool, str | None]:
+    def _tx(cur):
+        keys = _coverage_keys(cur, obs_id)
+        summary_keys = _summary_keys(cur, obs_id, obs_id)
+        _count_levels(cur, "o.id = ? AND o.teacher_id = ?", (obs_id, teacher_id), sign=-1)
+        cur.execute(
+            "DELETE FROM observations WHERE id = ? AND teacher_id = ?",
+            (obs_id, teacher_id)
+        )
+        if cur.rowcount == 0:
+            return False
+        cur.execute("DELETE FROM observation_items WHERE observation_id = ?", (obs_id,))
+        _refresh_progression_summary(cur, summary_keys)
+        _recompute_coverage(cur, keys)
+        _unindex_observation_text(cur, obs_id)
+        return True
+    try:
+        if not run_write(_tx):
+            return False, "Aucune observation correspondante à supprimer."
+        get_progression_cache().invalidate(teacher_id)
+        return True, None
     except Exception as e:
         return False, f"Suppression observation impossible: {e}"
 
 def save_observation_db(obs: dict, teacher_id: int) -> tuple[bool, str | None, int | None]:
+    values = (teacher_id, *_observation_values(obs))
+    def _tx(cur):
+        cur.execute(
+            """
+            INSERT INTO observations (
+                teacher_id, domaine, composante, apprentissage, mode,
+                observables_json, commentaire, activites_json,
+                competences_mobilisees_json, processus_mobilises_json,
+                competence_mise_en_avant, processus_mis_en_avant
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            values,
+        )
+        obs_id = cur.lastrowid
+        _write_observation_items(cur, obs_id, obs.get("Observables") or [], _roster(cur, teacher_id))
+        _fold_progression_summary(cur, obs_id, obs_id)
+        _cover_observations(cur, obs_id, obs_id)
+        _count_levels(cur, "i.observation_id = ?", (obs_id,))
+        _index_observations_text(cur, [(obs_id, teacher_id, obs.get("Commentaire"), obs.get("Observables"))])
+        return obs_id
     try:
-        with get_conn() as conn:
-            cur = conn.cursor()
-            cur.execute(
+        obs_id = run_write(_tx)
+        get_progression_cache().note_added(teacher_id)
+        return True, None, obs_id
+    except Exception as e:
+        return False, f"Erreur enregistrement observation: {e}", None
+
+def update_observation_db(obs_id: int, obs: dict, teacher_id: int) -> tuple[bool, str | None]:
+    """Met à jour une observation existante en base de données"""
+    values = (*_observation_values(obs), obs_id, teacher_id)
+    def _tx(cur):
+        keys = _coverage_keys(cur, obs_id)
+        summary_keys = _summary_keys(cur, obs_id, obs_id)
+        _count_levels(cur, "o.id = ? AND o.teacher_id = ?", (obs_id, teacher_id), sign=-1)
+        cur.execute(
+            """
+            UPDATE observations SET
+                domaine = ?,
+                composante = ?,
+                apprentissage = ?,
+                mode = ?,
+                observables_json = ?,
+                commentaire = ?,
+                activites_json = ?,
+                competences_mobilisees_json = ?,
+                processus_mobilises_json = ?,
+                competence_mise_en_avant = ?,
+                processus_mis_en_avant = ?
+            WHERE id = ? AND teacher_id = ?
+            """,
+            values,
+        )
+        if cur.rowcount == 0:
+            return False
+        cur.execute("DELETE FROM observation_items WHERE observation_id = ?", (obs_id,))
+        _write_observation_items(cur, obs_id, obs.get("Observables") or [], _roster(cur, teacher_id))
+        _refresh_progression_summary(cur, summary_keys + _summary_keys(cur, obs_id, obs_id))
+        _recompute_coverage(cur, keys)
+        _cover_observations(cur, obs_id, obs_id)
+        _count_levels(cur, "i.observation_id = ?", (obs_id,))
+        _unindex_observation_text(cur, obs_id)
+        _index_observations_text(cur, [(obs_id, teacher_id, obs.get("Commentaire"), obs.get("Observables"))])
+        return True
+    try:
+        if not run_write(_tx):
+            return False, "Aucune observation correspondante à mettre à jour."
+        get_progression_cache().invalidate(teacher_id)
+        return True, None
+    except Exception as e:
+        return False, f"Erreur mise à jour observation: {e}"
+
+def save_observations_bulk(observations: list[dict], teacher_id: int) -> tuple[bool, str | None, list[int] | None, str | None]:
+    # Enregistre en lot avec le même horodatage pour regroupement
+    try:
+        saved_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Sérialisation JSON en une passe, avant d'ouvrir la transaction
+        rows = [(teacher_id, *_observation_values(obs), saved_at) for obs in observations]
+        if not rows:
+            return True, None, [], saved_at
+        def _tx(cur):
+            # Le thread écrivain détient le verrou d'écriture: les id AUTOINCREMENT du lot sont consécutifs
+            roster = _roster(cur, teacher_id)
+            cur.executemany(
                 """
                 INSERT INTO observations (
                     teacher_id, domaine, composante, apprentissage, mode,
                     observables_json, commentaire, activites_json,
                     competences_mobilisees_json, processus_mobilises_json,
-                    competence_mise_en_avant, processus_mis_en_avant
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    competence_mise_en_avant, processus_mis_en_avant, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                 """,
-                (
-                    teacher_id,
-                    obs.get("Domaine"),
-                    obs.get("Composante"),
-                    obs.get("Apprentissage"),
-                    obs.get("Mode"),
-                    json.dumps(obs.get("Observables") or [], ensure_ascii=False),
-                    obs.get("Commentaire") or "",
-                    json.dumps(obs.get("Activités") or [], ensure_ascii=False),
-                    json.dumps(obs.get("Compétences_mobilisées") or [], ensure_ascii=False),
-                    json.dumps(obs.get("Processus_mobilisés") or [], ensure_ascii=False),
-                    obs.get("Compétence_mise_en_avant") or "",
-                    obs.get("Processus_mis_en_avant") or "",
-                ),
+                rows,
             )
-            obs_id = cur.lastrowid
-            conn.commit()
-            return True, None, obs_id
+            cur.execute("SELECT seq FROM sqlite_sequence WHERE name = 'observations'")
+            last_id = cur.fetchone()[0]
+            ids = list(range(last_id - len(rows) + 1, last_id + 1))
+            item_rows = []
+            for oid, obs in zip(ids, observations):
+                item_rows.extend(_observation_item_rows(oid, obs.get("Observables") or [], roster))
+            _insert_observation_items(cur, item_rows)
+            _fold_progression_summary(cur, ids[0], ids[-1])
+            _cover_observations(cur, ids[0], ids[-1])
+            _count_levels(cur, "i.observation_id BETWEEN ? AND ?", (ids[0], ids[-1]))
+            _index_observations_text(cur, [
+                (oid, teacher_id, obs.get("Commentaire"), obs.get("Observables")) for oid, obs in zip(ids, observations)
+            ])
+            return ids
+        ids = run_write(_tx)
+        get_progression_cache().note_added(teacher_id)
+        return True, None, ids, saved_at
     except Exception as e:
-        return False, f"Erreur enregistrement observation: {e}", None
+        return False, f"Erreur enregistrement en lot: {e}", None, None
 
-def update_observation_db(obs_id: int, obs: dict, teacher_id: int) -> tuple[bool, str | None]:
-    """Met à jour une observation existante en base de données"""
+def get_observation_timestamps(teacher_id: int) -> list[tuple[str, int]]:
+    try:
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT created_at, COUNT(*) as n
+                FROM observations
+                WHERE teacher_id = ?
+                GROUP BY created_at
+                ORDER BY created_at DESC
+                """,
+                (teacher_id,),
+            )
+            rows = cur.fetchall()
+            return [(r[0], r[1]) for r in rows]
+    except Exception:
+        return []
+
+OBSERVATION_COLUMNS = """
+    id, domaine, composante, apprentissage, mode,
+    observables_json, commentaire, activites_json,
+    competences_mobilisees_json, processus_mobilises_json,
+    competence_mise_en_avant, processus_mis_en_avant, created_at
+"""
+
+def _json_list(raw: str | None) -> list:
+    try:
+        return json.loads(raw) if raw else []
+    except Exception:
+        return []
+
+def _row_to_observation(r: tuple) -> dict:
+    (oid, domaine, composante, apprentissage, mode, obs_json, com, act_json,
+     comp_json, proc_json, comp_av, proc_av, created_at_val) = r
+    return {
+        "db_id": oid,
+        "Domaine": domaine or "",
+        "Composante": composante or "",
+        "Apprentissage": apprentissage or "",
+        "Mode": mode or "",
+        "Observables": _json_list(obs_json),
+        "Commentaire": com or "",
+        "Activités": _json_list(act_json),
+        "Compétences_mobilisées": _json_list(comp_json),
+        "Processus_mobilisés": _json_list(proc_json),
+        "Compétence_mise_en_avant": comp_av or "",
+        "Processus_mis_en_avant": proc_av or "",
+        "created_at": created_at_val or "",
+    }
+
+def get_observations_by_timestamp(teacher_id: int, created_at: str) -> list[dict]:
+    try:
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"""
+                SELECT {OBSERVATION_COLUMNS}
+                FROM observations
+                WHERE teacher_id = ? AND created_at = ?
+                ORDER BY id ASC
+                """,
+                (teacher_id, created_at),
+            )
+            rows = cur.fetchall()
+        with profile_phase("Analyse"):
+            return [_row_to_observation(r) for r in rows]
+    except Exception:
+        return []
+
+def _day_bounds(start: date, end: date) -> tuple[str, str]:
+    # Bornes [début, lendemain de fin[ comparables aux created_at "YYYY-MM-DD HH:MM:SS"
+    return f"{start.isoformat()} 00:00:00", f"{(end + timedelta(days=1)).isoformat()} 00:00:00"
+
+# --- Moteur de progression (résultats de la période en colonnes NumPy/pandas) ---
+PROGRESSION_KEYS = ["eleve", "Domaine", "Composante", "Apprentissage", "observable"]
+PROGRESSION_COLUMNS = ["observation_id", *PROGRESSION_KEYS, "niveau", "date", "commentaire"]
+NON_EVALUE = -1  # niveau des items sans valeur, pour garder une colonne entière
+
+def niveau_label(level: int) -> str:
+    return NIVEAUX[level] if 0 <= level < len(NIVEAUX) else "Non évalué"
+
+def _appr_key(domaine: pd.Series, composante: pd.Series, apprentissage: pd.Series) -> pd.Series:
+    # Libellé "Domaine – Composante – Apprentissage" utilisé par le tableau de bord et le PDF
+    key = domaine + " – " + composante + " – " + apprentissage
+    return key.where(apprentissage != "", "(non renseigné)")
+
+def get_progression_frame(teacher_id: int, start: date, end: date, after_id: int = 0,
+                          student_id: int | None = None) -> pd.DataFrame:
+    """Une ligne par (observation, élève, observable) de la période, dans l'ordre chronologique.
+
+    after_id limite la lecture aux observations d'id supérieur (ajouts récents),
+    student_id à un seul élève.
+    """
+    lower, upper = _day_bounds(start, end)
+    params: list[Any] = [teacher_id, lower, upper, after_id]
+    student_filter = ""
+    if student_id is not None:
+        student_filter = "AND i.student_id = ?"
+        params.append(student_id)
+    try:
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"""
+                SELECT o.id, s.name, COALESCE(o.domaine, ''), COALESCE(o.composante, ''),
+                       COALESCE(o.apprentissage, ''), i.observable, COALESCE(i.level, {NON_EVALUE}),
+                       COALESCE(o.created_at, ''), COALESCE(o.commentaire, '')
+                FROM observations o
+                JOIN observation_items i ON i.observation_id = o.id
+                JOIN students s ON s.id = i.student_id
+                WHERE o.teacher_id = ? AND o.created_at >= ? AND o.created_at < ? AND o.id > ? {student_filter}
+                ORDER BY o.created_at ASC, o.id ASC, i.id ASC
+                """,
+                params,
+            )
+            rows = cur.fetchall()
+    except Exception:
+        rows = []
+    frame = pd.DataFrame.from_records(rows, columns=PROGRESSION_COLUMNS)
+    frame["niveau"] = frame["niveau"].astype(np.int8)
+    frame["appr_key"] = _appr_key(frame["Domaine"], frame["Composante"], frame["Apprentissage"])
+    return frame
+
+TRAJECTORY_COLUMNS = ["eleve", "observable", "date", "niveau", "precedent"]
+
+def get_trajectories(teacher_id: int, start: date, end: date, student_id: int | None = None) -> pd.DataFrame:
+    """Changements de niveau par élève et observable sur la période, dans l'ordre chronologique.
+
+    Le premier niveau évalué de chaque (élève, observable) est suivi de chaque
+    niveau différent du précédent (precedent vaut NON_EVALUE pour le premier).
+    Le calcul se fait en SQL: LAG() sur une fenêtre par élève et observable.
+    """
+    lower, upper = _day_bounds(start, end)
+    params: list[Any] = [teacher_id, lower, upper]
+    source = "observations o JOIN observation_items i ON i.observation_id = o.id"
+    student_filter = ""
+    if student_id is not None:
+        # Un seul élève: partir de l'index (student_id, observable), CROSS JOIN fixe l'ordre des tables
+        source = "observation_items i CROSS JOIN observations o ON o.id = i.observation_id"
+        student_filter = "AND i.student_id = ?"
+        params.append(student_id)
+    try:
+        with get_conn() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"""
+                WITH evaluated AS (
+                    SELECT s.name, i.observable, i.level, o.created_at, o.id AS observation_id,
+                           i.occurrence, i.student_id
+                    FROM {source}
+                    JOIN students s ON s.id = i.student_id
+                    WHERE o.teacher_id = ? AND o.created_at >= ? AND o.created_at < ?
+                      AND i.level IS NOT NULL {student_filter}
+                ),
+                steps AS (
+                    SELECT name, observable, created_at, level,
+                           LAG(level) OVER (
+                               PARTITION BY student_id, observable
+                               ORDER BY created_at, observation_id, occurrence
+                           ) AS previous,
+                           observation_id, occurrence
+                    FROM evaluated
+                )
+                SELECT name, observable, created_at, level, COALESCE(previous, {NON_EVALUE})
+                FROM steps
+                WHERE previous IS NULL OR previous <> level
+                ORDER BY name COLLATE NOCASE, observable, created_at, observation_id, occurrence
+                """,
+                params,
+            )
+            rows = cur.fetchall()
+    except Exception:
+        rows = []
+    frame = pd.DataFrame.from_records(rows, columns=TRAJECTORY_COLUMNS)
+    frame["date"] = pd.to_datetime(frame["date"])
+    return frame.astype({"niveau": np.int8, "precedent": np.int8})
+
+def get_progression_summary(teacher_id: int) -> pd.DataFrame:
+    """Synthèse de tout l'historique lue dans progression_summary (mêmes colonnes que compute_progression).
+
+    Une ligne par élève et observable: le coût ne dépend pas du nombre d'observations.
+    """
     try:
         with get_conn() as conn:
             cur = conn.cursor()
             cur.execute(
                 """
-                UPDATE observations SET
-                    domaine = ?,
-                    composante = ?,
-                    apprentissage = ?,
-                    mode = ?,
-                    observables_json = ?,
-                    commentaire = ?,
-                    activites_json = ?,
-                    competences_mobilisees_json = ?,
-                    processus_mobilises_json = ?,
-                    competence_mise_en_avant = ?,
-                    processus_mis_en_avant = ?
-                WHERE id = ? AND teacher_id = ?
+                SELECT s.name, p.domaine, p.composante, p.apprentissage, p.observable,
+                       p.count, p.first_level, p.last_level, p.first_date, p.last_date,
+                       p.non_evalue, p.n_0, p.n_1, p.n_2
+                FROM students s
+                JOIN progression_summary p ON p.student_id = s.id
+                WHERE s.teacher_id = ?
+                ORDER BY p.first_date, s.name COLLATE NOCASE, p.observable
                 """,
-                (
-                    obs.get("Domaine"),
-                    obs.get("Composante"),
-                    obs.get("Apprentissage"),
-                    obs.get("Mode"),
-                    json.dumps(obs.get("Observables") or [], ensure_ascii=False),
-                    obs.get("Commentaire") or "",
-                    json.dumps(obs.get("Activités") or [], ensure_ascii=False),
-                    json.dumps(obs.get("Compétences_mobilisées") or [], ensure_ascii=False),
-                    json.dumps(obs.get("Processus_mobilisés") or [], ensure_ascii=False),
-                    obs.get("Compétence_mise_en_avant") or "",
-                    obs.get("Processus_mis_en_avant") or "",
-                    obs_id,
-                    teacher_id,
-                ),
+                (teacher_id,),
             )
-            if cur.rowcount == 0:
-                return False, "Aucune observation correspondante à mettre à jour."
-            conn.commit()
-            return True, None
-    except Exception as e:
-        return False, f"Erreur mise à jour observation: {e}"
+            rows = cur.fetchall()
+    except Exception:
+        rows = []
+    columns = [*PROGRESSION_KEYS, "count", "first_level", "last_level", "first_date", "last_date",
+               "non_evalue", *(f"n_{i}" for i in range(len(NIVEAUX)))]
+    summary = pd.DataFrame.from_records(rows, columns=columns)
+    summary.insert(len(PROGRESSION_KEYS), "appr_key", _appr_key(summary["Domaine"], summary["Composante"], summary["Apprentissage"]))
+    return summary.astype({"first_level": np.int8, "last_level": np.int8})
 
-def save_observations_bulk(observations: list[dict], teacher_id: int) -> tuple[bool, str | None, list[int] | None, str | None]:
-    # Enregistre en lot avec le même horodatage pour regroupement
-    try:
-        saved_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        ids: list[int] = []
-        with get_conn() as conn:
-            cur = conn.cursor()
-            for obs in observations:
-                cur.execute(
-                    """
-                    INSERT INTO observations (
-                        teacher_id, domaine, composante, apprentissage, mode,
-                        observables_json, commentaire, activites_json,
-                        competences_mobilisees_json, processus_mobilises_json,
-                        competence_mise_en_avant, processus_mis_en_avant, created_at
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        teacher_id,
-                        obs.get("Domaine"),
-                        obs.get("Composante"),
-                        obs.get("Apprentissage"),
-                        obs.get("Mode"),
-                        json.dumps(obs.get("Observables") or [], ensure_ascii=False),
-                        obs.get("Commentaire") or "",
-                        json.dumps(obs.get("Activités") or [], ensure_ascii=False),
-                        json.dumps(obs.get("Compétences_mobilisées") or [], ensure_ascii=False),
-                        json.dumps(obs.get("Processus_mobilisés") or [], ensure_ascii=False),
-                        obs.get("Compétence_mise_en_avant") or "",
-                        obs.get("Processus_mis_en_avant") or "",
-                        saved_at,
-                    ),
-                )
-                ids.append(cur.lastrowid)
-            conn.commit()
-        return True, None, ids, saved_at
-    except Exception as e:
-        return False, f"Erreur enregistrement en lot: {e}", None, None
+def _first_rows(codes: np.ndarray, n_groups: int) -> np.ndarray:
+    # Indice de la première ligne de chaque groupe (-1 si le groupe est vide)
+    first = np.full(n_groups, -1, dtype=np.int64)
+    uniq, idx = np.unique(codes, return_index=True)
+    first[uniq] = idx
+    return first
 
-def get_observation_timestamps(teacher_id: int) -> list[tuple[str, int]]:
+def compute_progression(frame: pd.DataFrame) -> pd.DataFrame:
+    """Synthèse par élève et observable: nombre d'items, premier et dernier niveau, répartition.
+
+    frame est trié chronologiquement (get_progression_frame): premier et dernier
+    niveau se lisent donc sur la première et la dernière ligne évaluée de chaque
+    groupe. Tout est calculé en passes vectorisées sur les codes de groupe.
+    """
+    columns = [*PROGRESSION_KEYS, "appr_key", "count", "first_level", "last_level",
+               "first_date", "last_date", "non_evalue", *(f"n_{i}" for i in range(len(NIVEAUX)))]
+    if frame.empty:
+        return pd.DataFrame(columns=columns)
+    grouped = frame.groupby(PROGRESSION_KEYS, sort=False)
+    codes = grouped.ngroup().to_numpy()
+    n_groups = grouped.ngroups
+    levels = frame["niveau"].to_numpy()
+    dates = frame["date"].to_numpy()
+
+    # Répartition: colonne 0 = non évalué, puis un compteur par niveau
+    width = len(NIVEAUX) + 1
+    dist = np.bincount(codes * width + (levels + 1), minlength=n_groups * width).reshape(n_groups, width)
+
+    first_row = _first_rows(codes, n_groups)
+    last_row = len(codes) - 1 - _first_rows(codes[::-1], n_groups)
+    evaluated = np.flatnonzero(levels != NON_EVALUE)
+    first_eval = _first_rows(codes[evaluated], n_groups)
+    last_eval = _first_rows(codes[evaluated][::-1], n_groups)
+    has_eval = first_eval >= 0
+    first_level = np.full(n_groups, NON_EVALUE, dtype=np.int8)
+    last_level = first_level.copy()
+    first_level[has_eval] = levels[evaluated[first_eval[has_eval]]]
+    last_level[has_eval] = levels[evaluated[len(evaluated) - 1 - last_eval[has_eval]]]
+
+    summary = frame.iloc[first_row][[*PROGRESSION_KEYS, "appr_key"]].reset_index(drop=True)
+    summary["count"] = dist.sum(axis=1)
+    summary["first_level"] = first_level
+    summary["last_level"] = last_level
+    summary["first_date"] = dates[first_row]
+    summary["last_date"] = dates[last_row]
+    summary["non_evalue"] = dist[:, 0]
+    for i in range(len(NIVEAUX)):
+        summary[f"n_{i}"] = dist[:, i + 1]
+    return summary[columns]
+
+def merge_progression(old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """Combine deux synthèses dont la seconde porte sur des observations postérieures."""
+    if old.empty:
+        return new
+    if new.empty:
+        return old
+    combined = pd.concat([old, new], ignore_index=True)
+    for col in ("first_level", "last_level"):
+        combined[col] = combined[col].where(combined[col] != NON_EVALUE)  # first/last ignorent les NaN
+    agg = {col: "sum" for col in ("count", "non_evalue", *(f"n_{i}" for i in range(len(NIVEAUX))))}
+    agg.update(appr_key="first", first_level="first", last_level="last", first_date="first", last_date="last")
+    merged = combined.groupby(PROGRESSION_KEYS, sort=False, as_index=False).agg(agg)
+    for col in ("first_level", "last_level"):
+        merged[col] = merged[col].fillna(NON_EVALUE).astype(np.int8)
+    return merged[list(old.columns)]
+
+def progression_overview(summary: pd.DataFrame, frame: pd.DataFrame | None = None) -> pd.DataFrame:
+    """Une ligne par élève: observations, observables suivis, derniers niveaux atteints, dernière date.
+
+    Sans le détail (frame), le nombre d'observations distinctes reste vide.
+    """
+    columns = ["observations", "observables", "derniere_date", "non_evalue", *(f"dernier_{i}" for i in range(len(NIVEAUX)))]
+    if summary.empty:
+        return pd.DataFrame(columns=columns)
+    by_student = summary.groupby("eleve")
+    overview = pd.DataFrame({
+        "observations": (
+            frame.groupby("eleve")["observation_id"].nunique() if frame is not None else pd.Series(dtype="Int64")
+        ),
+        "observables": by_student.size(),
+        "derniere_date": by_student["last_date"].max(),
+    })
+    last = pd.crosstab(summary["eleve"], summary["last_level"]).reindex(
+        columns=range(NON_EVALUE, len(NIVEAUX)), fill_value=0
+    )
+    overview["non_evalue"] = last[NON_EVALUE]
+    for i in range(len(NIVEAUX)):
+        overview[f"dernier_{i}"] = last[i]
+    return overview[columns]
+
+def progression_heatmap(summary: pd.DataFrame) -> pd.DataFrame:
+    """Données de la carte de classe: le dernier niveau de chaque élève pour chaque observable."""
+    # Un observable présent sous plusieurs apprentissages est suffixé pour rester une colonne distincte
+    shared = summary.groupby("observable")["appr_key"].transform("nunique") > 1
+    heat = pd.DataFrame({
+        "Élève": summary["eleve"],
+        "Observable": summary["observable"].where(~shared, summary["observable"] + " (" + summary["Apprentissage"] + ")"),
+        "Apprentissage": summary["appr_key"],
+        "Niveau": summary["last_level"].map(niveau_label),
+        "Observations": summary["count"],
+        "Dernière observation": summary["last_date"].str[:10],
+    })
+    # Colonnes texte en catégories: libellés répétés envoyés une seule fois (dictionnaire Arrow)
+    return heat.astype({col: "category" for col in ("Élève", "Observable", "Apprentissage", "Niveau", "Dernière observation")})
+
+def get_coverage(teacher_id: int) -> pd.DataFrame:
+    """Dernière observation de chaque élève de la classe par apprentissage (table student_coverage)."""
     try:
         with get_conn() as conn:
             cur = conn.cursor()
             cur.execute(
                 """
-                SELECT created_at, COUNT(*) as n
-                FROM observations
-                WHERE teacher_id = ?
-                GROUP BY created_at
-                ORDER BY created_at DESC
+                SELECT s.name, c.domaine, c.composante, c.apprentissage, c.last_observed_at
+                FROM students s
+                JOIN student_coverage c ON c.student_id = s.id
+                WHERE s.teacher_id = ?
                 """,
                 (teacher_id,),
             )
             rows = cur.fetchall()
-            return [(r[0], r[1]) for r in rows]
     except Exception:
-        return []
+        rows = []
+    return pd.DataFrame.from_records(rows, columns=["Élève", "Domaine", "Composante", "Apprentissage", "last_observed_at"])
 
-def get_observations_by_timestamp(teacher_id: int, created_at: str) -> list[dict]:
+COVERAGE_LEVELS = {
+    "Domaine": ["Domaine"],
+    "Composante": ["Domaine", "Composante"],
+    "Apprentissage": ["Domaine", "Composante", "Apprentissage"],
+}
+
+def coverage_report(coverage: pd.DataFrame, eleves: list[str], referentiel: list[tuple[str, str, str]],
+                    today: date, level: str = "Apprentissage") -> pd.DataFrame:
+    """Une ligne par élève et domaine/composante/apprentissage, y compris ceux jamais observés.
+
+    Trié du plus long silence au plus récent; les jamais observés viennent en tête.
+    """
+    keys = COVERAGE_LEVELS[level]
+    grid = pd.DataFrame(referentiel, columns=["Domaine", "Composante", "Apprentissage"])[keys].drop_duplicates()
+    grid = pd.DataFrame({"Élève": eleves}).merge(grid, how="cross")
+    coverage = coverage[coverage["Élève"].isin(eleves)]
+    last = (
+        coverage[["Élève", *keys]]
+        .assign(observed=pd.to_datetime(coverage["last_observed_at"], format="ISO8601"))
+        .groupby(["Élève", *keys], as_index=False)["observed"].max()
+    )
+    report = grid.merge(last, how="outer", on=["Élève", *keys])
+    observed = report.pop("observed")
+    report["Dernière observation"] = observed
+    report["Jours sans observation"] = (pd.Timestamp(today) - observed.dt.normalize()).dt.days.astype("Int64")
+    return report.sort_values(
+        ["Jours sans observation", "Élève"], ascending=[False, True], na_position="first"
+    ).reset_index(drop=True)
+
+# --- Statistiques: répartition des niveaux par période (GROUP BY sur level_counts) ---
+# Début de chaque intervalle, en texte "YYYY-MM-DD" (l'année scolaire commence au 1er août)
+STATS_BUCKETS = {
+    "Semaine": "date(day, '-6 days', 'weekday 1')",
+    "Mois": "strftime('%Y-%m-01', day)",
+    "Année scolaire": "strftime('%Y-08-01', day, '-7 months')",
+}
+STATS_GROUPS = {
+    "Observable": ["Domaine", "Composante", "Apprentissage", "observable"],
+    "Apprentissage": ["Domaine", "Composante", "Apprentissage"],
+    "Domaine": ["Domaine"],
+}
+_STATS_COLUMNS = {"Domaine": "domaine", "Composante": "composante", "Apprentissage": "apprentissage", "observable": "observable"}
+
+def get_level_distribution(teacher_id: int, start: date, end: date, bucket: str = "Mois",
+                           group_by: str = "Observable", domaine: str | None = None) -> pd.DataFrame:
+    """Répartition des niveaux par intervalle (STATS_BUCKETS) et regroupement (STATS_GROUPS).
+
+    Chaque résultat enregistré compte une fois: "resultats", "non_evalue" et n_0..n_2
+    sont des nombres de résultats, pct_0..pct_2 la part de chaque niveau parmi les
+    résultats évalués. La lecture additionne les comptes journaliers de level_counts:
+    son coût dépend du nombre de jours observés, pas du nombre d'items.
+    """
+    keys = STATS_GROUPS[group_by]
+    group_keys = ", ".join(_STATS_COLUMNS[k] for k in keys)
+    counts = [f"n_{i}" for i in range(len(NIVEAUX))]
+    params: list[Any] = [teacher_id, start.isoformat(), end.isoformat()]
+    domaine_filter = ""
+    if domaine:
+        domaine_filter = "AND domaine = ?"
+        params.append(domaine)
     try:
         with get_conn() as conn:
             cur = conn.cursor()
             cur.execute(
-                """
-                SELECT id, domaine, composante, apprentissage, mode,
-                       observables_json, commentaire, activites_json,
-                       competences_mobilisees_json, processus_mobilises_json,
-                       competence_mise_en_avant, processus_mis_en_avant, created_at
-                FROM observations
-                WHERE teacher_id = ? AND created_at = ?
-                ORDER BY id ASC
+                f"""
+                SELECT {STATS_BUCKETS[bucket]} AS periode, {group_keys},
+                       SUM(count), SUM(non_evalue), {", ".join(f"SUM({c})" for c in counts)}
+                FROM level_counts
+                WHERE teacher_id = ? AND day >= ? AND day <= ? {domaine_filter}
+                GROUP BY periode, {group_keys}
+                ORDER BY periode, {group_keys}
                 """,
-                (teacher_id, created_at),
+                params,
             )
             rows = cur.fetchall()
-        obs_list: list[dict] = []
-        for r in rows:
-            (oid, domaine, composante, apprentissage, mode, obs_json, com, act_json,
-             comp_json, proc_json, comp_av, proc_av, created_at_val) = r
-            try:
-                observables = json.loads(obs_json) if obs_json else []
-            except Exception:
-                observables = []
-            try:
-                activites = json.loads(act_json) if act_json else []
-            except Exception:
-                activites = []
-            try:
-                comp_mob = json.loads(comp_json) if comp_json else []
-            except Exception:
-                comp_mob = []
-            try:
-                proc_mob = json.loads(proc_json) if proc_json else []
-            except Exception:
-                proc_mob = []
-            obs_list.append({
-                "db_id": oid,
-                "Domaine": domaine or "",
-                "Composante": composante or "",
-                "Apprentissage": apprentissage or "",
-                "Mode": mode or "",
-                "Observables": observables,
-                "Commentaire": com or "",
-                "Activités": activites,
-                "Compétences_mobilisées": comp_mob,
-                "Processus_mobilisés": proc_mob,
-                "Compétence_mise_en_avant": comp_av or "",
-                "Processus_mis_en_avant": proc_av or "",
-                "created_at": created_at_val or "",
-            })
-        return obs_list
     except Exception:
-        return []
+        rows = []
+    stats = pd.DataFrame.from_records(rows, columns=["periode", *keys, "resultats", "non_evalue", *counts])
+    stats["periode"] = pd.to_datetime(stats["periode"], format="ISO8601")
+    evaluated = (stats["resultats"] - stats["non_evalue"]).replace(0, np.nan)
+    for i, col in enumerate(counts):
+        stats[f"pct_{i}"] = (100 * stats[col] / evaluated).round(1)
+    return stats
+
+# --- Cache des progressions: instantanés par (enseignant, période), complétés à l'écriture ---
+class ProgressionSnapshot(NamedTuple):
+    version: int
+    frame: pd.DataFrame    # partagé entre sessions: à ne pas modifier
+    summary: pd.DataFrame
+    max_id: int            # plus grand id d'observation intégré
+
+def _max_observation_id(frame: pd.DataFrame) -> int:
+    return int(frame["observation_id"].max()) if not frame.empty else 0
+
+def _fold_progression(entry: ProgressionSnapshot, new_frame: pd.DataFrame, version: int) -> ProgressionSnapshot | None:
+    # None si les nouvelles observations ne viennent pas après celles de l'instantané
+    if new_frame.empty:
+        return entry._replace(version=version)
+    if not entry.frame.empty and new_frame["date"].iloc[0] < entry.frame["date"].iloc[-1]:
+        return None
+    return ProgressionSnapshot(
+        version,
+        pd.concat([entry.frame, new_frame], ignore_index=True),
+        merge_progression(entry.summary, compute_progression(new_frame)),
+        max(entry.max_id, _max_observation_id(new_frame)),
+    )
+
+class ProgressionCache:
+    """Progressions calculées par (enseignant, période) et partagées par ses sessions.
+
+    Comme RosterCache, chaque écriture incrémente la version de l'enseignant.
+    Après de simples ajouts, l'instantané est complété avec les observations
+    d'id supérieur; une modification ou une suppression impose un recalcul.
+    """
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._versions: dict[int, int] = {}
+        self._rebuild_from: dict[int, int] = {}  # version de la dernière écriture non additive
+        self._entries: OrderedDict[tuple[int, date, date], ProgressionSnapshot] = OrderedDict()
+
+    def get(self, teacher_id: int, start: date, end: date) -> ProgressionSnapshot:
+        key = (teacher_id, start, end)
+        with self._lock:
+            version = self._versions.get(teacher_id, 0)
+            rebuild_from = self._rebuild_from.get(teacher_id, 0)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None and entry.version == version:
+            return entry
+        snapshot = None
+        if entry is not None and entry.version >= rebuild_from:
+            snapshot = _fold_progression(entry, get_progression_frame(teacher_id, start, end, after_id=entry.max_id), version)
+        if snapshot is None:
+            frame = get_progression_frame(teacher_id, start, end)
+            snapshot = ProgressionSnapshot(version, frame, compute_progression(frame), _max_observation_id(frame))
+        with self._lock:
+            if self._versions.get(teacher_id, 0) == version:
+                self._entries[key] = snapshot
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return snapshot
+
+    def note_added(self, teacher_id: int) -> None:
+        # Nouvelles observations uniquement: les instantanés restent complétables
+        with self._lock:
+            self._versions[teacher_id] = self._versions.get(teacher_id, 0) + 1
+
+    def invalidate(self, teacher_id: int) -> None:
+        with self._lock:
+            version = self._versions.get(teacher_id, 0) + 1
+            self._versions[teacher_id] = version
+            self._rebuild_from[teacher_id] = version
+            for key in [k for k in self._entries if k[0] == teacher_id]:
+                del self._entries[key]
+
+    def version(self, teacher_id: int) -> int:
+        """Compteur d'écritures de l'enseignant: change dès que ses progressions changent."""
+        with self._lock:
+            return self._versions.get(teacher_id, 0)
+
+@st.cache_resource
+def get_progression_cache() -> ProgressionCache:
+    return ProgressionCache()
+
+def get_progression(teacher_id: int, start: date, end: date) -> ProgressionSnapshot:
+    return get_progression_cache().get(teacher_id, start, end)
+
+# --- Cache des PDF: documents produits, réutilisés tant que leur contenu ne change pas ---
+def pdf_cache_key(kind: str, teacher_id: int | None, payload: Any) -> str:
+    """Empreinte du contenu d'un document; la date du jour y entre car l'en-tête l'imprime."""
+    if kind == "fiche":
+        # L'identifiant en base n'apparaît pas dans la fiche: l'enregistrement ne la rend pas obsolète
+        payload = [{k: v for k, v in obs.items() if k != "db_id"} for obs in payload]
+    raw = json.dumps([kind, teacher_id, date.today().isoformat(), payload], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+# Délai avant suppression du fichier d'un PDF évincé: les boutons déjà affichés le lisent au clic
+PDF_RETIRED_TTL_S = 15 * 60
+
+class PdfCache:
+    """Derniers PDF produits, par empreinte de contenu, partagés par les sessions (LRU).
+
+    Un petit document est gardé en octets. Un gros est écrit par son rendu dans
+    spool_path(key) et seul le chemin est gardé. Un fichier évincé n'est
+    supprimé que PDF_RETIRED_TTL_S plus tard, les sessions qui affichent encore
+    son bouton pouvant le télécharger; le dossier disparaît à la fin du processus.
+    """
+
+    def __init__(self, max_entries: int = 16, retired_ttl_s: float = PDF_RETIRED_TTL_S):
+        self.max_entries = max_entries
+        self.retired_ttl_s = retired_ttl_s
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, bytes | Path] = OrderedDict()
+        self._retired: deque[tuple[float, Path]] = deque()
+        self._dir = tempfile.TemporaryDirectory(prefix="pdf-cache-")
+        self._spooled = 0
+        self.hits = 0
+
+    def spool_path(self, key: str) -> Path:
+        # Un nom par rendu: un nouveau rendu n'écrase jamais un fichier évincé encore lisible
+        with self._lock:
+            self._spooled += 1
+            return Path(self._dir.name) / f"{key}-{self._spooled}.pdf"
+
+    def get(self, key: str) -> bytes | Path | None:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return data
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key: str, data: bytes | Path) -> None:
+        expired = []
+        now = time.monotonic()
+        with self._lock:
+            replaced = self._entries.get(key)
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            evicted = [replaced] if replaced is not None and replaced != data else []
+            while len(self._entries) > self.max_entries:
+                evicted.append(self._entries.popitem(last=False)[1])
+            self._retired.extend((now, old) for old in evicted if isinstance(old, Path))
+            while self._retired and now - self._retired[0][0] >= self.retired_ttl_s:
+                expired.append(self._retired.popleft()[1])
+        for old in expired:
+            old.unlink(missing_ok=True)
+
+@st.cache_resource
+def get_pdf_cache() -> PdfCache:
+    return PdfCache()
+
+def spool_pdf(key: str, build: Callable[..., Path], *args, **kwargs) -> Path:
+    """build(path, *args, **kwargs) dans un fichier du cache réservé au moment du rendu seulement."""
+    return build(get_pdf_cache().spool_path(key), *args, **kwargs)
+
+# --- Rendu des PDF en arrière-plan: pool de threads borné, un seul rendu par document ---
+PDF_RENDER_WORKERS = 2
+
+class PdfJob:
+    """Rendu soumis au pool; le thread de rendu met à jour l'avancement, les reruns le lisent."""
+
+    def __init__(self, key: str, label: str):
+        self.key = key
+        self.label = label
+        self.done_steps = 0
+        self.total_steps = 0
+        self.error: Exception | None = None
+        self.done = False
+
+    def progress(self, done: int, total: int) -> None:
+        self.done_steps, self.total_steps = done, total
+
+    @property
+    def fraction(self) -> float:
+        return self.done_steps / self.total_steps if self.total_steps else 0.0
+
+class PdfRenderer:
+    """Met en page les PDF dans un pool borné, hors du thread de script des sessions.
+
+    Des threads plutôt que des processus: fpdf et les fonctions de mise en page
+    vivent dans ce script, que Streamlit exécute sans module importable par un
+    processus enfant. Un document déjà en cours de rendu (même empreinte) n'est
+    pas relancé: les sessions qui le demandent suivent le même PdfJob. Le
+    résultat est déposé dans PdfCache; seuls les échecs restent dans la table
+    des rendus, jusqu'à ce qu'une session les affiche (discard_failed).
+    """
+
+    def __init__(self, cache: PdfCache, max_workers: int = PDF_RENDER_WORKERS, history: int = 64):
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pdf-render")
+        self._lock = threading.Lock()
+        self._jobs: dict[str, PdfJob] = {}
+        self._render_ms: deque[float] = deque(maxlen=history)
+        self.rendered = 0
+        self.reused = 0
+        self.failed = 0
+
+    def status(self, key: str) -> tuple[bytes | Path | None, PdfJob | None]:
+        """(document, None) si le document est prêt, (None, rendu) s'il est en cours ou a échoué."""
+        with self._lock:
+            job = self._jobs.get(key)
+        if job is not None:
+            return None, job
+        return self.cache.get(key), None
+
+    def submit(self, key: str, build: Callable[[Callable[[int, int], None]], bytes | Path], label: str) -> PdfJob | None:
+        """Lance build(progress) dans le pool, sauf si le document est prêt (None) ou déjà en cours.
+
+        build retourne les octets du document ou le fichier où il l'a écrit.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.error is None:
+                self.reused += 1
+                return job
+            if key in self.cache:
+                return None
+            job = self._jobs[key] = PdfJob(key, label)
+        self._executor.submit(self._run, job, build)
+        return job
+
+    def discard_failed(self, key: str) -> None:
+        """Oublie le rendu échoué de key: il a été signalé, une nouvelle demande le relancera."""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.error is not None:
+                del self._jobs[key]
+
+    def _run(self, job: PdfJob, build: Callable[[Callable[[int, int], None]], bytes | Path]) -> None:
+        started = time.perf_counter()
+        try:
+            data = build(job.progress)
+        except Exception as e:
+            logger.exception("Échec du rendu PDF (%s)", job.label)
+            job.error = e
+            with self._lock:
+                self.failed += 1
+        else:
+            # En cache avant de quitter la table: un rerun voit toujours l'un ou l'autre
+            self.cache.put(job.key, data)
+            with self._lock:
+                del self._jobs[job.key]
+                self.rendered += 1
+                self._render_ms.append((time.perf_counter() - started) * 1000)
+        job.done = True
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "running": sum(1 for job in self._jobs.values() if not job.done),
+                "rendered": self.rendered,
+                "reused": self.reused,
+                "failed": self.failed,
+                "render_ms_avg": (sum(self._render_ms) / len(self._render_ms)) if self._render_ms else 0.0,
+            }
+
+@st.cache_resource
+def get_pdf_renderer() -> PdfRenderer:
+    # Caches des documents créés dans le thread de script plutôt que par le premier rendu
+    get_pdf_image_assets()
+    get_text_measure()
+    return PdfRenderer(get_pdf_cache())
 
 # --- Sessions persistantes ---
 def _generate_session_token() -> str:
@@ -736,18 +2942,58 @@ def create_session_db(teacher_id: int, ttl_days: int = 7) -> tuple[bool, str | N
     token = _generate_session_token()
     try:
         expires_at = (datetime.utcnow() + timedelta(days=ttl_days)).isoformat()
-        with get_conn() as conn:
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO sessions (teacher_id, token, expires_at) VALUES (?, ?, ?)",
-                (teacher_id, token, expires_at),
-            )
-            conn.commit()
+        run_write(lambda cur: cur.execute(
+            "INSERT INTO sessions (teacher_id, token, expires_at) VALUES (?, ?, ?)",
+            (teacher_id, token, expires_at),
+        ))
         return True, None, token
     except Exception as e:
         return False, f"Erreur création session: {e}", None
 
+class SessionTokenCache:
+    """Cache LRU borné des jetons de session valides (jeton -> enseignant).
+
+    Une entrée est servie tant que la session n'a pas expiré et au plus
+    ttl_seconds après sa lecture en base (suppressions faites ailleurs).
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[dict, datetime, float]] = OrderedDict()
+
+    def get(self, token: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            teacher, expires_at, cached_until = entry
+            if time.monotonic() > cached_until or expires_at < datetime.utcnow():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return dict(teacher)
+
+    def put(self, token: str, teacher: dict, expires_at: datetime) -> None:
+        with self._lock:
+            self._entries[token] = (dict(teacher), expires_at, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: str) -> None:
+        with self._lock:
+            self._entries.pop(token, None)
+
+@st.cache_resource
+def get_token_cache() -> SessionTokenCache:
+    return SessionTokenCache()
+
 def get_teacher_by_token(token: str) -> tuple[bool, str | None, dict | None]:
+    cached = get_token_cache().get(token)
+    if cached is not None:
+        return True, None, cached
     try:
         with get_conn() as conn:
             cur = conn.cursor()
@@ -766,26 +3012,78 @@ def get_teacher_by_token(token: str) -> tuple[bool, str | None, dict | None]:
             teacher_id, name, email, expires_at = row
             # Vérifier expiration
             try:
-                if datetime.fromisoformat(expires_at) < datetime.utcnow():
+                expires_dt = datetime.fromisoformat(expires_at)
+                if expires_dt < datetime.utcnow():
                     return False, "Session expirée.", None
             except Exception:
                 return False, "Session invalide.", None
-            return True, None, {"id": teacher_id, "name": name, "email": email}
+            teacher = {"id": teacher_id, "name": name, "email": email}
+            get_token_cache().put(token, teacher, expires_dt)
+            return True, None, teacher
     except Exception as e:
         return False, f"Erreur session: {e}", None
 
 def delete_session_db(token: str) -> tuple[bool, str | None]:
+    get_token_cache().invalidate(token)
     try:
-        with get_conn() as conn:
-            cur = conn.cursor()
-            cur.execute("DELETE FROM sessions WHERE token = ?", (token,))
-            conn.commit()
+        run_write(lambda cur: cur.execute("DELETE FROM sessions WHERE token = ?", (token,)))
         return True, None
     except Exception as e:
         return False, f"Erreur suppression session: {e}"
 
-# Créer la base au démarrage
-init_db()
+def sweep_expired_sessions(batch_size: int = 500) -> int:
+    """Supprime les sessions expirées par lots (index sur expires_at), retourne le nombre supprimé."""
+    now = datetime.utcnow().isoformat()
+    deleted = 0
+    while True:
+        n = run_write(lambda cur: cur.execute(
+            """
+            DELETE FROM sessions WHERE id IN (
+                SELECT id FROM sessions WHERE expires_at < ? LIMIT ?
+            )
+            """,
+            (now, batch_size),
+        ).rowcount)
+        # Un lot par écriture: les autres sessions peuvent écrire entre deux lots
+        deleted += n
+        if n < batch_size:
+            return deleted
+
+SESSION_SWEEP_INTERVAL_S = 3600
+
+def _session_sweeper_loop(stop: threading.Event) -> None:
+    while True:
+        try:
+            n = sweep_expired_sessions()
+            if n:
+                logger.info("%d session(s) expirée(s) supprimée(s)", n)
+        except Exception:
+            logger.exception("Nettoyage des sessions expirées impossible")
+        if stop.wait(SESSION_SWEEP_INTERVAL_S):
+            return
+
+@st.cache_resource
+def start_session_sweeper() -> threading.Event:
+    # Thread démon unique par processus; l'événement retourné permet de l'arrêter
+    stop = threading.Event()
+    threading.Thread(target=_session_sweeper_loop, args=(stop,), name="session-sweeper", daemon=True).start()
+    return stop
+
+# --- Démarrage: une seule fois par processus, et non à chaque rerun Streamlit ---
+@st.cache_resource
+def bootstrap() -> dict:
+    t0 = time.perf_counter()
+    _setup_french_locale()
+    migrations = init_db()
+    start_session_sweeper()
+    referentiel = _build_domaines()
+    return {
+        "domaines": referentiel,
+        "migrations": migrations,
+        "duration_ms": (time.perf_counter() - t0) * 1000,
+    }
+
+domaines = bootstrap()["domaines"]
 
 # Session: enseignant et liste d'élèves
 if "teacher" not in st.session_state:
@@ -795,12 +3093,13 @@ if "students" not in st.session_state:
 if "auth_token" not in st.session_state:
     st.session_state.auth_token = None
 
-# Rafraîchir la liste d'élèves si connecté
-if st.session_state.teacher:
-    try:
-        st.session_state.students = list_students_db(st.session_state.teacher["id"])
-    except Exception:
-        st.session_state.students = []
+# Profilage opt-in: ?profile=1 l'active pour la session, ?profile=0 le retire
+_profile_flag = st.query_params.get("profile")
+if _profile_flag == "0":
+    st.session_state.pop("profiler", None)
+elif _profile_flag is not None and "profiler" not in st.session_state:
+    st.session_state.profiler = RerunProfiler()
+start_rerun_profile(st.session_state.get("profiler"))
 
 # --- Gestion suppression via paramètres d'URL (trash dans sidebar) ---
 def _handle_delete_from_query_params():
@@ -858,7 +3157,7 @@ def _handle_delete_from_query_params():
         try:
             ok_stu, _err_stu = delete_student_db(st.session_state.teacher["id"], del_student_id)
             if ok_stu:
-                st.session_state.students = list_students_db(st.session_state.teacher["id"])
+                st.session_state.students = get_roster(st.session_state.teacher["id"]).students
                 changed = True
         except Exception:
             pass
@@ -904,7 +3203,7 @@ def _auto_login_from_query_params():
             st.session_state.teacher = teacher
             st.session_state.auth_token = tok
             try:
-                st.session_state.students = list_students_db(teacher["id"])
+                st.session_state.students = get_roster(teacher["id"]).students
             except Exception:
                 st.session_state.students = []
         else:
@@ -921,6 +3220,16 @@ def _auto_login_from_query_params():
 
 _auto_login_from_query_params()
 
+# Rafraîchir la liste d'élèves si connecté (cache par enseignant, sans requête si inchangée)
+roster_names: tuple[str, ...] = ()
+if st.session_state.teacher:
+    try:
+        _roster_entry = get_roster(st.session_state.teacher["id"])
+        st.session_state.students = _roster_entry.students
+        roster_names = _roster_entry.names
+    except Exception:
+        st.session_state.students = []
+
 # --- Fonction pour réinitialiser tous les checkboxes ---
 def reset_all_checkboxes():
     keys_to_reset = [k for k in st.session_state.keys() if k.startswith(("classe_", "eleve_", "comment_"))]
@@ -946,6 +3255,284 @@ def img_to_base64(img_path: Path) -> str:
     except Exception:
         return ""
 
+def trajectory_chart_spec() -> dict:
+    # Un palier par niveau atteint, une couleur par observable
+    emojis = json.dumps([n.split(" ", 1)[0] for n in NIVEAUX], ensure_ascii=False)
+    return {
+        "mark": {"type": "line", "interpolate": "step-after", "point": True},
+        "encoding": {
+            "x": {"field": "date", "type": "temporal", "title": None},
+            "y": {
+                "field": "niveau", "type": "quantitative", "title": None,
+                "scale": {"domain": [0, len(NIVEAUX) - 1]},
+                "axis": {"values": list(range(len(NIVEAUX))), "labelExpr": f"{emojis}[datum.value]"},
+            },
+            "color": {"field": "observable", "type": "nominal", "title": None, "legend": {"orient": "bottom", "columns": 2}},
+            "tooltip": [
+                {"field": "observable"},
+                {"field": "date", "type": "temporal", "format": "%d.%m.%Y"},
+                {"field": "Niveau"},
+            ],
+        },
+    }
+
+# --- Fragment: détail de progression d'un élève, construit à la demande ---
+PROGRESSION_PAGE_SIZE = 10
+PROGRESSION_HISTORY_LIMIT = 10
+
+@st.fragment
+def render_student_progression(eleve: str, student_id: int | None, period: tuple[date, date],
+                               student_summary: pd.DataFrame, student_items: pd.DataFrame | None):
+    # Rien n'est construit tant que le détail reste fermé; l'ouvrir ne relance que ce fragment
+    st.markdown(f"#### 👤 {eleve}")
+    if not st.toggle("Afficher le détail", key=f"prog_detail_{eleve}"):
+        return
+    for domaine, dom_rows in student_summary.groupby("Domaine", sort=False):
+        st.markdown(f"**{domaine}**")
+        st.dataframe(
+            pd.DataFrame({
+                "Composante": dom_rows["Composante"],
+                "Apprentissage": dom_rows["Apprentissage"],
+                "Observable": dom_rows["observable"],
+                "Niveau actuel": dom_rows["last_level"].map(niveau_label),
+                "Au départ": dom_rows["first_level"].map(niveau_label),
+                "Observations": dom_rows["count"],
+                **{NIVEAUX[i].split(" ", 1)[0]: dom_rows[f"n_{i}"] for i in range(len(NIVEAUX))},
+            }),
+            hide_index=True,
+            use_container_width=True,
+        )
+    if student_id is not None:
+        trajectoire = get_trajectories(st.session_state.teacher["id"], *period, student_id=student_id)
+        if not trajectoire.empty:
+            st.markdown("**📈 Trajectoires**")
+            st.vega_lite_chart(
+                trajectoire.assign(Niveau=trajectoire["niveau"].map(niveau_label)),
+                trajectory_chart_spec(),
+                use_container_width=True,
+            )
+    # Historique daté d'un seul observable à la fois
+    choices = list(student_summary[["appr_key", "observable"]].itertuples(index=False, name=None))
+    choice = st.selectbox(
+        "Historique d'un observable",
+        options=choices,
+        format_func=lambda c: f"{c[1]} ({c[0]})",
+        key=f"prog_history_{eleve}",
+    )
+    if choice and student_items is None and student_id is not None:
+        # Vue « tout l'historique »: items de cet élève seulement, lus à l'ouverture
+        student_items = get_progression_frame(st.session_state.teacher["id"], *period, student_id=student_id)
+    if choice and student_items is not None:
+        history = student_items[(student_items["appr_key"] == choice[0]) & (student_items["observable"] == choice[1])]
+        for item in history.tail(PROGRESSION_HISTORY_LIMIT).iloc[::-1].itertuples(index=False):
+            try:
+                date_str = format_timestamp_french(item.date)
+            except Exception:
+                date_str = item.date
+            line = f"📅 {date_str} : {niveau_label(item.niveau)}"
+            if item.commentaire:
+                line += f" – 💬 {item.commentaire}"
+            st.caption(line)
+        if len(history) > PROGRESSION_HISTORY_LIMIT:
+            st.caption(f"… et {len(history) - PROGRESSION_HISTORY_LIMIT} observation(s) plus ancienne(s)")
+
+# --- Carte de la classe: spécification Vega-Lite (un seul élément graphique) ---
+NIVEAUX_COULEURS = ["#b5835a", "#7cb342", "#ec407a"]
+
+def heatmap_chart_spec(eleves: list[str], observables: list[str]) -> dict:
+    return {
+        "mark": {"type": "rect", "stroke": "white", "strokeWidth": 1},
+        "height": {"step": 20},
+        "encoding": {
+            "y": {"field": "Élève", "type": "nominal", "sort": eleves, "title": None},
+            "x": {
+                "field": "Observable", "type": "nominal", "sort": observables, "title": None,
+                "axis": {"orient": "top", "labelAngle": -40, "labelLimit": 220},
+            },
+            "color": {
+                "field": "Niveau", "type": "nominal", "title": None,
+                "scale": {"domain": [*NIVEAUX, "Non évalué"], "range": [*NIVEAUX_COULEURS, "#d9d9d9"]},
+                "legend": {"orient": "bottom"},
+            },
+            "tooltip": [
+                {"field": "Élève"}, {"field": "Apprentissage"}, {"field": "Observable"},
+                {"field": "Niveau"}, {"field": "Observations"}, {"field": "Dernière observation"},
+            ],
+        },
+    }
+
+# --- Répartition des niveaux par période: graphique et fragment du panneau ---
+def distribution_chart_spec(bucket: str) -> dict:
+    # Barres empilées à 100 %: part de chaque niveau parmi les résultats évalués de l'intervalle
+    time_format = {"Semaine": "%d.%m.%Y", "Mois": "%m.%Y", "Année scolaire": "%Y"}[bucket]
+    return {
+        "mark": {"type": "bar"},
+        "encoding": {
+            "x": {"field": "periode", "type": "ordinal", "timeUnit": "yearmonthdate", "title": None,
+                  "axis": {"format": time_format, "labelAngle": -40}},
+            "y": {"field": "Part", "type": "quantitative", "stack": "normalize", "title": None, "axis": {"format": "%"}},
+            "color": {
+                "field": "Niveau", "type": "nominal", "title": None,
+                "scale": {"domain": NIVEAUX, "range": NIVEAUX_COULEURS},
+                "legend": {"orient": "bottom"},
+            },
+            "order": {"field": "rang"},
+            "tooltip": [
+                {"field": "periode", "type": "temporal", "format": time_format, "title": "Période"},
+                {"field": "Niveau"}, {"field": "Part", "format": ".1f", "title": "%"},
+                {"field": "Résultats"},
+            ],
+        },
+    }
+
+@st.fragment
+def render_level_distribution(teacher_id: int, period: tuple[date, date], domaine_names: list[str]):
+    # Changer un réglage ne relance que ce panneau
+    col_bucket, col_group, col_domaine = st.columns(3)
+    with col_bucket:
+        bucket = st.radio("Intervalle", list(STATS_BUCKETS), index=1, key="prog_stats_bucket")
+    with col_group:
+        group_by = st.radio("Regrouper par", list(STATS_GROUPS), key="prog_stats_group")
+    with col_domaine:
+        domaine = st.selectbox("Domaine", ["Tous", *domaine_names], key="prog_stats_domaine")
+    stats = get_level_distribution(teacher_id, *period, bucket, group_by, None if domaine == "Tous" else domaine)
+    if stats.empty:
+        st.caption("Aucun résultat enregistré sur la période.")
+        return
+    keys = STATS_GROUPS[group_by]
+    labels = stats[keys[-1]].where(stats[keys[-1]] != "", "(non renseigné)")
+    cible = st.selectbox(group_by, sorted(labels.unique()), key="prog_stats_focus")
+    focus = stats[labels == cible]
+    st.vega_lite_chart(
+        pd.DataFrame({
+            "periode": np.repeat(focus["periode"].to_numpy(), len(NIVEAUX)),
+            "Niveau": NIVEAUX * len(focus),
+            "rang": list(range(len(NIVEAUX))) * len(focus),
+            "Part": focus[[f"pct_{i}" for i in range(len(NIVEAUX))]].to_numpy().ravel(),
+            "Résultats": np.repeat((focus["resultats"] - focus["non_evalue"]).to_numpy(), len(NIVEAUX)),
+        }),
+        distribution_chart_spec(bucket),
+        use_container_width=True,
+    )
+    st.dataframe(
+        pd.DataFrame({
+            "Période": stats["periode"],
+            **{k if k != "observable" else "Observable": stats[k] for k in keys},
+            "Résultats": stats["resultats"],
+            "Non évalués": stats["non_evalue"],
+            **{NIVEAUX[i]: stats[f"pct_{i}"] for i in range(len(NIVEAUX))},
+        }),
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "Période": st.column_config.DateColumn(format="DD/MM/YYYY"),
+            **{NIVEAUX[i]: st.column_config.NumberColumn(format="%.1f %%") for i in range(len(NIVEAUX))},
+        },
+    )
+
+# --- PDF rendus en arrière-plan: avancement puis bouton de téléchargement ---
+PDF_POLL_INTERVAL_S = 0.5
+
+@st.fragment(run_every=PDF_POLL_INTERVAL_S)
+def render_pdf_progress(key: str) -> None:
+    """Barre d'avancement rafraîchie seule; relance la page quand le rendu se termine."""
+    _, job = get_pdf_renderer().status(key)
+    if job is None or job.done:
+        st.rerun()
+    st.progress(job.fraction, text=f"{job.label} en préparation… ({job.done_steps}/{job.total_steps or '?'})")
+
+def _read_pdf(key: str, path: Path, build: Callable[[Callable[[int, int], None]], bytes | Path] | None) -> bytes:
+    """Contenu du PDF au clic; un fichier supprimé depuis l'affichage du bouton est rendu à nouveau."""
+    try:
+        return path.read_bytes()
+    except FileNotFoundError:
+        if build is None:
+            raise
+    logger.info("PDF %s supprimé avant son téléchargement: nouveau rendu", key)
+    data = build(lambda done, total: None)
+    get_pdf_cache().put(key, data)
+    return data.read_bytes() if isinstance(data, Path) else data
+
+def pdf_download(key: str, label: str, file_name: str, key_widget: str | None = None,
+                 build: Callable[[Callable[[int, int], None]], bytes | Path] | None = None) -> bool:
+    """Téléchargement si le document est prêt, avancement s'il est en cours, erreur s'il a échoué.
+
+    Retourne False quand l'appelant doit proposer de (re)préparer le document:
+    jamais demandé, évincé du cache depuis, ou échec (affiché une seule fois).
+    build est le rendu du document, refait au clic si son fichier a disparu.
+    """
+    data, job = get_pdf_renderer().status(key)
+    if isinstance(data, Path):
+        # Fichier lu seulement au clic, pas à chaque rerun
+        st.download_button(label=label, data=functools.partial(_read_pdf, key, data, build),
+                           file_name=file_name, mime="application/pdf", key=key_widget)
+    elif data is not None:
+        st.download_button(label=label, data=data, file_name=file_name, mime="application/pdf", key=key_widget)
+    elif job is not None and job.error is not None:
+        st.error(f"❌ Erreur lors de la création du PDF : {job.error}")
+        get_pdf_renderer().discard_failed(key)
+        return False
+    elif job is not None:
+        render_pdf_progress(key)
+    return data is not None or job is not None
+
+# --- Panneau de profilage (?profile=1), affiché en fin de rerun ---
+def finish_rerun_profile() -> None:
+    """Clôt le profil du rerun puis affiche le panneau; sans effet si le profilage est désactivé."""
+    profiler = active_profiler()
+    if profiler is None:
+        return
+    _profiling.profiler = None  # le panneau lui-même n'est pas mesuré
+    run = profiler.finish(st.session_state.get("app_mode") or "accueil")
+    if run is None:
+        return
+    with st.expander("⏱️ Profil des reruns", expanded=True):
+        st.markdown(f"**Rerun n° {run['number']} ({run['label']}) : {run['total_ms']:.0f} ms**")
+        st.dataframe(
+            pd.DataFrame(
+                [(phase, ms, queries) for phase, (ms, queries) in run["phases"].items()],
+                columns=["Phase", "Durée (ms)", "Requêtes SQL"],
+            ),
+            hide_index=True,
+            use_container_width=True,
+            column_config={"Durée (ms)": st.column_config.NumberColumn(format="%.1f")},
+        )
+        # Historique glissant: une barre par rerun, empilée par phase
+        st.bar_chart(
+            pd.DataFrame(
+                [{phase: values[0] for phase, values in r["phases"].items()} for r in profiler.history],
+                index=pd.Index([r["number"] for r in profiler.history], name="Rerun"),
+            ),
+            y_label="ms",
+        )
+        if not is_admin(st.session_state.get("teacher")):
+            return
+        # Administrateurs seulement: métriques de tout le processus et maintenance
+        writer = get_writer().metrics()
+        st.caption(
+            f"Écritures : {writer['jobs']} en {writer['commits']} transactions (lot moyen {writer['avg_batch']:.1f}), "
+            f"commit moyen {writer['commit_ms_avg']:.1f} ms (p95 {writer['commit_ms_p95']:.1f} ms), "
+            f"attente moyenne {writer['wait_ms_avg']:.1f} ms, file d'attente {writer['queue_depth']}"
+        )
+        renderer = get_pdf_renderer().metrics()
+        st.caption(
+            f"PDF : {renderer['rendered']} rendu(s) en arrière-plan ({renderer['render_ms_avg']:.0f} ms en moyenne), "
+            f"{renderer['running']} en cours, {renderer['reused']} demande(s) rattachée(s) à un rendu en cours, "
+            f"{renderer['failed']} échec(s); {get_pdf_cache().hits} servi(s) depuis le cache"
+        )
+        boot = bootstrap()
+        migrations = ", ".join(f"v{version} {ms:.0f} ms" for version, _, ms in boot["migrations"]) or "aucune"
+        st.caption(
+            f"Démarrage du processus : {boot['duration_ms']:.0f} ms (migrations : {migrations}); "
+            f"connexions de lecture ouvertes : {get_pool().opened}"
+        )
+        if st.button("🔧 Reconstruire la synthèse de progression", key="profile_rebuild_summary"):
+            ok, err, n_rows = rebuild_progression_summary()
+            if ok:
+                st.success(f"Synthèse reconstruite ({n_rows} lignes).")
+            else:
+                st.error(err)
+
 # --- CSS pour le bouton et les expanders ---
 st.markdown("""
 <style>
@@ -1090,7 +3677,7 @@ if not st.session_state.get("teacher"):
                 if ok:
                     st.session_state.teacher = teacher
                     try:
-                        st.session_state.students = list_students_db(teacher["id"])
+                        st.session_state.students = get_roster(teacher["id"]).students
                     except Exception:
                         st.session_state.students = []
                     # Créer session persistante et ajouter dans l'URL
@@ -1150,6 +3737,7 @@ if not st.session_state.get("teacher"):
                             pass
                 else:
                     st.error(err or "Création impossible.")
+    finish_rerun_profile()
     st.stop()
 
 # --- Choix du mode principal ---
@@ -1180,6 +3768,7 @@ elif mode_app == "progression":
     st.info("Mode actuel : **Voir la progression de ma classe** – synthèse des observations par élève.")
 else:
     st.info("👆 Choisissez un mode ci-dessus pour commencer.")
+    finish_rerun_profile()
     st.stop()
 
 # --- Vue progression simple (par élève, pour les observations chargées) ---
@@ -1189,125 +3778,61 @@ if mode_app == "progression":
     # Sélection de période pour l'export
     col_period, col_export = st.columns([3, 1])
     with col_period:
-        date_debut = st.date_input("Date de début", value=datetime.now().date() - timedelta(days=30), key="prog_date_debut")
-        date_fin = st.date_input("Date de fin", value=datetime.now().date(), key="prog_date_fin")
+        tout_historique = st.checkbox("Tout l'historique", key="prog_all_history")
+        date_debut = st.date_input("Date de début", value=datetime.now().date() - timedelta(days=30), key="prog_date_debut", disabled=tout_historique)
+        date_fin = st.date_input("Date de fin", value=datetime.now().date(), key="prog_date_fin", disabled=tout_historique)
     with col_export:
         st.markdown("<br>", unsafe_allow_html=True)
         # Créer le PDF directement quand on clique
         if st.button("📄 Exporter PDF", key="export_progression_pdf", use_container_width=True):
             st.session_state.export_progression = True
+        inclure_trajectoires = st.checkbox("Inclure les trajectoires", key="prog_pdf_trajectoires")
     
-    # Charger toutes les observations de l'enseignant dans la période
-    obs_list = []
-    if st.session_state.teacher:
-        ts_list = get_observation_timestamps(st.session_state.teacher["id"])
-        for ts, _cnt in ts_list:
-            try:
-                ts_date = datetime.strptime(ts, "%Y-%m-%d %H:%M:%S").date()
-                if date_debut <= ts_date <= date_fin:
-                    loaded = get_observations_by_timestamp(st.session_state.teacher["id"], ts)
-                    obs_list.extend(loaded)
-            except Exception:
-                pass
-    
-    students = [s.get("name") for s in st.session_state.get("students", []) or []]
-    students_set = {s for s in students if s}
-    
-    # Debug : afficher les infos
-    with st.expander("🔍 Informations de debug (cliquez pour voir)", expanded=False):
-        st.write(f"**Nombre d'observations chargées :** {len(obs_list)}")
-        st.write(f"**Nombre d'élèves :** {len(students_set)}")
-        st.write(f"**Élèves :** {', '.join(students_set) if students_set else 'Aucun'}")
-        if obs_list:
-            st.write(f"**Période sélectionnée :** {date_debut} → {date_fin}")
-            st.write("**Premier exemple d'observation :**")
-            st.json(obs_list[0])
-    
-    # Organiser par domaine et élève
-    progression = {}
-    domaines_progression = {}
+    if tout_historique:
+        # Synthèse matérialisée (progression_summary): une ligne par élève et observable,
+        # le détail daté n'est lu que pour l'élève ouvert
+        period = (date.min, datetime.now().date())
+        frame, summary = None, get_progression_summary(st.session_state.teacher["id"])
+    else:
+        # Résultats par élève de la période: instantané en cache, relu seulement après une écriture
+        period = (date_debut, date_fin)
+        with profile_phase("Agrégation"):
+            snapshot = get_progression(st.session_state.teacher["id"], date_debut, date_fin)
+        frame, summary = snapshot.frame, snapshot.summary
     
-    for obs in obs_list:
-        domaine = obs.get("Domaine") or ""
-        composante = obs.get("Composante") or ""
-        apprentissage = obs.get("Apprentissage") or ""
-        key_appr = f"{domaine} – {composante} – {apprentissage}" if apprentissage else "(non renseigné)"
-        
-        # Extraire les observables avec leurs valeurs
-        for item in obs.get("Observables", []) or []:
-            target_names = []
-            txt = item
-            valeur = None
-            
-            # Parser le format "Valeur - Observable" ou "Nom: Valeur - Observable"
-            if " - " in item:
-                parts = item.split(" - ", 1)
-                if len(parts) == 2:
-                    valeur_part = parts[0].strip()
-                    txt = parts[1].strip()
-                    
-                    # Extraire le nom si présent
-                    if ":" in valeur_part:
-                        name_part, val_part = valeur_part.split(":", 1)
-                        name_part = name_part.strip()
-                        valeur_part = val_part.strip()
-                        if name_part.lower() == "classe":
-                            # Cas "Classe: valeur - observable"
-                            target_names = list(students_set)
-                        elif name_part in students_set:
-                            # Cas "Nom d'élève: valeur - observable"
-                            target_names = [name_part]
-                    elif valeur_part.lower().startswith("classe"):
-                        # Cas "Classe (sauf ...): ..."
-                        if "sauf" in valeur_part.lower():
-                            # Extraire les exclus
-                            excl_part = valeur_part.split("sauf", 1)[1].strip().rstrip(":")
-                            excl_list = [e.strip() for e in excl_part.split(",")]
-                            # Tous les élèves sauf ceux exclus
-                            target_names = [s for s in students_set if s not in excl_list]
-                        else:
-                            # Toute la classe
-                            target_names = list(students_set)
-                    
-                    # Identifier la valeur (🌰, 🌱, 🌸)
-                    if "germer" in valeur_part.lower() or "🌰" in valeur_part:
-                        valeur = "🌰 Encore en train de germer"
-                    elif "grandir" in valeur_part.lower() or "🌱" in valeur_part:
-                        valeur = "🌱 En train de grandir"
-                    elif "épanoui" in valeur_part.lower() or "🌸" in valeur_part:
-                        valeur = "🌸 Épanoui(e)"
-            
-            # Si pas de nom spécifique mais "Classe", attribuer à tous
-            if not target_names and "classe" in item.lower():
-                target_names = list(students_set)
-            
-            # Enregistrer pour chaque élève concerné
-            for name in target_names:
-                if name not in progression:
-                    progression[name] = {}
-                    domaines_progression[name] = {}
-                
-                if domaine not in domaines_progression[name]:
-                    domaines_progression[name][domaine] = {}
-                
-                if key_appr not in domaines_progression[name][domaine]:
-                    domaines_progression[name][domaine][key_appr] = []
-                
-                domaines_progression[name][domaine][key_appr].append({
-                    "observable": txt,
-                    "valeur": valeur or "Non évalué",
-                    "date": obs.get("created_at", ""),
-                    "commentaire": obs.get("Commentaire", "")
-                })
+    students_set = set(roster_names)
     
-    # Debug : afficher le résultat du parsing
-    with st.expander("🔍 Résultat du parsing (debug)", expanded=False):
-        st.write(f"**Nombre d'élèves avec des données :** {len(progression)}")
-        if progression:
-            st.write(f"**Élèves détectés :** {', '.join(progression.keys())}")
-            for eleve, data in list(progression.items())[:1]:  # Afficher juste un exemple
-                st.write(f"**Exemple pour {eleve} :**")
-                st.json(domaines_progression[eleve])
+    # Synthèse par élève (une seule passe de regroupement)
+    with profile_phase("Agrégation"):
+        progression = dict(tuple(summary.groupby("eleve", sort=False)))
+
+    # Couverture: qui n'a pas été observé, et depuis quand (toutes périodes confondues)
+    with st.expander("🕒 Couverture des observations", expanded=False):
+        niveau_couverture = st.radio(
+            "Regrouper par", list(COVERAGE_LEVELS), index=2, horizontal=True, key="prog_coverage_level"
+        )
+        referentiel = [
+            (dom_name, comp_name, crit_name) for dom_name, dom_data in domaines.items()
+            for comp_name, criteres in dom_data["composantes"].items() for crit_name in criteres
+        ]
+        with profile_phase("Agrégation"):
+            couverture = coverage_report(
+                get_coverage(st.session_state.teacher["id"]), list(roster_names), referentiel,
+                datetime.now().date(), niveau_couverture,
+            )
+        st.dataframe(
+            couverture,
+            hide_index=True,
+            use_container_width=True,
+            column_config={
+                "Dernière observation": st.column_config.DateColumn(format="DD/MM/YYYY"),
+                "Jours sans observation": st.column_config.NumberColumn(help="Vide: jamais observé"),
+            },
+        )
+
+    # Répartition des niveaux de la classe par semaine, mois ou année scolaire
+    with st.expander("📈 Répartition des niveaux par période", expanded=False):
+        render_level_distribution(st.session_state.teacher["id"], period, list(domaines))
 
     if not progression:
         st.info("📊 Aucune donnée à afficher pour l'instant. Pour voir la progression :\n\n"
@@ -1323,117 +3848,87 @@ if mode_app == "progression":
         )
         
         eleves_a_afficher = eleves_selectionnes if eleves_selectionnes else sorted(students_set)
+        eleves_avec_donnees = [e for e in eleves_a_afficher if e in progression]
         
-        for eleve in eleves_a_afficher:
-            if eleve not in progression:
-                continue
-                
-            st.markdown(f"#### 👤 {eleve}")
-            st.markdown("---")
-            
-            for domaine, appr_data in domaines_progression[eleve].items():
-                st.markdown(f"**{domaine}**")
-                for appr_key, observations in appr_data.items():
-                    with st.expander(f"🔹 {appr_key}", expanded=False):
-                        for obs_item in observations:
-                            st.markdown(f"- **{obs_item['observable']}** : {obs_item['valeur']}")
-                            if obs_item.get('commentaire'):
-                                st.caption(f"💬 {obs_item['commentaire']}")
-                            if obs_item.get('date'):
-                                try:
-                                    date_str = format_timestamp_french(obs_item['date'])
-                                    st.caption(f"📅 {date_str}")
-                                except:
-                                    pass
-            st.markdown("---")
+        # Vue d'ensemble: une ligne par élève, dans un seul tableau
+        with profile_phase("Agrégation"):
+            overview = progression_overview(summary, frame).reindex(eleves_avec_donnees)
+        st.dataframe(
+            pd.DataFrame({
+                "Élève": overview.index,
+                "Observations": overview["observations"].to_numpy(),
+                "Observables suivis": overview["observables"].to_numpy(),
+                **{f"Dernier niveau {NIVEAUX[i].split(' ', 1)[0]}": overview[f"dernier_{i}"].to_numpy() for i in range(len(NIVEAUX))},
+                "Dernière observation": [format_timestamp_french(d) if d else "" for d in overview["derniere_date"]],
+            }),
+            hide_index=True,
+            use_container_width=True,
+        )
         
-        # Export PDF de progression
-        if st.session_state.get("export_progression"):
-            pdf_buffer = BytesIO()
-            pdf = CustomPDF(teacher_name=st.session_state.teacher.get("name", ""))
-            pdf.set_auto_page_break(auto=True, margin=15)
-            pdf.set_margins(15, 15, 15)
-            pdf.alias_nb_pages()
-            
-            try:
-                pdf.add_font("ArialUnicode", "", "C:\\Windows\\Fonts\\arial.ttf", uni=True)
-                pdf.add_font("ArialUnicode", "B", "C:\\Windows\\Fonts\\arialbd.ttf", uni=True)
-                base_font = "ArialUnicode"
-            except Exception:
-                base_font = "Helvetica"
-            
-            pdf.add_page()
-            content_width = getattr(pdf, "epw", pdf.w - pdf.l_margin - pdf.r_margin)
-            
-            # Titre
-            pdf.set_font(base_font, "B", 18)
-            pdf.cell(0, 10, "Progression de la classe", 0, 1, "C")
-            pdf.ln(5)
-            
-            # Période
-            pdf.set_font(base_font, "", 11)
-            pdf.cell(0, 6, f"Période : du {date_debut.strftime('%d/%m/%Y')} au {date_fin.strftime('%d/%m/%Y')}", 0, 1, "C")
-            pdf.ln(10)
-            
-            # Par élève
-            for eleve in eleves_a_afficher:
-                if eleve not in progression:
-                    continue
-                
-                if pdf.get_y() > pdf.h - 40:
-                    pdf.add_page()
-                
-                pdf.set_font(base_font, "B", 14)
-                pdf.cell(0, 8, f"Élève : {eleve}", 0, 1)
-                pdf.ln(3)
-                
-                for domaine, appr_data in domaines_progression[eleve].items():
-                    if pdf.get_y() > pdf.h - 50:
-                        pdf.add_page()
-                    
-                    pdf.set_font(base_font, "B", 12)
-                    pdf.set_fill_color(230, 230, 230)
-                    pdf.cell(0, 7, domaine, 0, 1, "L", fill=True)
-                    pdf.ln(2)
-                    
-                    for appr_key, observations in appr_data.items():
-                        if pdf.get_y() > pdf.h - 60:
-                            pdf.add_page()
-                        
-                        pdf.set_font(base_font, "B", 10)
-                        pdf.cell(0, 6, appr_key, 0, 1)
-                        pdf.ln(1)
-                        
-                        pdf.set_font(base_font, "", 9)
-                        for obs_item in observations:
-                            y_before = pdf.get_y()
-                            pdf.multi_cell(content_width - 10, 5, f"• {obs_item['observable']} : {obs_item['valeur']}", 0, "L")
-                            if pdf.get_y() - y_before > 20:  # Si trop d'espace, nouvelle page
-                                if pdf.get_y() > pdf.h - 30:
-                                    pdf.add_page()
-                            pdf.ln(1)
-                        
-                        pdf.ln(2)
-                    
-                    pdf.ln(3)
-                
-                pdf.ln(5)
-            
-            pdf_output = bytes(pdf.output(dest='S'))
-            pdf_buffer.write(pdf_output)
-            pdf_buffer.seek(0)
-            
-            date_filename = f"{date_debut.strftime('%Y-%m-%d')}_{date_fin.strftime('%Y-%m-%d')}"
-            st.download_button(
-                label="📥 Télécharger le PDF de progression",
-                data=pdf_buffer,
-                file_name=f"progression_{date_filename}.pdf",
-                mime="application/pdf",
-                key="download_progression_pdf"
+        # Carte de la classe: dernier niveau par élève et observable, en un seul graphique
+        with profile_phase("Agrégation"):
+            heat = progression_heatmap(summary[summary["eleve"].isin(eleves_avec_donnees)])
+        ordre_referentiel = [
+            o for dom_data in domaines.values() for criteres in dom_data["composantes"].values()
+            for detail in criteres.values() for o in detail.get("Observables", [])
+        ]
+        presents = set(heat["Observable"])
+        colonnes = [o for o in ordre_referentiel if o in presents]
+        colonnes += sorted(presents.difference(colonnes))
+        st.markdown("**🗺️ Carte de la classe (dernier niveau observé)**")
+        st.vega_lite_chart(heat, heatmap_chart_spec(eleves_avec_donnees, colonnes), use_container_width=True)
+        
+        # Détail par élève, page par page
+        n_eleves = len(eleves_avec_donnees)
+        n_pages = max(1, -(-n_eleves // PROGRESSION_PAGE_SIZE))
+        page = 1
+        if n_pages > 1:
+            page = st.selectbox(
+                "Page",
+                options=list(range(1, n_pages + 1)),
+                format_func=lambda p: f"Élèves {(p - 1) * PROGRESSION_PAGE_SIZE + 1}–{min(p * PROGRESSION_PAGE_SIZE, n_eleves)} sur {n_eleves}",
+                key="prog_page",
+            )
+        student_ids = {s["name"]: s["id"] for s in st.session_state.students}
+        for eleve in eleves_avec_donnees[(page - 1) * PROGRESSION_PAGE_SIZE:page * PROGRESSION_PAGE_SIZE]:
+            render_student_progression(
+                eleve, student_ids.get(eleve), period,
+                progression[eleve], frame[frame["eleve"] == eleve] if frame is not None else None,
+            )
+        
+        # Export PDF de progression: rendu en arrière-plan, téléchargement proposé une fois prêt
+        with profile_phase("PDF"):
+            teacher_id = st.session_state.teacher["id"]
+            teacher_name = st.session_state.teacher.get("name", "")
+            progression_key = pdf_cache_key("progression", teacher_id, [
+                period, tout_historique, eleves_avec_donnees, inclure_trajectoires, teacher_name,
+                get_progression_cache().version(teacher_id),
+            ])
+            # Rendu lancé par l'export, ou refait au clic si le fichier a été supprimé entre-temps
+            build_progression_pdf = functools.partial(
+                spool_pdf, progression_key, build_progression_report,
+                {eleve: progression[eleve] for eleve in eleves_avec_donnees}, period, tout_historique, teacher_name,
+                (lambda eleve: get_trajectories(teacher_id, *period, student_id=student_ids[eleve]))
+                if inclure_trajectoires else None,
             )
-            # Réinitialiser le flag après génération
-            st.session_state.export_progression = False
+            if st.session_state.pop("export_progression", False):
+                get_pdf_renderer().submit(progression_key, build_progression_pdf, "PDF de progression")
+                st.session_state.progression_pdf_key = progression_key
+            if st.session_state.get("progression_pdf_key") == progression_key:
+                date_filename = "historique" if tout_historique else f"{date_debut.strftime('%Y-%m-%d')}_{date_fin.strftime('%Y-%m-%d')}"
+                available = pdf_download(
+                    progression_key,
+                    label="📥 Télécharger le PDF de progression",
+                    file_name=f"progression_{date_filename}.pdf",
+                    key_widget="download_progression_pdf",
+                    build=build_progression_pdf,
+                )
+                # Échec signalé, ou document évincé du cache partagé: le proposer à nouveau
+                if not available and st.button("🔄 Préparer à nouveau le PDF de progression", key="reprepare_progression_pdf"):
+                    st.session_state.export_progression = True
+                    st.rerun()
     
+    finish_rerun_profile()
     st.stop()
 
 # --- Formulaire d'observation dynamique ---
@@ -1521,11 +4016,11 @@ if mode_app == "reporter":
                                     options=scale_options,
                                     key=f"loaded_class_val_{idx}_{obs_text}"
                                 )
-                                selected_observables.append(f"Classe: {class_value} - {obs_text}")
+                                selected_observables.append(format_observable_result(class_value, obs_text))
                             
                             elif apply_mode == "Élèves particuliers":
                                 # Récupérer la liste des élèves
-                                students_names = [s.get("name") for s in st.session_state.get("students", []) or []]
+                                students_names = roster_names
                                 if students_names:
                                     names_list = st.multiselect(
                                         "Sélectionnez les élèves",
@@ -1540,13 +4035,13 @@ if mode_app == "reporter":
                                                 options=scale_options,
                                                 key=f"loaded_eleve_val_{idx}_{obs_text}_{safe}"
                                             )
-                                            selected_observables.append(f"{eleve}: {eleve_value} - {obs_text}")
+                                            selected_observables.append(format_observable_result(eleve_value, obs_text, student=eleve))
                                 else:
                                     st.warning("Aucun élève enregistré. Ajoutez des élèves dans la sidebar.")
                             
                             elif apply_mode == "Tous les élèves sauf...":
                                 # Récupérer la liste des élèves
-                                students_names = [s.get("name") for s in st.session_state.get("students", []) or []]
+                                students_names = roster_names
                                 if students_names:
                                     excl_list = st.multiselect(
                                         "Élèves à exclure",
@@ -1560,11 +4055,7 @@ if mode_app == "reporter":
                                     options=scale_options,
                                     key=f"loaded_class_except_val_{idx}_{obs_text}"
                                 )
-                                if excl_list:
-                                    excl_txt = ", ".join(excl_list)
-                                    selected_observables.append(f"Classe (sauf {excl_txt}): {class_except_value} - {obs_text}")
-                                else:
-                                    selected_observables.append(f"Classe: {class_except_value} - {obs_text}")
+                                selected_observables.append(format_observable_result(class_except_value, obs_text, excluded=excl_list))
                         
                         # Commentaire
                         st.markdown("---")
@@ -1739,18 +4230,13 @@ for domaine, data in domaines.items():
                                 if existing_obs:
                                     st.info("📝 Observation existante chargée. Vous pouvez modifier les valeurs ci-dessous.")
                                     existing_obs_list = existing_obs.get("Observables", [])
-                                    # Parser les observables existants pour pré-remplir
-                                    for existing_item in existing_obs_list:
-                                        if " - " in existing_item:
-                                            parts = existing_item.split(" - ", 1)
-                                            if len(parts) == 2:
-                                                valeur_part = parts[0].strip()
-                                                obs_text = parts[1].strip()
-                                                # Trouver l'observable correspondant
-                                                for obs in observables:
-                                                    if obs in obs_text or obs_text in obs:
-                                                        selected_observables.append(existing_item)
-                                                        break
+                                    # Reprendre les items évalués qui portent sur un observable de ce critère
+                                    observables_set = set(observables)
+                                    with profile_phase("Analyse"):
+                                        for existing_item in existing_obs_list:
+                                            res = parse_observable_result(existing_item)
+                                            if res.evaluated and res.observable in observables_set:
+                                                selected_observables.append(existing_item)
                                 
                                 for obs in observables:
                                     # En-tête + boutons d'ajout/suppression d'occurrence
@@ -1785,10 +4271,10 @@ for domaine, data in domaines.items():
                                                     key=f"{domaine}_{comp_name}_{crit_name}_{obs}_rating_class_{occ_idx}",
                                                     label_visibility="collapsed"
                                                 )
-                                            selected_observables.append(f"Classe: {class_value} - {obs}")
+                                            selected_observables.append(format_observable_result(class_value, obs))
                                         elif apply_mode == "Élèves particuliers":
                                             # Récupérer la liste des élèves
-                                            students_names = [s.get("name") for s in st.session_state.get("students", []) or []]
+                                            students_names = roster_names
                                             names_key = f"eleves_bulk_{domaine}_{comp_name}_{crit_name}_{obs}_{occ_idx}"
                                             if students_names:
                                                 names_list = st.multiselect(
@@ -1803,12 +4289,12 @@ for domaine, data in domaines.items():
                                                         options=scale_options,
                                                         key=f"{domaine}_{comp_name}_{crit_name}_{obs}_rating_{safe}_{occ_idx}",
                                                     )
-                                                    selected_observables.append(f"{eleve}: {eleve_value} - {obs}")
+                                                    selected_observables.append(format_observable_result(eleve_value, obs, student=eleve))
                                             else:
                                                 st.warning("Aucun élève enregistré. Ajoutez des élèves dans la sidebar.")
                                         else:
                                             # Tous les élèves sauf...
-                                            students_names = [s.get("name") for s in st.session_state.get("students", []) or []]
+                                            students_names = roster_names
                                             excl_key = f"excl_eleves_{domaine}_{comp_name}_{crit_name}_{obs}_{occ_idx}"
                                             if students_names:
                                                 excl_list = st.multiselect(
@@ -1826,11 +4312,7 @@ for domaine, data in domaines.items():
                                                     key=f"{domaine}_{comp_name}_{crit_name}_{obs}_rating_class_except_{occ_idx}",
                                                     label_visibility="collapsed"
                                                 )
-                                            if excl_list:
-                                                excl_txt = ", ".join(excl_list)
-                                                selected_observables.append(f"Classe (sauf {excl_txt}): {class_except_value} - {obs}")
-                                            else:
-                                                selected_observables.append(f"Classe: {class_except_value} - {obs}")
+                                            selected_observables.append(format_observable_result(class_except_value, obs, excluded=excl_list))
 
                             # Commentaire (placé avant la section Mise en avant)
                             comment_key = f"comment_{domaine}_{comp_name}_{crit_name}"
@@ -1971,7 +4453,7 @@ with st.sidebar:
                     if ok:
                         st.session_state.teacher = teacher
                         try:
-                            st.session_state.students = list_students_db(teacher["id"])
+                            st.session_state.students = get_roster(teacher["id"]).students
                         except Exception:
                             st.session_state.students = []
                         # Créer session persistante et ajouter dans l'URL
@@ -2069,7 +4551,7 @@ with st.sidebar:
             if st.button("Ajouter", key="cls_add_one_btn"):
                 ok, err = add_student_db(t["id"], new_student)
                 if ok:
-                    st.session_state.students = list_students_db(t["id"])
+                    st.session_state.students = get_roster(t["id"]).students
                     st.success("Élève ajouté.")
                 else:
                     st.error(err or "Ajout impossible.")
@@ -2084,13 +4566,12 @@ with st.sidebar:
                     if not names:
                         st.info("Rien à ajouter.")
                     else:
-                        added = 0
-                        for nm in names:
-                            ok, _ = add_student_db(t["id"], nm)
-                            if ok:
-                                added += 1
-                        st.session_state.students = list_students_db(t["id"])
-                        st.success(f"{added} élève(s) ajouté(s).")
+                        added, err = add_students_db(t["id"], names)
+                        st.session_state.students = get_roster(t["id"]).students
+                        if err:
+                            st.error(err)
+                        else:
+                            st.success(f"{added} élève(s) ajouté(s).")
             # Liste des élèves
             if st.session_state.students:
                 st.markdown("#### Liste des élèves")
@@ -2127,6 +4608,20 @@ with st.sidebar:
                                     pass
             else:
                 st.info("Aucune observation enregistrée en base pour l'instant.")
+            # Recherche plein texte dans les commentaires et observables
+            search_text = st.text_input("🔎 Rechercher dans mes observations", key="obs_search_text", placeholder="Prénom, mot-clé…")
+            if search_text.strip():
+                results = search_observations(st.session_state.teacher["id"], search_text)
+                if not results:
+                    st.caption("Aucun résultat.")
+                for res in results:
+                    st.markdown(f"**{format_timestamp_french(res['created_at'])}** – {res['Apprentissage'][:60]}")
+                    st.caption(res["snippet"])
+                    if st.button("Charger cette séance", key=f"obs_search_load_{res['db_id']}"):
+                        loaded = get_observations_by_timestamp(st.session_state.teacher["id"], res["created_at"])
+                        if loaded:
+                            st.session_state.observations = loaded
+                            st.rerun()
         # Enregistrer les observations courantes en base
         if st.session_state.teacher and st.session_state.observations:
             unsaved_idx = [i for i, o in enumerate(st.session_state.observations) if not o.get("db_id")]
@@ -2185,217 +4680,31 @@ with st.sidebar:
                         if obs.get("Processus_mis_en_avant"):
                             st.markdown(f"- Processus cognitif : {obs['Processus_mis_en_avant']}")
             
-            # Génération et téléchargement PDF
-            pdf_buffer = BytesIO()
-            pdf = CustomPDF()
-            pdf.set_auto_page_break(auto=True, margin=15)
-            pdf.set_margins(15, 15, 15)
-            pdf.alias_nb_pages()
-            # Fonts: try Unicode TrueType to support accents
-            try:
-                pdf.add_font("ArialUnicode", "", "C:\\Windows\\Fonts\\arial.ttf", uni=True)
-                pdf.add_font("ArialUnicode", "B", "C:\\Windows\\Fonts\\arialbd.ttf", uni=True)
-                base_font = "ArialUnicode"
-            except Exception:
-                base_font = "Helvetica"
-            pdf.add_page()
-
-            content_width = getattr(pdf, "epw", pdf.w - pdf.l_margin - pdf.r_margin)
-            pdf.set_font(base_font, "", 12)
-            date_str = datetime.now().strftime("%d/%m/%Y")
-            date_filename = datetime.now().strftime("%Y-%m-%d_%H-%M")
-
-            # Observations
-            obs_on_page = 0
-            for obs in st.session_state.observations:
-                # Contrainte de pagination: max 1 observation par page, éviter le footer
-                safe_bottom = getattr(pdf, 'b_margin', 15) + 20
-                if obs_on_page >= 1 or pdf.get_y() > (pdf.h - safe_bottom - 120):
-                    pdf.add_page()
-                    obs_on_page = 0
-                # Début du bloc avec encadrement
-                x_box = pdf.l_margin
-                y_box = pdf.get_y()
-                # Titre d'observation (bandeau cyan arrondi) avec retour à la ligne si trop long
-                pdf.set_font(base_font, "B", 13)
-                pdf.set_text_color(255, 255, 255)
-                pdf.set_fill_color(0, 173, 239)
-                title_h = 8
-                # Calcul de la hauteur nécessaire
-                title_text = (obs.get('Apprentissage') or obs.get('Critère') or "")
-                req_h = pdf.calculate_multicell_height(title_text, content_width - 4, 6)
-                # Plus d'espace bas dans le bandeau pour aérer
-                block_h = max(title_h, req_h + 3)
-                # Utiliser un bandeau à coins arrondis en haut uniquement, aligné avec le cadre
-                frame_x = pdf.l_margin + 3
-                frame_w = content_width - 6
-                pdf.rounded_top_rect(frame_x, y_box, frame_w, block_h, r=3, style='F')
-                # Positionner plus haut (padding haut faible, bas plus large)
-                pdf.set_xy(frame_x + 2, y_box + 1)
-                pdf.multi_cell(frame_w - 4, 6, title_text)
-                pdf.set_text_color(0, 0, 0)
-                pdf.set_font(base_font, "", 11)
-                pdf.ln(2)
-
-                # Caractéristiques avec libellés en gras (décalées vers l'intérieur du cadre)
-                pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Domaine: "); pdf.set_font(base_font, "", 11); pdf.write(6, (obs['Domaine'] or "") + "\n")
-                pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Composante: "); pdf.set_font(base_font, "", 11); pdf.write(6, (obs['Composante'] or "") + "\n")
-                # Suppression de la ligne Mode (inutile)
-                if obs.get("Activités"):
-                    pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Activités réalisées: "); pdf.set_font(base_font, "", 11); pdf.write(6, ", ".join(obs['Activités']) + "\n")
-                if obs.get("Compétences_mobilisées"):
-                    pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Compétences transversales mobilisées: "); pdf.set_font(base_font, "", 11); pdf.write(6, ", ".join(obs['Compétences_mobilisées']) + "\n")
-                if obs.get("Processus_mobilisés"):
-                    pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Processus cognitifs mobilisés: "); pdf.set_font(base_font, "", 11); pdf.write(6, ", ".join(obs['Processus_mobilisés']) + "\n")
-                # Observables: Likert horizontal avec emoji + habillage
-                if obs.get("Observables"):
-                    pdf.ln(1)
-                    pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Observables\n")
-                    pdf.set_font(base_font, "", 11)
-                    # Dimensions pour l'échelle
-                    scale_box_w = 14
-                    scale_box_h = 12
-                    scale_gap = 6
-                    scale_total_w = 3 * (scale_box_w + scale_gap) - scale_gap
-                    right_padding = 6  # espace entre l'échelle et le cadre à droite
-                    text_w = frame_w - scale_total_w - 6 - right_padding
-                    # Grouper les observables par (label, niveau)
-                    groups = {}
-                    order = []
-                    for item in obs["Observables"]:
-                        subject = "Classe"
-                        raw = item
-                        if ":" in raw:
-                            parts = raw.split(":", 1)
-                            subject = parts[0].strip()
-                            raw = parts[1].strip()
-                        idx = 1
-                        if ("Encore en train de germer" in raw):
-                            idx = 0
-                        elif ("Épanoui" in raw):
-                            idx = 2
-                        else:
-                            idx = 1
-                        label = raw
-                        if " - " in raw:
-                            label = raw.split(" - ", 1)[1].strip()
-                        key = (label, idx)
-                        if key not in groups:
-                            groups[key] = {"names": [], "has_class": False}
-                            order.append(key)
-                        if subject.lower() == "classe":
-                            groups[key]["has_class"] = True
-                        else:
-                            if subject not in groups[key]["names"]:
-                                groups[key]["names"].append(subject)
-
-                    # Rendu groupé: un label par ligne, sujets listés avec virgules et retour à la ligne si long
-                    for (label, idx) in order:
-                        y_line = pdf.get_y()
-                        names = groups[(label, idx)]["names"]
-                        has_class = groups[(label, idx)]["has_class"]
-                        subject_text_parts = []
-                        if has_class:
-                            subject_text_parts.append("Classe")
-                        if names:
-                            subject_text_parts.append(", ".join(names))
-                        subject_text = ", ".join(subject_text_parts) if subject_text_parts else "Classe"
-
-                        pdf.set_font(base_font, "", 11)
-                        label_h = pdf.calculate_multicell_height(label, text_w, 6)
-                        pdf.set_font(base_font, "", 10)
-                        subj_h = pdf.calculate_multicell_height(subject_text, text_w, 5)
-                        row_h = max(label_h + subj_h + 3, scale_box_h + 6)
-
-                        # Fond de ligne aligné avec le cadre
-                        pdf.set_fill_color(255, 255, 255)
-                        pdf.rounded_rect(frame_x, y_line, frame_w, row_h, r=1.5, style='F')
-
-                        # Libellé
-                        pdf.set_font(base_font, "", 11)
-                        pdf.set_xy(frame_x + 2, y_line + 1)
-                        pdf.multi_cell(text_w, 6, label, align='L')
-
-                        # Sujet(s) sous le libellé, avec retour à la ligne si nécessaire
-                        pdf.set_text_color(90, 90, 90)
-                        pdf.set_font(base_font, "", 10)
-                        pdf.set_xy(frame_x + 2, y_line + 1 + label_h)
-                        pdf.multi_cell(text_w, 5, subject_text, align='L')
-                        pdf.set_text_color(0, 0, 0)
-                        pdf.set_font(base_font, "", 11)
-
-                        # Échelle à droite
-                        pdf.draw_likert_scale(idx, x=frame_x + text_w + 6, y=y_line + 2, box_w=scale_box_w, box_h=scale_box_h, gap=scale_gap)
-
-                        # Avancer sous le bloc
-                        pdf.set_y(y_line + row_h)
-                if obs.get("Commentaire"):
-                    # Séparer commentaire classe vs individus (si le texte contient des préfixes)
-                    comment_lines = [l.strip() for l in str(obs['Commentaire']).replace("\r", "\n").split("\n") if l.strip()]
-                    student_names = []
-                    for it in obs.get("Observables", []):
-                        if ":" in it:
-                            nm = it.split(":", 1)[0].strip()
-                            if nm and nm not in student_names:
-                                student_names.append(nm)
-                    class_comments = []
-                    student_comments = {}
-                    for l in comment_lines:
-                        # ignorer des lignes de type "Nom: ... - ..." (valeurs Likert)
-                        if (":" in l and " - " in l):
-                            continue
-                        lower = l.lower()
-                        if lower.startswith("classe:"):
-                            class_comments.append(l.split(":", 1)[1].strip())
-                            continue
-                        matched = False
-                        for nm in student_names:
-                            if l.startswith(nm + ":"):
-                                student_comments.setdefault(nm, []).append(l.split(":", 1)[1].strip())
-                                matched = True
-                                break
-                        if not matched:
-                            class_comments.append(l)
-                    if class_comments:
-                        # Faire la ligne vide avec ln() puis conserver le même x
-                        pdf.ln(1)
-                        pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Commentaire: ")
-                        pdf.set_font(base_font, "", 11); pdf.write(6, " ".join(class_comments) + "\n")
-                        if student_comments:
-                            pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Commentaire (élèves):\n")
-                            pdf.set_font(base_font, "", 11)
-                            for nm, notes in student_comments.items():
-                                pdf.set_x(frame_x + 4); pdf.write(6, f"- {nm}: {' '.join(notes)}\n")
-                    if obs.get("Compétence_mise_en_avant") or obs.get("Processus_mis_en_avant"):
-                        pdf.ln(1)
-                        pdf.set_x(frame_x + 2); pdf.set_font(base_font, "B", 11); pdf.write(6, "Compétences transversales et processus cognitifs mis en avant\n")
-                        pdf.set_font(base_font, "", 11)
-                        if obs.get("Compétence_mise_en_avant"):
-                            pdf.set_x(frame_x + 4); pdf.write(6, f"- Compétence transversale: {obs['Compétence_mise_en_avant']}\n")
-                        if obs.get("Processus_mis_en_avant"):
-                            pdf.set_x(frame_x + 4); pdf.write(6, f"- Processus cognitif: {obs['Processus_mis_en_avant']}\n")
-
-                # Encadrement arrondi autour du bloc
-                y_after = pdf.get_y()
-                box_h = y_after - y_box
-                pdf.set_draw_color(0, 0, 0)
-                # Bordure plus épaisse et parfaitement alignée avec le titre
-                pdf.set_line_width(0.6)
-                pdf.rounded_rect(frame_x, y_box, frame_w, box_h, r=3, style='D')
-                pdf.set_line_width(0.2)
-                pdf.ln(6)
-                obs_on_page += 1
-
-            pdf_output = bytes(pdf.output(dest='S'))
-            pdf_buffer.write(pdf_output)
-            pdf_buffer.seek(0)
-
-            st.download_button(
-                label="Télécharger une fiche d'observation",
-                data=pdf_buffer,
-                file_name=f"fichet_{date_filename}.pdf",
-                mime="application/pdf"
-            )
+            # Fiche PDF mise en page en arrière-plan à la demande, puis réutilisée
+            # tant que les observations ne changent pas
+            with profile_phase("PDF"):
+                # Copie profonde: la clé et le rendu en arrière-plan ne doivent pas
+                # voir une observation modifiée sur place après coup
+                fiche_observations = copy.deepcopy(st.session_state.observations)
+                fiche_key = pdf_cache_key("fiche", (st.session_state.teacher or {}).get("id"), fiche_observations)
+                fiche_download = functools.partial(
+                    pdf_download,
+                    fiche_key,
+                    label="Télécharger une fiche d'observation",
+                    file_name=f"fichet_{datetime.now().strftime('%Y-%m-%d_%H-%M')}.pdf",
+                    key_widget="fiche_pdf_download",
+                )
+                # Un seul emplacement: bouton de préparation, puis avancement, puis téléchargement
+                fiche_slot = st.empty()
+                with fiche_slot.container():
+                    # Une erreur de rendu reste affichée au-dessus du bouton qui relance
+                    prepare = not fiche_download() and st.button("Préparer la fiche d'observation", key="fiche_pdf_prepare")
+                if prepare:
+                    get_pdf_renderer().submit(
+                        fiche_key, functools.partial(build_observation_sheet, fiche_observations), "Fiche d'observation"
+                    )
+                    with fiche_slot.container():
+                        fiche_download()
         else:
             st.info("Aucune observation validée pour l'instant.")
 
@@ -2409,4 +4718,6 @@ with center_col:
             logo_path = Path(__file__).parent / "images" / "logo_geneve.jpg"
             st.image(str(logo_path), width=64)
         with text_col:
-            st.markdown("<br/>**Direction générale de l'enseignement obligatoire**<br/>Service enseignement et évaluation", unsafe_allow_html=True)
\ No newline at end of file
+            st.markdown("<br/>**Direction générale de l'enseignement obligatoire**<br/>Service enseignement et évaluation", unsafe_allow_html=True)
+
+finish_rerun_profile()
@@ -0,0 +1,27 @@
+"""Coût de parse_observable_result par chaîne, sans et avec la mémoïsation.
+
+    python benchmarks/bench_parse_observable_result.py [observations]
+"""
+import sys
+import time
+
+from common import load_app, make_observations
+
+
+def main(n: int) -> None:
+    app = load_app()
+    students = [f"Élève {i:02d}" for i in range(1, 31)]
+    items = [item for obs in make_observations(app, n, students) for item in obs["Observables"]]
+    distinct = len(set(items))
+    parse = app.parse_observable_result
+    for label, fn in (("sans cache", parse.__wrapped__), ("mémoïsé", parse)):
+        parse.cache_clear()
+        t0 = time.perf_counter()
+        for raw in items:
+            fn(raw)
+        elapsed = time.perf_counter() - t0
+        print(f"{label:>10}: {len(items)} chaînes ({distinct} distinctes)  {elapsed * 1e6 / len(items):6.2f} µs/chaîne")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
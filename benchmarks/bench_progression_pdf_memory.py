@@ -0,0 +1,66 @@
+"""Mémoire de pointe (tracemalloc) de l'export PDF de progression, pour une classe puis une école sur une année.
+
+    python benchmarks/bench_progression_pdf_memory.py [élèves] [observations]
+
+Par défaut 30 élèves et 900 observations (5 par jour de classe), trajectoires incluses,
+puis quatre fois plus d'élèves pour le même nombre d'observations: le document grandit,
+pas les données de chaque élève. SpooledPDF écrit les pages terminées sur disque: le pic,
+dominé par la police TTF chargée (environ 10 Mio), ne doit pas grandir avec le document.
+Restent les petits objets que fpdf tient par page (ressources, liens, objets de write()),
+environ 3 Kio par page, d'où la marge PEAK_TOLERANCE: ×1.05 mesuré ici, contre ×1.13
+quand toutes les pages restent en mémoire jusqu'à FPDF.output().
+"""
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+from pathlib import Path
+
+from common import load_app, make_class, make_observations, spread_over_year
+
+SCALE = 4
+PEAK_TOLERANCE = 1.08
+
+
+def measure(app, n_students: int, n_observations: int, tmp: str) -> int:
+    start, end = date(2025, 8, 25), date(2026, 8, 24)
+    teacher_id, students = make_class(app, n_students, email=f"bench-{n_students}@example.org")
+    ok, err, _, _ = app.save_observations_bulk(make_observations(app, n_observations, students), teacher_id)
+    if not ok:
+        raise SystemExit(err)
+    spread_over_year(app, teacher_id, start)
+    summary = app.get_progression(teacher_id, start, end).summary
+    progression = dict(tuple(summary.groupby("eleve", sort=False)))
+    roster = {s["name"]: s["id"] for s in app.list_students_db(teacher_id)}
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    path = app.build_progression_report(
+        Path(tmp) / f"progression-{n_students}.pdf", progression, (start, end), False, "Bench",
+        lambda eleve: app.get_trajectories(teacher_id, start, end, student_id=roster[eleve]),
+    )
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{n_students} élèves, {n_observations} observations: PDF de {path.stat().st_size / 1024:.0f} Kio "
+        f"en {elapsed:.2f} s, pic mémoire {peak / 1024 / 1024:.1f} Mio"
+    )
+    return peak
+
+
+def main(n_students: int, n_observations: int) -> None:
+    app = load_app()
+    with tempfile.TemporaryDirectory() as tmp:
+        # Première passe hors mesure: polices, images et caches de processus déjà chargés, comme en production
+        app.build_progression_report(Path(tmp) / "chauffe.pdf", {}, (date(2025, 8, 25), date(2026, 8, 24)), False)
+        small = measure(app, n_students, n_observations, tmp)
+        large = measure(app, n_students * SCALE, n_observations, tmp)
+    assert large <= small * PEAK_TOLERANCE, (
+        f"pic mémoire ×{large / small:.2f} pour un document {SCALE} fois plus grand (tolérance ×{PEAK_TOLERANCE})"
+    )
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + [30, 900][len(args):]))
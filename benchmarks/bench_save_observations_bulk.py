@@ -0,0 +1,25 @@
+"""Débit de save_observations_bulk (observations par seconde) pour 10, 1k et 100k observations.
+
+    python benchmarks/bench_save_observations_bulk.py [tailles...]
+"""
+import sys
+import time
+
+from common import load_app, make_class, make_observations
+
+
+def main(sizes: list[int]) -> None:
+    app = load_app()
+    for n in sizes:
+        teacher_id, students = make_class(app, email=f"bulk-{n}@example.org")
+        observations = make_observations(app, n, students, seed=n)
+        t0 = time.perf_counter()
+        ok, err, ids, _ = app.save_observations_bulk(observations, teacher_id)
+        elapsed = time.perf_counter() - t0
+        if not ok or len(ids) != n:
+            raise SystemExit(err or "ids manquants")
+        print(f"{n:>7} observations  {elapsed * 1000:9.1f} ms  {n / elapsed:10.0f} obs/s")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10, 1_000, 100_000])
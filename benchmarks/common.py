@@ -0,0 +1,82 @@
+"""Chargement de app.py sur une base temporaire et jeux de données de classe."""
+import logging
+import os
+import random
+import sys
+import tempfile
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def load_app(db_dir: str | None = None):
+    """Importe app.py (mode « bare » de Streamlit) sur une base vide, jamais sur app_data.db."""
+    db_dir = db_dir or tempfile.mkdtemp(prefix="bench-")
+    os.environ["APP_DB_PATH"] = str(Path(db_dir) / "bench.db")
+    sys.path.insert(0, str(ROOT))
+    # L'interface s'exécute elle aussi à l'import: ses avertissements du mode bare sont sans intérêt
+    logging.disable(logging.WARNING)
+    try:
+        import app
+    finally:
+        logging.disable(logging.NOTSET)
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+    return app
+
+
+def referentiel_rows(app) -> list[tuple[str, str, str, list[str]]]:
+    rows = []
+    for dom, dom_data in app.bootstrap()["domaines"].items():
+        for comp, comp_data in dom_data["composantes"].items():
+            for appr, appr_data in comp_data.items():
+                rows.append((dom, comp, appr, appr_data.get("Observables") or []))
+    return rows
+
+
+def make_class(app, n_students: int = 30, email: str = "bench@example.org") -> tuple[int, list[str]]:
+    ok, err, teacher = app.create_teacher("Bench", email, "bench")
+    if not ok:
+        raise RuntimeError(err)
+    names = [f"Élève {i:02d}" for i in range(1, n_students + 1)]
+    app.add_students_db(teacher["id"], names)
+    return teacher["id"], names
+
+
+def make_observations(app, n: int, students: list[str], seed: int = 0) -> list[dict]:
+    """n observations d'un apprentissage chacune: un résultat de classe et deux résultats individuels."""
+    rng = random.Random(seed)
+    rows = referentiel_rows(app)
+    observations = []
+    for i in range(n):
+        dom, comp, appr, observables = rng.choice(rows)
+        items = [app.format_observable_result(rng.choice(app.NIVEAUX), observables[0], excluded=rng.sample(students, 1))]
+        for eleve in rng.sample(students, 2):
+            items.append(app.format_observable_result(rng.choice(app.NIVEAUX), rng.choice(observables), eleve))
+        observations.append({
+            "Domaine": dom,
+            "Composante": comp,
+            "Apprentissage": appr,
+            "Mode": "Selon sélection (classe/élèves)",
+            "Observables": items,
+            "Commentaire": f"Observation {i} de la semaine",
+        })
+    return observations
+
+
+
+def spread_over_year(app, teacher_id: int, start: date, days: int = 365) -> None:
+    """Répartit les observations de l'enseignant sur l'année (created_at), puis reconstruit les tables dérivées."""
+    def _tx(cur):
+        cur.execute("SELECT id FROM observations WHERE teacher_id = ? ORDER BY id", (teacher_id,))
+        ids = [r[0] for r in cur.fetchall()]
+        first = datetime.combine(start, datetime.min.time()) + timedelta(hours=9)
+        cur.executemany(
+            "UPDATE observations SET created_at = ? WHERE id = ?",
+            [((first + timedelta(days=days * k / len(ids))).strftime("%Y-%m-%d %H:%M:%S"), oid)
+             for k, oid in enumerate(ids)],
+        )
+    app.run_write(_tx)
+    ok, err, _ = app.rebuild_progression_summary()
+    if not ok:
+        raise RuntimeError(err)
@@ -0,0 +1,24 @@
+import logging
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# app.py s'exécute à l'import (mode « bare » de Streamlit): jamais sur app_data.db
+os.environ["APP_DB_PATH"] = str(Path(tempfile.mkdtemp(prefix="app-tests-")) / "test.db")
+sys.path.insert(0, str(ROOT))
+
+
+@pytest.fixture(scope="session")
+def app():
+    logging.disable(logging.WARNING)
+    try:
+        import app as module
+    finally:
+        logging.disable(logging.NOTSET)
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").setLevel(logging.ERROR)
+    return module
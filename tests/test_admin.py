@@ -0,0 +1,5 @@
+def test_admin_requires_listed_email(app, monkeypatch):
+    monkeypatch.setattr(app, "ADMIN_EMAILS", frozenset({"direction@example.org"}))
+    assert app.is_admin({"email": "Direction@example.org"})
+    assert not app.is_admin({"email": "enseignant@example.org"})
+    assert not app.is_admin(None)
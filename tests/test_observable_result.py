@@ -0,0 +1,69 @@
+import random
+
+import pytest
+
+# Caractères piégeux pour le format "Sujet: niveau - observable"
+_NAME_CHARS = "abcdeéèçÀ -:'’.🌱"
+_SEED_COUNT = 500
+
+
+def _random_name(rng: random.Random, app) -> str:
+    while True:
+        name = "".join(rng.choice(_NAME_CHARS) for _ in range(rng.randint(1, 12))).strip()
+        if name and app.student_name_error(name) is None:
+            return name
+
+
+@pytest.fixture(scope="module")
+def observables(app):
+    found = []
+    for dom in app.bootstrap()["domaines"].values():
+        for comp in dom["composantes"].values():
+            for appr in comp.values():
+                found.extend(appr.get("Observables") or [])
+    return sorted(set(found))
+
+
+@pytest.mark.parametrize("seed", range(_SEED_COUNT))
+def test_round_trip(app, observables, seed):
+    rng = random.Random(seed)
+    value = rng.choice([*app.NIVEAUX, ""])
+    observable = rng.choice(observables)
+    kind = rng.choice(["classe", "sauf", "eleve"])
+    if kind == "eleve":
+        student = _random_name(rng, app)
+        raw = app.format_observable_result(value, observable, student)
+        expected = ("eleve", (student,), ())
+    else:
+        excluded = tuple(_random_name(rng, app) for _ in range(rng.randint(1, 3))) if kind == "sauf" else ()
+        raw = app.format_observable_result(value, observable, excluded=excluded)
+        expected = ("classe", (), excluded)
+    res = app.parse_observable_result(raw)
+    assert (res.kind, res.students, res.excluded) == expected
+    assert res.observable == observable
+    assert res.value == value
+    assert res.level == (app.NIVEAUX.index(value) if value else None)
+
+
+@pytest.mark.parametrize("name", ["Marie - Claire", "Jean-Luc", "Dupont: Léo", "A - B - C"])
+def test_student_names_with_separators(app, name):
+    raw = app.format_observable_result(app.NIVEAUX[1], "Ne tombe pas", name)
+    res = app.parse_observable_result(raw)
+    assert (res.kind, res.students, res.level, res.observable) == ("eleve", (name,), 1, "Ne tombe pas")
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("Ne tombe pas", ("", (), (), None, "Ne tombe pas")),
+    ("🌸 Épanoui(e) - Ne tombe pas", ("", (), (), 2, "Ne tombe pas")),
+    ("Classe 🌰 Encore en train de germer - Ne tombe pas", ("classe", (), (), 0, "Ne tombe pas")),
+    ("classe (sauf Léa, Tom): En train de grandir - Ne tombe pas", ("classe", (), ("Léa", "Tom"), 1, "Ne tombe pas")),
+])
+def test_legacy_formats(app, raw, expected):
+    assert tuple(app.parse_observable_result(raw))[:5] == expected
+
+
+@pytest.mark.parametrize("name", ["Dupont, Léo", "Léo (grand)", "Classe", "classe (sauf Léo)"])
+def test_ambiguous_student_names_are_rejected(app, name):
+    assert app.student_name_error(name)
+    ok, err = app.add_student_db(1, name)
+    assert not ok and err
@@ -0,0 +1,44 @@
+import random
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+
+def _rgb(path, n_colors, size=(60, 40)):
+    rng = random.Random(n_colors)
+    palette = [tuple(rng.randrange(256) for _ in range(3)) for _ in range(n_colors)]
+    img = Image.new("RGB", size)
+    img.putdata([rng.choice(palette) for _ in range(size[0] * size[1])])
+    img.save(path)
+    return img
+
+
+def _decode(data):
+    with Image.open(BytesIO(data)) as img:
+        return img.mode, np.asarray(img.convert("RGB"))
+
+
+def test_flat_image_gets_exact_palette(app, tmp_path):
+    original = _rgb(tmp_path / "aplats.png", 200)
+    mode, pixels = _decode(app.PdfImageAssets._prepare(tmp_path / "aplats.png", max_width=1000))
+    assert mode == "P"
+    assert np.array_equal(pixels, np.asarray(original))
+
+
+def test_antialiased_image_is_not_quantized(app, tmp_path):
+    original = _rgb(tmp_path / "degrade.png", 1000)
+    mode, pixels = _decode(app.PdfImageAssets._prepare(tmp_path / "degrade.png", max_width=1000))
+    assert mode == "RGB"
+    assert np.array_equal(pixels, np.asarray(original))
+
+
+def test_prepared_images_render_through_public_api(app):
+    assets = app.PdfImageAssets(app.Path(app.__file__).parent / "images")
+    pdf = app.FPDF()
+    pdf.add_page()
+    for role in app.PDF_IMAGES:
+        source = assets.source(role)
+        if source is not None:
+            pdf.image(source, w=10)
+    assert bytes(pdf.output()).startswith(b"%PDF")
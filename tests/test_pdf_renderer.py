@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+
+@pytest.fixture
+def renderer(app):
+    return app.PdfRenderer(app.PdfCache(max_entries=1), max_workers=1)
+
+
+def _wait(job):
+    deadline = time.monotonic() + 5
+    while not job.done and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.done
+
+
+def _fail(progress):
+    raise RuntimeError("police introuvable")
+
+
+def test_failed_job_is_discarded_then_resubmitted(renderer):
+    job = renderer.submit("k", _fail, "Test")
+    _wait(job)
+    data, failed = renderer.status("k")
+    assert data is None and isinstance(failed.error, RuntimeError)
+    renderer.discard_failed("k")
+    assert renderer.status("k") == (None, None)
+    job = renderer.submit("k", lambda progress: b"%PDF", "Test")
+    _wait(job)
+    assert renderer.status("k") == (b"%PDF", None)
+
+
+def test_evicted_document_can_be_rendered_again(renderer):
+    for key in ("a", "b"):
+        _wait(renderer.submit(key, lambda progress, key=key: key.encode(), "Test"))
+    assert renderer.status("a") == (None, None)
+    _wait(renderer.submit("a", lambda progress: b"a", "Test"))
+    assert renderer.status("a") == (b"a", None)
+
+
+def _spooled(cache, key, content=b"%PDF"):
+    path = cache.spool_path(key)
+    path.write_bytes(content)
+    return path
+
+
+def test_evicted_file_stays_readable_until_retired(app):
+    cache = app.PdfCache(max_entries=1, retired_ttl_s=3600)
+    first = _spooled(cache, "a")
+    cache.put("a", first)
+    cache.put("b", _spooled(cache, "b"))
+    assert "a" not in cache
+    assert first.read_bytes() == b"%PDF"
+    cache.retired_ttl_s = 0
+    cache.put("c", _spooled(cache, "c"))
+    assert not first.exists()
+
+
+def test_rendering_again_never_overwrites_a_retired_file(app):
+    cache = app.PdfCache(max_entries=1, retired_ttl_s=0)
+    assert cache.spool_path("a") != cache.spool_path("a")
+    old = _spooled(cache, "a", b"ancien")
+    cache.put("a", old)
+    new = _spooled(cache, "a", b"nouveau")
+    cache.put("a", new)
+    cache.put("b", _spooled(cache, "b"))
+    assert not old.exists() and not new.exists()
+
+
+def test_deleted_file_is_rendered_again_on_click(app, monkeypatch):
+    cache = app.PdfCache()
+    monkeypatch.setattr(app, "get_pdf_cache", lambda: cache)
+    gone = cache.spool_path("a")
+
+    def build(progress):
+        path = cache.spool_path("a")
+        path.write_bytes(b"%PDF rendu")
+        return path
+
+    assert app._read_pdf("a", gone, build) == b"%PDF rendu"
+    assert isinstance(cache.get("a"), app.Path)
+    with pytest.raises(FileNotFoundError):
+        app._read_pdf("a", gone, None)
+
+
+def test_spool_path_is_reserved_when_rendering(app, monkeypatch):
+    cache = app.PdfCache()
+    monkeypatch.setattr(app, "get_pdf_cache", lambda: cache)
+    build = app.functools.partial(app.spool_pdf, "a", lambda path, progress: path)
+    assert cache._spooled == 0
+    assert build(None) != build(None)
+    assert cache._spooled == 2
@@ -0,0 +1,36 @@
+import sqlite3
+
+
+def _summary(app, teacher_id):
+    with sqlite3.connect(app.DB_PATH) as conn:
+        return conn.execute(
+            """
+            SELECT p.* FROM progression_summary p JOIN students s ON s.id = p.student_id
+            WHERE s.teacher_id = ? ORDER BY p.student_id, p.observable
+            """,
+            (teacher_id,),
+        ).fetchall()
+
+
+def test_rebuild_matches_incremental_summary(app):
+    ok, err, teacher = app.create_teacher("Test", "summary@example.org", "x")
+    assert ok, err
+    app.add_students_db(teacher["id"], ["Léa", "Tom", "Zoé"])
+    items = [
+        app.format_observable_result(app.NIVEAUX[0], "Ne tombe pas", excluded=["Zoé"]),
+        app.format_observable_result(app.NIVEAUX[2], "Ne tombe pas", "Zoé"),
+        app.format_observable_result(app.NIVEAUX[1], "Contrôle sa vitesse", "Tom"),
+    ]
+    ok, err, ids, _ = app.save_observations_bulk(
+        [{"Apprentissage": "Équilibre", "Observables": items[:2]}, {"Apprentissage": "Course", "Observables": items[2:]}],
+        teacher["id"],
+    )
+    assert ok, err
+    ok, err = app.update_observation_db(ids[0], {"Apprentissage": "Équilibre", "Observables": items[:1]}, teacher["id"])
+    assert ok, err
+    incremental = _summary(app, teacher["id"])
+    assert incremental
+    ok, err, rows = app.rebuild_progression_summary()
+    assert ok, err
+    assert rows >= len(incremental)
+    assert _summary(app, teacher["id"]) == incremental
@@ -0,0 +1,49 @@
+import itertools
+
+import pytest
+
+_emails = itertools.count()
+
+
+@pytest.fixture
+def teacher(app):
+    def _make(students=("Léa", "Tom")):
+        ok, err, teacher = app.create_teacher("Test", f"search-{next(_emails)}@example.org", "x")
+        assert ok, err
+        app.add_students_db(teacher["id"], list(students))
+        return teacher["id"]
+    return _make
+
+
+def _save(app, teacher_id, commentaire, observables=()):
+    ok, err, ids, _ = app.save_observations_bulk(
+        [{"Apprentissage": "Lecture", "Commentaire": commentaire, "Observables": list(observables)}], teacher_id
+    )
+    assert ok, err
+    return ids[0]
+
+
+def test_search_only_returns_own_observations(app, teacher):
+    mine, other = teacher(), teacher()
+    own = _save(app, mine, "Léa reconnaît les syllabes")
+    _save(app, other, "Léa reconnaît les syllabes")
+    assert [r["db_id"] for r in app.search_observations(mine, "syllabe")] == [own]
+
+
+def test_search_snippet_highlights_matching_column(app, teacher):
+    mine = teacher()
+    _save(app, mine, "Travail en atelier", [app.format_observable_result(app.NIVEAUX[2], "Lit des syllabes", "Tom")])
+    [result] = app.search_observations(mine, "syllabes")
+    assert "**syllabes**" in result["snippet"]
+
+
+def test_search_ignores_accents_and_follows_updates(app, teacher):
+    mine = teacher()
+    oid = _save(app, mine, "Écoute attentive")
+    assert [r["db_id"] for r in app.search_observations(mine, "ecoute")] == [oid]
+    ok, err = app.update_observation_db(oid, {"Apprentissage": "Lecture", "Commentaire": "Dessin libre"}, mine)
+    assert ok, err
+    assert app.search_observations(mine, "ecoute") == []
+    ok, err = app.delete_observation_db(oid, mine)
+    assert ok, err
+    assert app.search_observations(mine, "dessin") == []
@@ -0,0 +1,44 @@
+"""SpooledPDF doit écrire exactement le document que FPDF.output() aurait produit."""
+from datetime import datetime, timezone
+
+import pytest
+
+# L'en-tête de CustomPDF utilise encore Arial (police de base) et ln=: fpdf2 le signale à chaque page
+pytestmark = pytest.mark.filterwarnings("ignore::DeprecationWarning")
+
+
+def _document(app, cls, pages):
+    pdf = cls(teacher_name="Test")
+    pdf.creation_date = datetime(2026, 1, 5, 8, 30, tzinfo=timezone.utc)
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.set_margins(15, 15, 15)
+    pdf.alias_nb_pages()
+    font = app.add_unicode_font(pdf)
+    pdf.add_page()
+    pdf.ln(5)
+    for i in range(pages * 40):
+        pdf.set_font(font, "B" if i % 7 == 0 else "", 9)
+        pdf.multi_cell(0, 5, f"- Observable {i} : Commence à éclore, puis Épanouie ({i % 5} observations)", 0, "L")
+        pdf.ln(1)
+    return pdf
+
+
+@pytest.mark.parametrize("pages", [1, 5])
+def test_spooled_output_is_identical(app, tmp_path, pages):
+    expected = bytes(_document(app, app.CustomPDF, pages).output())
+    spooled = _document(app, app.SpooledPDF, pages)
+    spooled.write(tmp_path / "spooled.pdf")
+    assert spooled.pages_count >= pages
+    assert (tmp_path / "spooled.pdf").read_bytes() == expected
+
+
+def test_failed_write_leaves_no_file(app, tmp_path, monkeypatch):
+    pdf = _document(app, app.SpooledPDF, 2)
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("disque plein")
+
+    monkeypatch.setattr(app.SpooledOutputProducer, "_add_pages", fail)
+    with pytest.raises(RuntimeError):
+        pdf.write(tmp_path / "incomplet.pdf")
+    assert not (tmp_path / "incomplet.pdf").exists()
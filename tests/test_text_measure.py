@@ -0,0 +1,63 @@
+"""TextMeasure.line_count doit donner exactement le nombre de lignes de multi_cell."""
+import glob
+import os
+import random
+
+import pytest
+
+_WORDS = ["a", "le", "élève", "observe", "équilibre", "Ça", "l'écoute", "très", "-", "«", "»", "123", "x" * 40]
+
+
+def _random_text(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randint(0, 40)):
+        parts.append(rng.choice(_WORDS))
+        parts.append(rng.choice([" ", " ", " ", "  ", "\n", ""]))
+    return "".join(parts)
+
+
+def _ttf_font() -> str | None:
+    candidates = [os.environ.get("TEST_TTF_FONT", ""), "C:\\Windows\\Fonts\\arial.ttf"]
+    candidates += sorted(glob.glob("/usr/share/fonts/**/DejaVuSans.ttf", recursive=True))
+    return next((path for path in candidates if path and os.path.exists(path)), None)
+
+
+def _check_agreement(app, pdf, seed_count=300):
+    measure = app.TextMeasure()
+    rng = random.Random(0)
+    for _ in range(seed_count):
+        text = _random_text(rng)
+        width = rng.choice([0, 8, 25, 60, 120, 187.5])
+        expected = max(1, len(pdf.multi_cell(width, text=text, dry_run=True, output="LINES")))
+        assert measure.line_count(pdf, text, width) == expected, (text, width)
+    assert measure.misses, "aucun texte mesuré sans fpdf"
+
+
+@pytest.mark.parametrize("style", ["", "B", "I"])
+@pytest.mark.parametrize("size", [9, 11, 13])
+def test_core_font_matches_multi_cell(app, style, size):
+    pdf = app.FPDF()
+    pdf.add_page()
+    pdf.set_font("Helvetica", style, size)
+    _check_agreement(app, pdf)
+
+
+def test_ttf_font_matches_multi_cell(app):
+    path = _ttf_font()
+    if path is None:
+        pytest.skip("aucune police TTF disponible (TEST_TTF_FONT)")
+    pdf = app.FPDF()
+    pdf.add_page()
+    pdf.add_font("Test", "", path)
+    pdf.set_font("Test", "", 11)
+    _check_agreement(app, pdf)
+
+
+def test_repeated_text_is_memoized(app):
+    pdf = app.FPDF()
+    pdf.add_page()
+    pdf.set_font("Helvetica", "", 11)
+    measure = app.TextMeasure()
+    for _ in range(3):
+        measure.line_count(pdf, "Tient l'équilibre ≥ 3 sec".replace("≥", ">="), 40)
+    assert (measure.misses, measure.hits) == (1, 2)
@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def writer(app, tmp_path):
+    return app.DatabaseWriter(app.ConnectionPool(tmp_path / "writer.db", max_idle=1))
+
+
+def _blocking_job(started: threading.Event, release: threading.Event):
+    def _tx(cur):
+        started.set()
+        release.wait(5)
+        return "bloquant"
+    return _tx
+
+
+def test_cancelled_job_is_never_run(writer):
+    started, release = threading.Event(), threading.Event()
+    first = writer.submit(_blocking_job(started, release))
+    assert started.wait(5)
+    ran = []
+    queued = writer.submit(lambda cur: ran.append(True))
+    assert queued.cancel()
+    release.set()
+    assert first.result(5) == "bloquant"
+    assert writer.submit(lambda cur: "suivant").result(5) == "suivant"
+    assert ran == []
+
+
+def test_run_write_cancels_queued_write_on_timeout(app, writer, monkeypatch):
+    monkeypatch.setattr(app, "get_writer", lambda: writer)
+    monkeypatch.setattr(app, "WRITE_TIMEOUT_S", 0.05)
+    started, release = threading.Event(), threading.Event()
+    blocking = writer.submit(_blocking_job(started, release))
+    assert started.wait(5)
+    ran = []
+    with pytest.raises(TimeoutError):
+        app.run_write(lambda cur: ran.append(True))
+    release.set()
+    blocking.result(5)
+    assert writer.submit(lambda cur: "suivant").result(5) == "suivant"
+    assert ran == []
+
+
+def test_run_write_waits_for_accepted_write(app, writer, monkeypatch):
+    monkeypatch.setattr(app, "get_writer", lambda: writer)
+    monkeypatch.setattr(app, "WRITE_TIMEOUT_S", 0.05)
+    started, release = threading.Event(), threading.Event()
+    threading.Timer(0.2, release.set).start()
+    assert app.run_write(_blocking_job(started, release)) == "bloquant"